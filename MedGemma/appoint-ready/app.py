@@ -12,17 +12,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from evaluation import evaluate_report, evaluation_prompt
+from evaluation import EVALUATION_BATCH_MAX_ITEMS, evaluate_report, evaluate_reports, evaluation_prompt
 from flask import Flask, send_from_directory, request, jsonify, Response, stream_with_context, send_file
 from flask_cors import CORS
-import os, time, json, re
+import io, os, time, json
 from gemini import gemini_get_text_response
-from interview_simulator import stream_interview
-from cache import create_cache_zip
-from medgemma import medgemma_get_text_response
+from interview_simulator import pending_ehr_summaries, start_ehr_warmup
+from interview_sessions import SessionRequestError, session_for_request, session_stats, sse_event
+from cache import cache_stats, stream_cache_archive
+from medgemma import medgemma_credential_manager, medgemma_get_text_response
+from audio_store import load_audio
+from telemetry import metrics_text
 
 app = Flask(__name__, static_folder=os.environ.get("FRONTEND_BUILD", "frontend/build"), static_url_path="/")
 CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}})
+# Not when an audio encoder worker imports this script as its __mp_main__ (python app.py)
+if __name__ != "__mp_main__":
+    start_ehr_warmup()
 
 @app.route("/")
 def serve():
@@ -30,22 +36,48 @@ def serve():
     return send_from_directory(app.static_folder, "index.html")
 
 
+@app.route("/api/ready")
+def ready():
+    """Readiness gate: 200 once every patient's EHR summary is available, 503 before."""
+    pending = pending_ehr_summaries()
+    if pending:
+        return jsonify({"ready": False, "pending": pending}), 503
+    return jsonify({"ready": True})
+
+
 @app.route("/api/stream_conversation", methods=["GET"])
 def stream_conversation():
-    """Streams the conversation with the interview simulator."""
-    patient = request.args.get("patient", "Patient")
-    condition = request.args.get("condition", "unknown condition")
-    
+    """
+    Streams the conversation with the interview simulator. The interview runs in a session keyed
+    by the interview_id parameter; a reconnect with Last-Event-ID resumes after that event.
+    """
+    try:
+        session, last_event_id = session_for_request(request.args, request.headers)
+    except SessionRequestError as e:
+        return jsonify({"error": str(e)}), e.status
+    if session.is_complete_for(last_event_id):
+        # 204 tells EventSource to stop reconnecting
+        return Response(status=204)
+
     def generate():
-        try:
-            for message in stream_interview(patient, condition):
-                yield f"data: {message}\n\n"
-        except Exception as e:
-            yield f"data: Error: {str(e)}\n\n"
-            raise e
-            
+        yield "retry: 2000\n\n"
+        for event in session.events_after(last_event_id):
+            yield sse_event(event)
+
     return Response(stream_with_context(generate()), mimetype="text/event-stream")
 
+@app.route("/api/audio/<audio_id>")
+def get_audio(audio_id):
+    """Serves synthesized speech by id, with ETag and HTTP range support."""
+    audio = load_audio(audio_id)
+    if audio is None:
+        return jsonify({"error": "Audio not found"}), 404
+    audio_data, mime_type = audio
+    # The id is derived from the TTS input, so the content behind a URL never changes
+    response = send_file(io.BytesIO(audio_data), mimetype=mime_type, conditional=True, etag=audio_id)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
 @app.route("/api/evaluate_report", methods=["POST"])
 def evaluate_report_call():
     """Evaluates the provided medical report."""
@@ -62,15 +94,67 @@ def evaluate_report_call():
     return jsonify({"evaluation": evaluation_text})
 
 
+@app.route("/api/evaluate_reports", methods=["POST"])
+def evaluate_reports_call():
+    """
+    Evaluates a batch of reports concurrently. Takes {"items": [{"report", "condition", "id"?}, ...]}
+    and streams one NDJSON line per item as it completes, then a summary line.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("items") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items must be a non-empty list"}), 400
+    if len(items) > EVALUATION_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {EVALUATION_BATCH_MAX_ITEMS} items per batch"}), 400
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("report") or not item.get("condition"):
+            return jsonify({"error": f"Item {index} needs a report and a condition"}), 400
+
+    def generate():
+        for result in evaluate_reports(items):
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/api/cache_stats")
+def get_cache_stats():
+    """Returns hit/miss counters and the size of each memo cache namespace."""
+    return jsonify(cache_stats())
+
+
+@app.route("/api/credential_stats")
+def get_credential_stats():
+    """Returns refresh counters and latencies of the MedGemma access token."""
+    return jsonify(medgemma_credential_manager.metrics())
+
+
+@app.route("/api/interview_stats")
+def get_interview_stats():
+    """Returns the number of queued, running and finished interview sessions."""
+    return jsonify(session_stats())
+
+
+@app.route("/metrics")
+def metrics():
+    """Serves stage latency histograms and token counters in the Prometheus text format."""
+    return Response(metrics_text(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/api/download_cache")
 def download_cache_zip():
-    """Creates a zip file of the cache and returns it for download."""
-    zip_filepath, error = create_cache_zip()
-    if error:
-        return jsonify({"error": error}), 500
-    if not os.path.isfile(zip_filepath):
-        return jsonify({"error": f"File not found: {zip_filepath}"}), 404
-    return send_file(zip_filepath, as_attachment=True)
+    """Streams a zip archive of the cache. With ?since=<generation>, only entries stored after it."""
+    since = request.args.get("since")
+    if since is not None:
+        try:
+            since = float(since)
+        except ValueError:
+            return jsonify({"error": "since must be a generation from an export manifest"}), 400
+    if not os.path.isdir(os.environ.get("CACHE_DIR", "/cache")):
+        return jsonify({"error": "Cache directory not found on server"}), 500
+    filename = "cache_delta.zip" if since is not None else "cache_archive.zip"
+    return Response(stream_cache_archive(since), mimetype="application/zip",
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
 
 
 @app.route("/<path:path>")
@@ -0,0 +1,78 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# ASGI entry point, used by the Dockerfile:
+#
+#     uvicorn asgi:app --host 0.0.0.0 --port 7860
+#
+# Under gunicorn every open SSE stream holds one of the worker's threads for the whole
+# interview. Here the interview stream is served by an async endpoint, so an idle connection
+# waiting for the next turn costs a coroutine rather than a thread, and one instance holds
+# dozens of streams. All other routes are the Flask app, run on a bounded thread pool.
+#
+# Only the connections are async. The LLM and TTS calls are blocking and stay on threads: each
+# queued or running interview has its session thread (at most INTERVIEW_MAX_CONCURRENCY +
+# INTERVIEW_MAX_QUEUED), and their concurrent calls share the PIPELINE_WORKERS pool. The thread
+# count therefore depends on those limits, not on the number of connected clients. Async LLM and
+# TTS clients would also need async versions of the memo cache with its single-flight locks and
+# of the credential refresh, and are not part of this mode.
+
+import os
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import app as flask_app
+from interview_sessions import SessionRequestError, session_for_request, sse_event
+
+# Threads for the Flask routes (evaluation, audio, cache export, static files)
+WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", "16"))
+DEV_FRONTEND_ORIGIN = "http://localhost:3000"
+
+
+async def stream_conversation(request):
+    """Async version of app.stream_conversation; same parameters, events and status codes."""
+    try:
+        # Starting a session may prune old ones under a lock, so keep it off the event loop
+        session, last_event_id = await run_in_threadpool(session_for_request, request.query_params, request.headers)
+    except SessionRequestError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status)
+    headers = {}
+    if request.headers.get("origin") == DEV_FRONTEND_ORIGIN:
+        headers["Access-Control-Allow-Origin"] = DEV_FRONTEND_ORIGIN
+    if session.is_complete_for(last_event_id):
+        # 204 tells EventSource to stop reconnecting
+        return Response(status_code=204, headers=headers)
+
+    async def generate():
+        yield "retry: 2000\n\n"
+        # Each event is only produced once the previous one is sent, so a slow client holds
+        # back its own stream and nothing else. When the client disconnects, Starlette cancels
+        # this generator, which detaches it from the session.
+        async for event in session.aevents_after(last_event_id):
+            yield sse_event(event)
+
+    headers["Cache-Control"] = "no-cache"
+    # Keeps proxies such as nginx from buffering the stream
+    headers["X-Accel-Buffering"] = "no"
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=headers)
+
+
+app = Starlette(routes=[
+    Route("/api/stream_conversation", stream_conversation, methods=["GET"]),
+    Mount("/", app=WSGIMiddleware(flask_app, workers=WSGI_THREADS)),
+])
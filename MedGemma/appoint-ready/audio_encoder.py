@@ -0,0 +1,162 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# In-process compression of raw PCM speech, replacing one ffmpeg subprocess per utterance.
+# Encoding runs on a small, bounded process pool so CPU-heavy encodes do not hold the GIL
+# of the serving threads. The PCM is handed to the pool through shared memory instead of
+# being pickled through a pipe.
+#
+# Keep this module free of heavy imports: it is preloaded into the encoder pool's forkserver,
+# which the workers are forked from. Each worker also imports the main script once, as
+# __mp_main__, so entry scripts keep their startup work behind a __main__ guard.
+
+import io
+import logging
+import multiprocessing
+import os
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from telemetry import stage_span
+
+# "mp3" (lameenc), "opus" (Ogg/Opus via PyAV) or "wav" (no compression).
+AUDIO_CODEC = os.environ.get("AUDIO_CODEC", "mp3").lower()
+AUDIO_ENCODER_PROCESSES = int(os.environ.get("AUDIO_ENCODER_PROCESSES", str(min(4, os.cpu_count() or 1))))
+MP3_BITRATE_KBPS = int(os.environ.get("MP3_BITRATE_KBPS", "64"))
+OPUS_BITRATE = int(os.environ.get("OPUS_BITRATE", "32000"))
+
+CODEC_MIME_TYPES = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "wav": "audio/wav",
+}
+
+
+class AudioEncodingError(Exception):
+    """Raised when PCM audio cannot be encoded with the selected codec."""
+    pass
+
+
+def pcm_to_wav(pcm: bytes | memoryview, sample_rate: int, bits_per_sample: int = 16) -> bytes:
+    """Prepends a WAV header to mono little-endian PCM."""
+    block_align = bits_per_sample // 8
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + len(pcm), b"WAVE", b"fmt ",
+        16, 1, 1, sample_rate, sample_rate * block_align, block_align,
+        bits_per_sample, b"data", len(pcm)
+    )
+    return header + bytes(pcm)
+
+def _encode_mp3(pcm: memoryview, sample_rate: int) -> bytes:
+    import lameenc
+    encoder = lameenc.Encoder()
+    encoder.set_bit_rate(MP3_BITRATE_KBPS)
+    encoder.set_in_sample_rate(sample_rate)
+    encoder.set_channels(1)
+    encoder.set_quality(5)
+    # lameenc only accepts bytes, so this is the one copy of the PCM inside the worker
+    return bytes(encoder.encode(bytes(pcm))) + bytes(encoder.flush())
+
+def _encode_opus(pcm: memoryview, sample_rate: int) -> bytes:
+    import av
+    import numpy as np
+    output = io.BytesIO()
+    with av.open(output, mode="w", format="ogg") as container:
+        stream = container.add_stream("libopus", rate=sample_rate)
+        stream.bit_rate = OPUS_BITRATE
+        stream.layout = "mono"
+        samples = np.frombuffer(pcm, dtype="<i2").reshape(1, -1)
+        frame = av.AudioFrame.from_ndarray(samples, format="s16", layout="mono")
+        frame.sample_rate = sample_rate
+        for packet in stream.encode(frame):
+            container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return output.getvalue()
+
+def encode_pcm_s16(pcm: bytes | memoryview, sample_rate: int, codec: str = AUDIO_CODEC) -> bytes:
+    """Encodes mono 16-bit little-endian PCM in the current process."""
+    if codec == "mp3":
+        return _encode_mp3(pcm, sample_rate)
+    if codec == "opus":
+        return _encode_opus(pcm, sample_rate)
+    if codec == "wav":
+        return pcm_to_wav(pcm, sample_rate)
+    raise AudioEncodingError(f"Unsupported audio codec: {codec}")
+
+def _encode_shared_pcm(shm_name: str, size: int, sample_rate: int, codec: str) -> bytes:
+    # Runs in a pool worker: read the PCM straight from the parent's shared memory block
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # All views must be released before the block can be closed
+        with shm.buf[:size] as view, view.toreadonly() as pcm:
+            return encode_pcm_s16(pcm, sample_rate, codec)
+    finally:
+        shm.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# Bounds the encodes waiting for the pool, and with them the shared memory in use
+_pool_slots = threading.BoundedSemaphore(max(1, AUDIO_ENCODER_PROCESSES) * 2)
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver avoids forking the multi-threaded server process; it preloads only the
+            # encoder instead of the default __main__
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["audio_encoder"])
+            else:
+                context = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=max(1, AUDIO_ENCODER_PROCESSES), mp_context=context)
+        return _pool
+
+def encode_speech(pcm: bytes, sample_rate: int, codec: str = AUDIO_CODEC) -> tuple[bytes, str]:
+    """
+    Encodes mono 16-bit PCM speech with `codec` on the encoder process pool.
+    Returns a tuple: (encoded_bytes, mime_type). Raises AudioEncodingError on failure.
+    With AUDIO_ENCODER_PROCESSES=0 encoding runs in the calling thread.
+    """
+    with stage_span("audio_encode", codec=codec, pcm_bytes=len(pcm)) as span:
+        encoded, mime_type = _encode_speech(pcm, sample_rate, codec)
+        span.attributes["bytes"] = len(encoded)
+        return encoded, mime_type
+
+def _encode_speech(pcm: bytes, sample_rate: int, codec: str) -> tuple[bytes, str]:
+    if codec not in CODEC_MIME_TYPES:
+        raise AudioEncodingError(f"Unsupported audio codec: {codec}")
+    if codec == "wav" or AUDIO_ENCODER_PROCESSES <= 0:
+        try:
+            return encode_pcm_s16(pcm, sample_rate, codec), CODEC_MIME_TYPES[codec]
+        except Exception as e:
+            raise AudioEncodingError(f"{codec} encoding failed: {e}") from e
+
+    with _pool_slots:
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(pcm)))
+        try:
+            shm.buf[:len(pcm)] = pcm
+            future = _get_pool().submit(_encode_shared_pcm, shm.name, len(pcm), sample_rate, codec)
+            return future.result(), CODEC_MIME_TYPES[codec]
+        except Exception as e:
+            logging.warning("Audio encoding with %s failed: %s", codec, e)
+            raise AudioEncodingError(f"{codec} encoding failed: {e}") from e
+        finally:
+            shm.close()
+            shm.unlink()
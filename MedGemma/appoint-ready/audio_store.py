@@ -0,0 +1,47 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Addresses synthesized speech by a hash of its TTS memo cache key, so messages can carry a
+# short /api/audio/<id> URL instead of the inlined audio. The audio itself stays where the
+# memo cache already keeps it; only a small id -> cache key entry is added.
+
+import hashlib
+import re
+
+from cache import ENOVAL, cache, memo_lookup
+
+AUDIO_URL_PREFIX = "/api/audio/"
+_AUDIO_ID_PATTERN = re.compile(r"[0-9a-f]{40}")
+
+def audio_id_for_key(memo_key) -> str:
+    """Stable id for a memo cache key (a tuple of plain values, so its repr is deterministic)."""
+    return hashlib.sha256(repr(memo_key).encode("utf-8")).hexdigest()[:40]
+
+def register_audio(memo_key) -> str:
+    """Makes the cached audio under `memo_key` available by id and returns its URL path."""
+    audio_id = audio_id_for_key(memo_key)
+    cache.add(("audio-id", audio_id), memo_key)
+    return AUDIO_URL_PREFIX + audio_id
+
+def load_audio(audio_id: str) -> tuple[bytes, str] | None:
+    """Returns (audio_bytes, mime_type) for an id from register_audio, or None if unknown."""
+    if not _AUDIO_ID_PATTERN.fullmatch(audio_id):
+        return None
+    memo_key = cache.get(("audio-id", audio_id))
+    if memo_key is None:
+        return None
+    audio = memo_lookup(memo_key)
+    if audio is ENOVAL or not audio or not audio[0]:
+        return None
+    return audio
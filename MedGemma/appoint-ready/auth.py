@@ -14,6 +14,9 @@
 
 import json
 import datetime
+import logging
+import threading
+import time
 from google.oauth2 import service_account
 import google.auth.transport.requests
 
@@ -76,3 +79,117 @@ def get_access_token_refresh_if_needed(credentials: service_account.Credentials)
   credentials = refresh_credentials(credentials)
   return credentials.token
 
+
+class CredentialManager:
+  """Keeps the access token of a credentials object fresh on a background thread.
+
+  The token is refreshed REFRESH_MARGIN ahead of its expiry, so get_token only reads the
+  current token and never waits on the network, except before the first refresh completes
+  or when every refresh has failed until the token expired. Refreshes are serialized by a lock.
+  """
+
+  # Refresh this long before the token expires
+  REFRESH_MARGIN = datetime.timedelta(minutes=10)
+  # Wait this long before retrying a failed refresh
+  RETRY_INTERVAL_SECONDS = 15
+  # A token this close to its expiry is not handed out anymore
+  MIN_REMAINING = datetime.timedelta(seconds=30)
+
+  def __init__(self, credentials: service_account.Credentials, name: str = "credentials"):
+    self.name = name
+    self._credentials = credentials
+    self._lock = threading.Lock()
+    # (token, expiry) swapped as one tuple, so readers never see a token with the wrong expiry
+    self._current = (None, None)
+    self._thread = None
+    self._stopped = threading.Event()
+    self._metrics = {
+        "refreshes": 0,
+        "failures": 0,
+        "consecutive_failures": 0,
+        "last_refresh_latency_ms": None,
+        "max_refresh_latency_ms": 0.0,
+        "last_error": None,
+        "expires_in_seconds": None,
+    }
+
+  def start(self):
+    """Starts the background refresh thread. The first refresh runs right away."""
+    if self._thread is None:
+      self._thread = threading.Thread(target=self._run, name=f"{self.name}-refresh", daemon=True)
+      self._thread.start()
+    return self
+
+  def stop(self):
+    self._stopped.set()
+
+  def _remaining(self, expiry) -> datetime.timedelta | None:
+    if expiry is None:
+      return None
+    return expiry - datetime.datetime.now(datetime.timezone.utc)
+
+  def _refresh_locked(self):
+    start = time.monotonic()
+    try:
+      self._credentials.refresh(google.auth.transport.requests.Request())
+    except Exception as e:
+      self._metrics["failures"] += 1
+      self._metrics["consecutive_failures"] += 1
+      self._metrics["last_error"] = f"{type(e).__name__}: {e}"
+      logging.error("Token refresh for %s failed (%d in a row): %s",
+                    self.name, self._metrics["consecutive_failures"], e)
+      raise
+    latency_ms = (time.monotonic() - start) * 1000
+    expiry = self._credentials.expiry
+    if expiry is not None:
+      expiry = expiry.replace(tzinfo=datetime.timezone.utc)
+    self._current = (self._credentials.token, expiry)
+    self._metrics["refreshes"] += 1
+    self._metrics["consecutive_failures"] = 0
+    self._metrics["last_refresh_latency_ms"] = round(latency_ms, 1)
+    self._metrics["max_refresh_latency_ms"] = round(max(self._metrics["max_refresh_latency_ms"], latency_ms), 1)
+    logging.info("Refreshed token for %s in %.0f ms, valid until %s", self.name, latency_ms, expiry)
+
+  def refresh(self):
+    """Refreshes the token now. Raises the refresh error on failure."""
+    with self._lock:
+      self._refresh_locked()
+
+  def _run(self):
+    while not self._stopped.is_set():
+      remaining = self._remaining(self._current[1])
+      if self._current[0] is None or (remaining is not None and remaining <= self.REFRESH_MARGIN):
+        try:
+          self.refresh()
+        except Exception:
+          self._stopped.wait(self.RETRY_INTERVAL_SECONDS)
+        continue
+      # Tokens without an expiry are refreshed every REFRESH_MARGIN
+      wait = remaining - self.REFRESH_MARGIN if remaining is not None else self.REFRESH_MARGIN
+      self._stopped.wait(wait.total_seconds())
+
+  def get_token(self) -> str:
+    """Returns a valid access token, refreshing synchronously only if no valid token is held.
+
+    Returns:
+        str: The access token.
+    """
+    token, expiry = self._current
+    remaining = self._remaining(expiry)
+    if token is not None and (remaining is None or remaining > self.MIN_REMAINING):
+      return token
+    with self._lock:
+      # A refresh may have completed while waiting for the lock
+      token, expiry = self._current
+      remaining = self._remaining(expiry)
+      if token is None or (remaining is not None and remaining <= self.MIN_REMAINING):
+        self._refresh_locked()
+      return self._current[0]
+
+  def metrics(self) -> dict:
+    """Refresh counters and latencies, and how long the current token stays valid."""
+    remaining = self._remaining(self._current[1])
+    return {
+        **self._metrics,
+        "expires_in_seconds": round(remaining.total_seconds()) if remaining is not None else None,
+    }
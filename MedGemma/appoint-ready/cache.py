@@ -13,13 +13,33 @@
 # limitations under the License.
 
 from diskcache import Cache
+from diskcache.core import ENOVAL, args_to_key, full_name
+import contextlib
+import functools
+import hashlib
+import inspect
+import json
 import os
+import pickle
+import re
 import shutil
+import sqlite3
 import tempfile
+import threading
+import time
+import uuid
 import zipfile
+import zlib
+from concurrent.futures import Future
 import logging
 
-cache = Cache(os.environ.get("CACHE_DIR", "/cache"))
+from cache_backends import DiskCacheBackend, shared_backend_from_url, tiered_backend
+from telemetry import record_cache_result
+
+CACHE_DIR = os.environ.get("CACHE_DIR", "/cache")
+# Shared entries that are not memoized calls (EHR summaries, audio ids) and memo entries
+# written before the cache was split into namespaces.
+cache = Cache(CACHE_DIR)
 # Print cache statistics after loading
 try:
     item_count = len(cache)
@@ -28,40 +48,409 @@ try:
 except Exception as e:
     print(f"Could not retrieve cache statistics: {e}")
 
-def create_cache_zip():
-    temp_dir = tempfile.gettempdir()
-    base_name = os.path.join(temp_dir, "cache_archive") # A more descriptive name
-    archive_path = base_name + ".zip"
+# Bump to invalidate every namespaced memo entry, e.g. when the key canonicalization changes.
+KEY_VERSION = 1
+# Look up memo misses under their pre-namespace key in the shared cache and move hits to the namespace.
+CACHE_LEGACY_FALLBACK = os.environ.get("CACHE_LEGACY_FALLBACK", "true").lower() == "true"
+# Concurrent misses for the same key wait for a single call: in-process through a shared future,
+# across the workers of an instance through a lock entry in the cache.
+SINGLE_FLIGHT = os.environ.get("SINGLE_FLIGHT", "true").lower() == "true"
+# How long other workers wait for a lock holder before calling themselves (should exceed the slowest call).
+SINGLE_FLIGHT_LOCK_TTL = int(os.environ.get("SINGLE_FLIGHT_LOCK_TTL", "300"))
+_SINGLE_FLIGHT_POLL_SECONDS = 0.1
+
+# Policy per memo namespace. Each one can be overridden with CACHE_<NAMESPACE>_SIZE_LIMIT_MB,
+# CACHE_<NAMESPACE>_EVICTION_POLICY (any diskcache policy, "none" disables eviction) and
+# CACHE_<NAMESPACE>_TTL (seconds, 0 keeps entries until they are evicted).
+NAMESPACE_DEFAULTS = {
+    "gemini": {"size_limit_mb": 256, "eviction_policy": "least-recently-used", "ttl": 0},
+    "medgemma": {"size_limit_mb": 1024, "eviction_policy": "least-recently-used", "ttl": 0},
+    "tts": {"size_limit_mb": 4096, "eviction_policy": "least-recently-used", "ttl": 0},
+}
+_DEFAULT_POLICY = {"size_limit_mb": 512, "eviction_policy": "least-recently-used", "ttl": 0}
+
+# Optional shared tier behind every memo namespace, see cache_backends.shared_backend_from_url.
+CACHE_SHARED_URL = os.environ.get("CACHE_SHARED_URL", "")
+_shared_backend = shared_backend_from_url(CACHE_SHARED_URL)
+
+_namespaces = {}
+_namespace_backends = {}
+_namespace_policies = {}
+_namespace_stats = {}
+_namespaces_lock = threading.Lock()
+
+def namespace_policy(namespace: str) -> dict:
+    """The size limit, eviction policy and TTL of a memo namespace, with environment overrides applied."""
+    defaults = NAMESPACE_DEFAULTS.get(namespace, _DEFAULT_POLICY)
+    prefix = f"CACHE_{namespace.upper()}_"
+    return {
+        "size_limit_mb": int(os.environ.get(prefix + "SIZE_LIMIT_MB", defaults["size_limit_mb"])),
+        "eviction_policy": os.environ.get(prefix + "EVICTION_POLICY", defaults["eviction_policy"]).lower(),
+        "ttl": int(os.environ.get(prefix + "TTL", defaults["ttl"])),
+    }
+
+def get_namespace(namespace: str) -> Cache:
+    """The cache of a memo namespace, stored in its own directory under CACHE_DIR/ns."""
+    with _namespaces_lock:
+        namespace_cache = _namespaces.get(namespace)
+        if namespace_cache is None:
+            policy = namespace_policy(namespace)
+            namespace_cache = Cache(
+                os.path.join(CACHE_DIR, "ns", namespace),
+                size_limit=policy["size_limit_mb"] * 1024 * 1024,
+                eviction_policy=policy["eviction_policy"],
+            )
+            local = DiskCacheBackend(namespace_cache)
+            _namespaces[namespace] = namespace_cache
+            _namespace_backends[namespace] = local if _shared_backend is None \
+                else tiered_backend(local, _shared_backend, local_expire=policy["ttl"] or None)
+            _namespace_policies[namespace] = policy
+            _namespace_stats[namespace] = {"hits": 0, "legacy_hits": 0, "misses": 0, "stores": 0, "bytes_stored": 0,
+                                           "coalesced": 0, "lock_waits": 0}
+        return namespace_cache
+
+def get_backend(namespace: str):
+    """The store of a memo namespace: its local cache, tiered in front of the shared one if configured."""
+    get_namespace(namespace)
+    return _namespace_backends[namespace]
+
+def _count(namespace: str, counter: str, amount: int = 1):
+    with _namespaces_lock:
+        _namespace_stats[namespace][counter] += amount
+
+_WHITESPACE_RUN = re.compile(r"[ \t]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+def normalize_text(text: str) -> str:
+    """Whitespace-insensitive form of a prompt: indentation, runs of spaces and extra blank lines are dropped."""
+    lines = (_WHITESPACE_RUN.sub(" ", line).strip() for line in text.splitlines())
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+def _canonical(value):
+    # JSON-serializable form of an argument, with normalized strings
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "sha256:" + hashlib.sha256(value).hexdigest()
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return repr(value)
+
+def canonical_key(namespace: str, func, args: tuple, kwargs: dict) -> tuple:
+    """
+    Memo key for func(*args, **kwargs): the arguments are bound to the signature (so defaults and
+    positional vs. keyword arguments do not matter), prompts are whitespace-normalized and the
+    result is hashed. Returns a tuple: (namespace, KEY_VERSION, sha256_hexdigest).
+    """
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    payload = json.dumps([func.__qualname__, _canonical(bound.arguments)],
+                         sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return namespace, KEY_VERSION, hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _is_memo_key(key) -> bool:
+    return isinstance(key, tuple) and len(key) == 3 and key[1] == KEY_VERSION and isinstance(key[0], str) \
+        and (key[0] in NAMESPACE_DEFAULTS or key[0] in _namespaces)
+
+def memo_lookup(key):
+    """The value under `key` (from its namespace's store for memo keys, else the shared cache), or ENOVAL."""
+    if _is_memo_key(key):
+        return get_backend(key[0]).get(key)
+    return cache.get(key, default=ENOVAL, retry=True)
+
+def _value_size(value) -> int:
+    # Approximate payload size of the values memoized here (text, audio bytes and tuples of them)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (list, tuple)):
+        return sum(_value_size(v) for v in value)
+    return 0
+
+def memo_store(key, value):
+    """Stores a result under a memo key, applying the namespace TTL and counting the stored bytes."""
+    namespace = key[0]
+    backend = get_backend(namespace)
+    backend.set(key, value, expire=_namespace_policies[namespace]["ttl"] or None)
+    _count(namespace, "stores")
+    _count(namespace, "bytes_stored", _value_size(value))
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+def _call_with_worker_lock(namespace: str, key: tuple, call):
+    """
+    Runs `call` while holding the cross-worker lock for `key`. If another worker holds it, waits
+    for that worker's result to appear in the namespace cache instead, up to SINGLE_FLIGHT_LOCK_TTL.
+    """
+    lock_key = ("single-flight",) + key
+    token = uuid.uuid4().hex
+    local_cache = get_namespace(namespace)
+    acquired = cache.add(lock_key, token, expire=SINGLE_FLIGHT_LOCK_TTL, retry=True)
+    if not acquired:
+        _count(namespace, "lock_waits")
+        deadline = time.monotonic() + SINGLE_FLIGHT_LOCK_TTL
+        while not acquired:
+            time.sleep(_SINGLE_FLIGHT_POLL_SECONDS)
+            result = local_cache.get(key, default=ENOVAL, retry=True)
+            if result is not ENOVAL:
+                return result
+            # Taken over when the holder failed (lock released without a result) or the lock expired
+            acquired = cache.add(lock_key, token, expire=SINGLE_FLIGHT_LOCK_TTL, retry=True)
+            if not acquired and time.monotonic() > deadline:
+                logging.warning("Gave up waiting for the single-flight lock of %s, calling anyway.", key)
+                break
+    try:
+        # The previous holder may have stored the result between our lookup and the lock
+        result = local_cache.get(key, default=ENOVAL, retry=True)
+        return call() if result is ENOVAL else result
+    finally:
+        if acquired:
+            with cache.transact(retry=True):
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+def _single_flight(namespace: str, key: tuple, call):
+    """Runs `call` once for all concurrent callers with the same key; the others get its result or exception."""
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = Future()
+    if not leader:
+        _count(namespace, "coalesced")
+        return future.result()
+    try:
+        result = _call_with_worker_lock(namespace, key, call)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+
+def memoize(namespace: str):
+    """
+    Caches the results of the decorated function in the memo namespace `namespace`.
+    Like diskcache's memoize, the wrapper has a __cache_key__(*args, **kwargs) method, plus
+    __cache_lookup__(*args, **kwargs), which returns the cached result (or ENOVAL) without calling.
+    Concurrent misses for the same key are coalesced into one call, see SINGLE_FLIGHT.
+    """
+    def decorator(func):
+        legacy_base = (full_name(func),)
+
+        def lookup(key, args, kwargs):
+            result = get_backend(namespace).get(key)
+            if result is not ENOVAL:
+                _count(namespace, "hits")
+                record_cache_result(True)
+                return result
+            if CACHE_LEGACY_FALLBACK:
+                legacy_key = args_to_key(legacy_base, args, kwargs, False, ())
+                result = cache.get(legacy_key, default=ENOVAL, retry=True)
+                if result is not ENOVAL:
+                    _count(namespace, "legacy_hits")
+                    record_cache_result(True)
+                    memo_store(key, result)
+                    # Moved, not copied: the root cache shrinks as its entries are migrated
+                    cache.delete(legacy_key, retry=True)
+                    return result
+            _count(namespace, "misses")
+            record_cache_result(False)
+            return ENOVAL
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = canonical_key(namespace, func, args, kwargs)
+            result = lookup(key, args, kwargs)
+            if result is ENOVAL:
+                def call():
+                    value = func(*args, **kwargs)
+                    memo_store(key, value)
+                    return value
+                result = _single_flight(namespace, key, call) if SINGLE_FLIGHT else call()
+            return result
+
+        def __cache_key__(*args, **kwargs):
+            """Make key for cache given function arguments."""
+            return canonical_key(namespace, func, args, kwargs)
+
+        def __cache_lookup__(*args, **kwargs):
+            """Cached result for the arguments, or ENOVAL. Never calls the function."""
+            return lookup(canonical_key(namespace, func, args, kwargs), args, kwargs)
+
+        wrapper.__cache_key__ = __cache_key__
+        wrapper.__cache_lookup__ = __cache_lookup__
+        return wrapper
+
+    return decorator
+
+def cache_stats() -> dict:
+    """Hit/miss counters of this process and the current size of every memo namespace and the root cache."""
+    for namespace in NAMESPACE_DEFAULTS:
+        get_namespace(namespace)
+    with _namespaces_lock:
+        namespaces = {name: (c, dict(_namespace_stats[name]), _namespace_policies[name], _namespace_backends[name])
+                      for name, c in _namespaces.items()}
+    stats = {"root": {"entries": len(cache), "volume_bytes": cache.volume()}}
+    for name, (namespace_cache, counters, policy, backend) in namespaces.items():
+        stats[name] = {**counters, **policy, **backend.stats(),
+                       "entries": len(namespace_cache), "volume_bytes": namespace_cache.volume()}
+    return stats
+
+# Value files that deflate to more than this share of their size (audio, mostly) are stored as is.
+_STORE_UNCOMPRESSED_RATIO = 0.9
+_EXPORT_CHUNK_SIZE = 1024 * 1024
+EXPORT_MANIFEST = "export_manifest.json"
+DELTA_PREFIX = "delta/"
+
+class _ZipStream:
+    """Write-only file object collecting what zipfile writes, drained by the export generator."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _cache_databases(cache_directory: str):
+    # Relative directory of every diskcache under the cache directory: "" and "ns/<namespace>"
+    for root, dirs, files in os.walk(cache_directory):
+        dirs[:] = [d for d in dirs if d != "tmp"]
+        if "cache.db" in files:
+            relative_dir = os.path.relpath(root, cache_directory)
+            yield "" if relative_dir == os.curdir else relative_dir.replace(os.sep, "/")
+
+def _is_lock_key(key, raw) -> bool:
+    # diskcache stores tuple keys pickled (raw = 0); lock keys are ("single-flight", ...memo key)
+    if raw:
+        return False
+    try:
+        key = pickle.loads(bytes(key))
+    except Exception:
+        return False
+    return isinstance(key, tuple) and key[:1] == ("single-flight",)
+
+def _snapshot_database(source_db: str, snapshot_db: str, since: float | None) -> list[str]:
+    """
+    Copies a cache database with the SQLite backup API, which yields a consistent snapshot while
+    other workers keep writing. With `since`, only entries stored after that time are kept.
+    Single-flight locks of calls in progress are dropped. Returns the value files referenced by the snapshot.
+    """
+    with contextlib.closing(sqlite3.connect(source_db, timeout=60)) as source, \
+            contextlib.closing(sqlite3.connect(snapshot_db)) as snapshot:
+        source.backup(snapshot)
+        if since is not None:
+            snapshot.execute("DELETE FROM Cache WHERE store_time <= ?", (since,))
+        locks = [(rowid,) for rowid, key, raw in snapshot.execute("SELECT rowid, key, raw FROM Cache")
+                 if _is_lock_key(key, raw)]
+        snapshot.executemany("DELETE FROM Cache WHERE rowid = ?", locks)
+        snapshot.commit()
+        if since is not None or locks:
+            snapshot.execute("VACUUM")
+        return [row[0] for row in snapshot.execute("SELECT filename FROM Cache WHERE filename IS NOT NULL")]
+
+def _compress_type(path: str) -> int:
+    # Deflating already-compressed audio costs CPU for nothing; sample the start of the file to tell
+    with open(path, "rb") as f:
+        head = f.read(64 * 1024)
+    if head and len(zlib.compress(head, 1)) > _STORE_UNCOMPRESSED_RATIO * len(head):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+def _add_file(zipf: zipfile.ZipFile, stream: _ZipStream, path: str, arcname: str, compress_type: int):
+    info = zipfile.ZipInfo.from_file(path, arcname)
+    info.compress_type = compress_type
+    with open(path, "rb") as source, zipf.open(info, "w", force_zip64=True) as target:
+        while True:
+            chunk = source.read(_EXPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            target.write(chunk)
+            yield stream.drain()
+    yield stream.drain()
+
+def stream_cache_archive(since: float | None = None):
+    """
+    Yields a zip archive of the cache directory, chunk by chunk, without writing it to disk first.
+    Each cache database is snapshotted with the SQLite backup API into a private temporary
+    directory, and only the value files the snapshot references are included.
+    With `since` (the "generation" of an earlier export's manifest), only entries stored after
+    it are exported, under "delta/", to be merged with import_cache_archive.
+    A full archive can be unzipped into an empty CACHE_DIR as is.
+    """
     cache_directory = os.environ.get("CACHE_DIR", "/cache")
-    
-    if not os.path.isdir(cache_directory):
-        logging.error(f"Cache directory not found at {cache_directory}")
-        return None, f"Cache directory not found on server: {cache_directory}"
-    
-    logging.info("Forcing a cache checkpoint for safe backup...")
+    prefix = DELTA_PREFIX if since is not None else ""
+    # Taken before the snapshots: an entry stored meanwhile is at worst exported twice, never skipped
+    generation = time.time()
+    manifest = {"generation": generation, "since": since, "caches": {}}
+    snapshot_dir = tempfile.mkdtemp(prefix="cache-export-")
+    stream = _ZipStream()
+    try:
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zipf:
+            for i, relative_dir in enumerate(_cache_databases(cache_directory)):
+                source_dir = os.path.join(cache_directory, relative_dir)
+                snapshot_db = os.path.join(snapshot_dir, f"{i}.db")
+                filenames = _snapshot_database(os.path.join(source_dir, "cache.db"), snapshot_db, since)
+                arc_dir = prefix + (relative_dir + "/" if relative_dir else "")
+                yield from _add_file(zipf, stream, snapshot_db, arc_dir + "cache.db", zipfile.ZIP_DEFLATED)
+                os.remove(snapshot_db)
+
+                exported = 0
+                for filename in filenames:
+                    path = os.path.join(source_dir, filename)
+                    try:
+                        yield from _add_file(zipf, stream, path, arc_dir + filename, _compress_type(path))
+                        exported += 1
+                    except FileNotFoundError:
+                        # Evicted after the snapshot was taken; diskcache treats the entry as a miss
+                        logging.warning("Cache value file disappeared during export: %s", path)
+                manifest["caches"][relative_dir] = {"value_files": exported}
+            zipf.writestr(prefix + EXPORT_MANIFEST, json.dumps(manifest, indent=2))
+        yield stream.drain()
+        logging.info("Cache export done: generation %s, since %s.", generation, since)
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+def import_cache_archive(archive_path: str) -> int:
+    """
+    Merges the entries of an archive from stream_cache_archive (full or delta) into the live cache,
+    keeping their tags and remaining expiry. Returns the number of entries imported.
+    """
+    imported = 0
+    extract_dir = tempfile.mkdtemp(prefix="cache-import-")
     try:
-        # Open and immediately close a connection.
-        # This forces SQLite to perform a checkpoint, merging the .wal file
-        # into the main .db file, ensuring the on-disk files are consistent.
-        with Cache(cache_directory) as temp_cache:
-            temp_cache.close()
-        
-        # Clean up temporary files before archiving.
-        tmp_path = os.path.join(cache_directory, 'tmp')
-        if os.path.isdir(tmp_path):
-            logging.info(f"Removing temporary cache directory: {tmp_path}")
-            shutil.rmtree(tmp_path)
-
-        logging.info(f"Checkpoint complete. Creating zip archive of {cache_directory} to {archive_path}")
-        with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as zipf:
-            for root, _, files in os.walk(cache_directory):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, cache_directory)
-                    zipf.write(file_path, arcname)
-        logging.info("Zip archive created successfully.")
-        return archive_path, None
-        
-    except Exception as e:
-        logging.error(f"Error creating zip archive of cache directory: {e}", exc_info=True)
-        return None, f"Error creating zip archive: {e}"
+        with zipfile.ZipFile(archive_path) as zipf:
+            zipf.extractall(extract_dir)
+        root = os.path.join(extract_dir, DELTA_PREFIX) if os.path.isdir(os.path.join(extract_dir, DELTA_PREFIX)) else extract_dir
+        now = time.time()
+        for relative_dir in list(_cache_databases(root)):
+            namespace = relative_dir[len("ns/"):] if relative_dir.startswith("ns/") else None
+            target = get_namespace(namespace) if namespace else cache
+            with Cache(os.path.join(root, relative_dir)) as source:
+                for key in source:
+                    value, expire_time, tag = source.get(key, default=ENOVAL, expire_time=True, tag=True)
+                    if value is ENOVAL or (expire_time is not None and expire_time <= now):
+                        continue
+                    target.set(key, value, expire=expire_time - now if expire_time else None, tag=tag, retry=True)
+                    imported += 1
+        logging.info("Imported %d cache entries from %s.", imported, archive_path)
+        return imported
+    finally:
+        shutil.rmtree(extract_dir, ignore_errors=True)
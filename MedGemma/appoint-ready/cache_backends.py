@@ -0,0 +1,217 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Stores behind the memo cache. Every instance keeps its local diskcache as the first tier; an
+# optional shared tier (Redis, or SQLite on a shared volume) lets instances reuse each other's
+# LLM and TTS results. Writes to the shared tier happen on a background thread (write-behind),
+# so a slow or unavailable shared store never delays an interview.
+
+import abc
+import logging
+import os
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+
+from diskcache.core import ENOVAL
+
+logger = logging.getLogger("cache_backends")
+
+
+class CacheBackend(abc.ABC):
+    """A key-value store for memoized results. get returns ENOVAL for missing or expired keys."""
+
+    @abc.abstractmethod
+    def get(self, key):
+        ...
+
+    @abc.abstractmethod
+    def set(self, key, value, expire: float | None = None):
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+
+def key_string(key) -> str:
+    """String form of a memo key (namespace, version, digest), used by the shared stores."""
+    return ":".join(str(part) for part in key)
+
+
+class DiskCacheBackend(CacheBackend):
+    """The local tier: a diskcache.Cache."""
+
+    def __init__(self, disk_cache):
+        self.cache = disk_cache
+
+    def get(self, key):
+        return self.cache.get(key, default=ENOVAL, retry=True)
+
+    def set(self, key, value, expire=None):
+        self.cache.set(key, value, expire=expire, retry=True)
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    A tier shared by the worker processes of one host, in a single SQLite file on a local disk.
+    Also the stand-in for the networked stores in local runs and tests. Not for sharing between
+    hosts: WAL mode needs shared memory on one machine, and SQLite locking over network file
+    systems (NFS, GCS FUSE) can corrupt the database or deadlock. Use Redis across instances.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS memo (key TEXT PRIMARY KEY, value BLOB, expire_time REAL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM memo WHERE key = ? AND (expire_time IS NULL OR expire_time > ?)",
+            (key_string(key), time.time())).fetchone()
+        return pickle.loads(row[0]) if row else ENOVAL
+
+    def set(self, key, value, expire=None):
+        with self._connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO memo VALUES (?, ?, ?)", (
+                key_string(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL),
+                time.time() + expire if expire else None))
+
+
+class RedisBackend(CacheBackend):
+    """A shared tier on any Redis-protocol server (Redis, Memorystore, Valkey). Needs the `redis` package."""
+
+    def __init__(self, url: str, prefix: str = "appoint-ready:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_SHARED_URL is a Redis URL but the redis package is not installed") from e
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=5, socket_connect_timeout=5)
+
+    def get(self, key):
+        data = self._client.get(self.prefix + key_string(key))
+        return pickle.loads(data) if data is not None else ENOVAL
+
+    def set(self, key, value, expire=None):
+        self._client.set(self.prefix + key_string(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL),
+                         ex=max(1, int(expire)) if expire else None)
+
+
+class TieredBackend(CacheBackend):
+    """
+    The local tier in front of a shared tier. Shared hits are copied into the local tier, and
+    writes go to the local tier at once and to the shared tier from a background thread.
+    Errors of the shared tier are logged and otherwise treated as misses.
+    """
+
+    def __init__(self, local: CacheBackend, shared: CacheBackend, write_queue: queue.Queue,
+                 local_expire: float | None = None):
+        self.local = local
+        self.shared = shared
+        self.local_expire = local_expire
+        self._write_queue = write_queue
+        self._counters = {"local_hits": 0, "shared_hits": 0, "shared_errors": 0, "write_behind_dropped": 0}
+        self._counters_lock = threading.Lock()
+
+    def _count(self, counter: str):
+        with self._counters_lock:
+            self._counters[counter] += 1
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not ENOVAL:
+            self._count("local_hits")
+            return value
+        try:
+            value = self.shared.get(key)
+        except Exception as e:
+            self._count("shared_errors")
+            logger.warning("Shared cache read failed for %s: %s", key_string(key), e)
+            return ENOVAL
+        if value is not ENOVAL:
+            self._count("shared_hits")
+            self.local.set(key, value, self.local_expire)
+        return value
+
+    def set(self, key, value, expire=None):
+        self.local.set(key, value, expire)
+        try:
+            self._write_queue.put_nowait((self, key, value, expire))
+        except queue.Full:
+            # The entry stays local; another instance or a later run will share it
+            self._count("write_behind_dropped")
+            logger.warning("Shared cache write queue full, not sharing %s", key_string(key))
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            return {**self._counters, "write_behind_pending": self._write_queue.qsize()}
+
+    def _write_shared(self, key, value, expire):
+        try:
+            self.shared.set(key, value, expire)
+        except Exception as e:
+            self._count("shared_errors")
+            logger.warning("Shared cache write failed for %s: %s", key_string(key), e)
+
+
+# One writer thread and queue for all namespaces of the process
+_write_queue = queue.Queue(maxsize=int(os.environ.get("CACHE_WRITE_BEHIND_QUEUE", "1000")))
+_writer = None
+_writer_lock = threading.Lock()
+
+def _write_behind_loop():
+    while True:
+        backend, key, value, expire = _write_queue.get()
+        try:
+            backend._write_shared(key, value, expire)
+        finally:
+            _write_queue.task_done()
+
+def tiered_backend(local: CacheBackend, shared: CacheBackend, local_expire: float | None = None) -> TieredBackend:
+    """A TieredBackend whose shared writes go through the process-wide write-behind thread."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_behind_loop, name="cache-write-behind", daemon=True)
+            _writer.start()
+    return TieredBackend(local, shared, _write_queue, local_expire)
+
+def flush_write_behind():
+    """Blocks until every queued shared-tier write is done, e.g. before a batch job exits."""
+    _write_queue.join()
+
+def shared_backend_from_url(url: str) -> CacheBackend | None:
+    """
+    Creates the shared tier for CACHE_SHARED_URL: redis://, rediss:// or unix:// for a
+    Redis-protocol server, sqlite:///<path> for a SQLite file on this host. Empty means no shared tier.
+    """
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported CACHE_SHARED_URL scheme: {url.split(':', 1)[0]}")
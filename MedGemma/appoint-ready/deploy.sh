@@ -13,4 +13,5 @@ gcloud run deploy  appoint-ready\
   --region us-central1 \
   --allow-unauthenticated \
   --port 7860 \
+  --session-affinity \
   --env-vars-file env.list.yaml
@@ -12,9 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cache import normalize_text
 from medgemma import medgemma_get_text_response
 
+# Concurrent MedGemma calls per batch evaluation (MEDGEMMA_MAX_CONCURRENCY still caps the process)
+EVALUATION_CONCURRENCY = int(os.environ.get("EVALUATION_CONCURRENCY", "8"))
+EVALUATION_BATCH_MAX_ITEMS = int(os.environ.get("EVALUATION_BATCH_MAX_ITEMS", "1000"))
+
 
 def evaluation_prompt(defacto_condition):
     # Returns a detailed prompt for the LLM to evaluate a pre-visit report for a specific condition
@@ -67,3 +76,98 @@ def evaluate_report(report, condition):
     evaluation_text = re.sub(r'<unused94>.*?<unused95>', '', evaluation_text, flags=re.DOTALL)
 
     return evaluation_text
+
+def count_evaluation_items(evaluation_text):
+    """Counts the list items under the "helpful" and "missing" headings of an evaluation.
+    Returns a tuple: (helpful_count, missing_count).
+    """
+    helpful, _, missing = evaluation_text.partition('class="missing"')
+    return len(re.findall(r"<li\b", helpful)), len(re.findall(r"<li\b", missing))
+
+def _evaluate_timed(report, condition):
+    start = time.monotonic()
+    evaluation_text = evaluate_report(report, condition)
+    return evaluation_text, (time.monotonic() - start) * 1000
+
+def summarize_evaluations(results):
+    """Aggregates batch results per condition. Returns a list of table rows, one per condition plus a total."""
+    rows = {}
+    for result in results:
+        for condition in (result["condition"], "TOTAL"):
+            row = rows.setdefault(condition, {"condition": condition, "reports": 0, "errors": 0,
+                                              "helpful": 0, "missing": 0, "latency_ms": 0.0})
+            row["reports"] += 1
+            if "error" in result:
+                row["errors"] += 1
+                continue
+            row["helpful"] += result["helpful_count"]
+            row["missing"] += result["missing_count"]
+            row["latency_ms"] += result["latency_ms"]
+    table = []
+    for condition in sorted(rows, key=lambda c: (c == "TOTAL", c)):
+        row = rows[condition]
+        scored = row["reports"] - row["errors"]
+        table.append({
+            "condition": condition,
+            "reports": row["reports"],
+            "errors": row["errors"],
+            "avg_helpful": round(row["helpful"] / scored, 2) if scored else None,
+            "avg_missing": round(row["missing"] / scored, 2) if scored else None,
+            "avg_latency_ms": round(row["latency_ms"] / scored) if scored else None,
+        })
+    return table
+
+def summary_table_markdown(table):
+    """Renders the rows from summarize_evaluations as a Markdown table."""
+    columns = ["condition", "reports", "errors", "avg_helpful", "avg_missing", "avg_latency_ms"]
+    lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+    for row in table:
+        lines.append("| " + " | ".join("" if row[c] is None else str(row[c]) for c in columns) + " |")
+    return "\n".join(lines)
+
+def evaluate_reports(items, max_workers=None):
+    """
+    Evaluates many {"report", "condition", optional "id"} items concurrently and yields one
+    result dict per item as soon as it is ready (in completion order, with the item's "index"),
+    then a final {"summary": table_rows, "table": markdown, ...} dict.
+    Items whose whitespace-normalized report and condition are identical share one MedGemma call.
+    """
+    items = list(items)
+    start = time.monotonic()
+    # Prompt -> indexes of the items that need it
+    prompts = {}
+    for index, item in enumerate(items):
+        prompts.setdefault((item["condition"], normalize_text(item["report"])), []).append(index)
+
+    results = []
+    executor = ThreadPoolExecutor(max_workers=max_workers or EVALUATION_CONCURRENCY, thread_name_prefix="evaluation")
+    try:
+        futures = {executor.submit(_evaluate_timed, items[indexes[0]]["report"], condition): indexes
+                   for (condition, _), indexes in prompts.items()}
+        for future in as_completed(futures):
+            indexes = futures[future]
+            try:
+                evaluation_text, latency_ms = future.result()
+                helpful_count, missing_count = count_evaluation_items(evaluation_text)
+                outcome = {"evaluation": evaluation_text, "helpful_count": helpful_count,
+                           "missing_count": missing_count, "latency_ms": round(latency_ms)}
+            except Exception as e:
+                outcome = {"error": f"{type(e).__name__}: {e}"}
+            for index in indexes:
+                result = {"index": index, "id": items[index].get("id"), "condition": items[index]["condition"], **outcome}
+                if index != indexes[0]:
+                    result["duplicate_of"] = indexes[0]
+                results.append(result)
+                yield result
+    finally:
+        # Stop queued evaluations when the consumer goes away (e.g. the client disconnects)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    table = summarize_evaluations(results)
+    yield {
+        "summary": table,
+        "table": summary_table_markdown(table),
+        "items": len(items),
+        "unique_prompts": len(prompts),
+        "elapsed_s": round(time.monotonic() - start, 1),
+    }
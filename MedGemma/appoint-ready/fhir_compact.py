@@ -0,0 +1,273 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Local FHIR compaction before EHR summarization. The raw bundle is mostly boilerplate
+# (meta, narrative XHTML, identifiers, code system URLs, contact details); only the clinical
+# facts are kept and rendered as a dense plain-text digest, which is what MedGemma receives.
+
+import json
+import logging
+import math
+
+# Resources that carry clinical content. Everything else (Practitioner, Organization,
+# Location, Provenance, ...) is administrative and dropped.
+CLINICAL_RESOURCE_TYPES = (
+    "Patient", "Condition", "AllergyIntolerance", "MedicationRequest", "MedicationStatement",
+    "Observation", "Procedure", "Immunization", "DiagnosticReport", "Encounter",
+)
+# Only the most recent values of a repeated Observation are kept.
+OBSERVATION_HISTORY = 3
+
+def iter_resources(data):
+    """Yields every resource of a FHIR Bundle, a list of resources or bundles, or a single resource."""
+    if isinstance(data, list):
+        for item in data:
+            yield from iter_resources(item)
+    elif isinstance(data, dict):
+        if data.get("resourceType") == "Bundle":
+            for entry in data.get("entry", []):
+                yield from iter_resources(entry.get("resource"))
+        elif "resourceType" in data:
+            yield data
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English/JSON text (about four characters per token)."""
+    return math.ceil(len(text) / 4)
+
+def _concept_text(concept) -> str:
+    # CodeableConcept -> its human readable text, falling back to the first coding display
+    if not isinstance(concept, dict):
+        return ""
+    if concept.get("text"):
+        return concept["text"]
+    for coding in concept.get("coding", []):
+        if coding.get("display") or coding.get("code"):
+            return coding.get("display") or coding["code"]
+    return ""
+
+def _concepts_text(concepts) -> str:
+    return ", ".join(filter(None, (_concept_text(c) for c in concepts or [])))
+
+def _encounter_class_text(value) -> str:
+    # Encounter.class is a Coding in R4 and a list of CodeableConcepts in R5
+    if isinstance(value, list):
+        return _concepts_text(value)
+    if not isinstance(value, dict):
+        return ""
+    return _concept_text(value) or value.get("display") or value.get("code") or ""
+
+def _date(value) -> str:
+    # Keep the day only, the time of day does not matter for the medical history
+    return value[:10] if isinstance(value, str) else ""
+
+def _quantity_text(quantity) -> str:
+    if not isinstance(quantity, dict) or quantity.get("value") is None:
+        return ""
+    value = quantity["value"]
+    if isinstance(value, float):
+        value = f"{value:g}"
+    return f'{value} {quantity.get("unit") or quantity.get("code") or ""}'.strip()
+
+def _human_name(names) -> str:
+    for name in names or []:
+        if name.get("text"):
+            return name["text"]
+        parts = name.get("given", []) + ([name["family"]] if name.get("family") else [])
+        if parts:
+            return " ".join(parts)
+    return ""
+
+def _reference_key(resource) -> tuple[str, str]:
+    return resource.get("resourceType", ""), resource.get("id", "")
+
+def _resolve(reference, index) -> dict | None:
+    # Resolves "Type/id" and "urn:uuid:..." references within the same record
+    if not isinstance(reference, dict):
+        return None
+    ref = reference.get("reference", "")
+    if ref in index:
+        return index[ref]
+    resource_type, _, resource_id = ref.rpartition("/")
+    return index.get((resource_type, resource_id))
+
+def _reference_text(reference, index) -> str:
+    resolved = _resolve(reference, index)
+    if resolved is not None:
+        return _concept_text(resolved.get("code")) or _human_name(resolved.get("name"))
+    return reference.get("display", "") if isinstance(reference, dict) else ""
+
+def _observation_value(observation) -> str:
+    if "valueQuantity" in observation:
+        return _quantity_text(observation["valueQuantity"])
+    if "valueCodeableConcept" in observation:
+        return _concept_text(observation["valueCodeableConcept"])
+    for key in ("valueString", "valueBoolean", "valueInteger"):
+        if key in observation:
+            return str(observation[key])
+    components = []
+    for component in observation.get("component", []):
+        value = _observation_value(component)
+        if value:
+            components.append(f"{_concept_text(component.get('code'))} {value}".strip())
+    return ", ".join(components)
+
+def compact_fhir(data) -> dict:
+    """
+    Reduces a FHIR record to its clinical facts.
+    Returns a dict with "patient" (a dict) and the lists "conditions", "allergies", "medications",
+    "observations", "procedures", "immunizations", "reports" and "encounters", each entry a small
+    dict of plain strings. Repeated Observations are merged per code, newest first.
+    """
+    resources = list(iter_resources(data))
+    index = {}
+    for resource in resources:
+        index[_reference_key(resource)] = resource
+    # Bundles may reference entries by their fullUrl
+    for entry in (data.get("entry", []) if isinstance(data, dict) else []):
+        if entry.get("fullUrl") and isinstance(entry.get("resource"), dict):
+            index[entry["fullUrl"]] = entry["resource"]
+
+    compact = {
+        "patient": {}, "conditions": [], "allergies": [], "medications": [], "observations": [],
+        "procedures": [], "immunizations": [], "reports": [], "encounters": [],
+    }
+    observations = {}
+    dropped = 0
+    for resource in resources:
+        resource_type = resource.get("resourceType")
+        if resource_type not in CLINICAL_RESOURCE_TYPES:
+            dropped += 1
+            continue
+        if resource_type == "Patient":
+            compact["patient"] = {
+                "name": _human_name(resource.get("name")),
+                "gender": resource.get("gender", ""),
+                "birth_date": _date(resource.get("birthDate")),
+                "deceased": "yes" if resource.get("deceasedBoolean") or resource.get("deceasedDateTime") else "",
+            }
+        elif resource_type == "Condition":
+            compact["conditions"].append({
+                "name": _concept_text(resource.get("code")),
+                "status": _concept_text(resource.get("clinicalStatus")),
+                "verification": _concept_text(resource.get("verificationStatus")),
+                "severity": _concept_text(resource.get("severity")),
+                "onset": _date(resource.get("onsetDateTime") or resource.get("recordedDate")),
+            })
+        elif resource_type == "AllergyIntolerance":
+            compact["allergies"].append({
+                "substance": _concept_text(resource.get("code")),
+                "reaction": "; ".join(_concepts_text(r.get("manifestation")) for r in resource.get("reaction", [])),
+                "criticality": resource.get("criticality", ""),
+            })
+        elif resource_type in ("MedicationRequest", "MedicationStatement"):
+            medication = _concept_text(resource.get("medicationCodeableConcept")) \
+                or _reference_text(resource.get("medicationReference"), index)
+            compact["medications"].append({
+                "name": medication,
+                "dosage": "; ".join(d.get("text", "") for d in resource.get("dosageInstruction", resource.get("dosage", []))),
+                "status": resource.get("status", ""),
+                "date": _date(resource.get("authoredOn") or resource.get("effectiveDateTime")),
+                "reason": ", ".join(filter(None, [_concepts_text(resource.get("reasonCode"))]
+                                           + [_reference_text(r, index) for r in resource.get("reasonReference", [])])),
+            })
+        elif resource_type == "Observation":
+            name = _concept_text(resource.get("code"))
+            value = _observation_value(resource)
+            if not name or not value:
+                dropped += 1
+                continue
+            date = _date(resource.get("effectiveDateTime") or resource.get("issued"))
+            # Exact repeats collapse into one value; different values of the same code form a series
+            observations.setdefault(name, {})[(date, value)] = {
+                "date": date,
+                "value": value,
+                "interpretation": _concepts_text(resource.get("interpretation")),
+            }
+        elif resource_type == "Procedure":
+            compact["procedures"].append({
+                "name": _concept_text(resource.get("code")),
+                "date": _date(resource.get("performedDateTime") or (resource.get("performedPeriod") or {}).get("start")),
+            })
+        elif resource_type == "Immunization":
+            compact["immunizations"].append({
+                "name": _concept_text(resource.get("vaccineCode")),
+                "date": _date(resource.get("occurrenceDateTime")),
+            })
+        elif resource_type == "DiagnosticReport":
+            compact["reports"].append({
+                "name": _concept_text(resource.get("code")),
+                "date": _date(resource.get("effectiveDateTime") or resource.get("issued")),
+                "conclusion": resource.get("conclusion", ""),
+            })
+        elif resource_type == "Encounter":
+            compact["encounters"].append({
+                "date": _date((resource.get("period") or {}).get("start")),
+                "type": _concepts_text(resource.get("type")) or _encounter_class_text(resource.get("class")),
+                "reason": ", ".join(filter(None, [_concepts_text(resource.get("reasonCode"))]
+                                           + [_reference_text(r, index) for r in resource.get("reasonReference", [])])),
+            })
+
+    for name, values in observations.items():
+        series = sorted(values.values(), key=lambda v: v["date"], reverse=True)[:OBSERVATION_HISTORY]
+        compact["observations"].append({"name": name, "values": series})
+    compact["encounters"].sort(key=lambda e: e["date"], reverse=True)
+    if dropped:
+        logging.debug("FHIR compaction dropped %d administrative or empty resources", dropped)
+    return compact
+
+def _details(*parts) -> str:
+    details = "; ".join(p for p in parts if p)
+    return f" ({details})" if details else ""
+
+def fhir_digest(compact: dict) -> str:
+    """Renders the output of compact_fhir as a dense plain-text digest, one line per fact."""
+    lines = []
+    patient = compact["patient"]
+    if patient:
+        lines.append("Patient: " + ", ".join(filter(None, [
+            patient["name"], patient["gender"],
+            f'born {patient["birth_date"]}' if patient["birth_date"] else "",
+            "deceased" if patient["deceased"] else "",
+        ])))
+
+    def section(title, items, render):
+        if items:
+            lines.append(f"{title}:")
+            lines.extend(f"- {render(item)}" for item in items)
+
+    section("Conditions", compact["conditions"], lambda c: c["name"] + _details(
+        ", ".join(filter(None, [c["status"].lower(), c["verification"].lower()])),
+        f'severity {c["severity"]}' if c["severity"] else "",
+        f'since {c["onset"]}' if c["onset"] else ""))
+    section("Allergies", compact["allergies"], lambda a: a["substance"] + _details(
+        a["reaction"], f'criticality {a["criticality"]}' if a["criticality"] else ""))
+    section("Medications", compact["medications"], lambda m: m["name"] + (f': {m["dosage"]}' if m["dosage"] else "") + _details(
+        m["status"], f'prescribed {m["date"]}' if m["date"] else "", f'for {m["reason"]}' if m["reason"] else ""))
+    section("Observations", compact["observations"], lambda o: f'{o["name"]}: ' + ", ".join(
+        v["value"] + _details(v["date"], v["interpretation"]) for v in o["values"]))
+    section("Procedures", compact["procedures"], lambda p: p["name"] + _details(p["date"]))
+    section("Immunizations", compact["immunizations"], lambda i: i["name"] + _details(i["date"]))
+    section("Diagnostic reports", compact["reports"], lambda r: r["name"] + _details(r["date"]) + (f': {r["conclusion"]}' if r["conclusion"] else ""))
+    section("Encounters", compact["encounters"], lambda e: " ".join(filter(None, [e["date"], e["type"]])) + _details(
+        f'reason {e["reason"]}' if e["reason"] else ""))
+    return "\n".join(lines)
+
+def compact_fhir_text(data, label: str = "") -> str:
+    """Compacts a FHIR record into its digest and logs the estimated token counts before and after."""
+    digest = fhir_digest(compact_fhir(data))
+    raw_tokens = estimate_tokens(json.dumps(data))
+    digest_tokens = estimate_tokens(digest)
+    logging.info("FHIR compaction%s: ~%d -> ~%d tokens (%.0f%% smaller)", f" for {label}" if label else "",
+                 raw_tokens, digest_tokens, 100 * (1 - digest_tokens / raw_tokens) if raw_tokens else 0)
+    return digest
@@ -21,6 +21,15 @@ import { diffArrays, diffWords } from "diff";
 import "./Interview.css";
 import DetailsPopup from "../DetailsPopup/DetailsPopup";
 
+// Audio arrives as a path on the backend (e.g. /api/audio/<id>) or as a data URI
+const resolveAudioUrl = (audio) => {
+  const baseURL =
+    window.location.origin === "http://localhost:3000"
+      ? "http://localhost:7860"
+      : "";
+  return audio.startsWith("/") ? `${baseURL}${audio}` : audio;
+};
+
 const Interview = ({ selectedPatient, selectedCondition, onBack }) => {
   const [messages, setMessages] = useState([]);
   const [isInterviewComplete, setIsInterviewComplete] = useState(false);
@@ -29,6 +38,7 @@ const Interview = ({ selectedPatient, selectedCondition, onBack }) => {
   const [evaluation, setEvaluation] = useState('');
   const [isFetchingEvaluation, setIsFetchingEvaluation] = useState(false);
   const [currentReport, setCurrentReport] = useState("");
+  const [draftText, setDraftText] = useState("");
   const [prevReport, setPrevReport] = useState("");
   const [waitTime, setWaitTime] = useState(3000);
   const [showEvaluationInfoPopup, setShowEvaluationInfoPopup] = useState(false);
@@ -55,6 +65,15 @@ const Interview = ({ selectedPatient, selectedCondition, onBack }) => {
       clearTimeout(timeoutIdRef.current);
     }
 
+    // Streamed fragments of the next question are shown right away as a draft
+    let draft = "";
+    while (messageQueue.current.length > 0 && messageQueue.current[0].speaker === "interviewer partial") {
+      draft += messageQueue.current.shift().text;
+    }
+    if (draft) {
+      setDraftText((prev) => prev + draft);
+    }
+
     if (messageQueue.current.length === 0) {
       // The queue is empty, so the processing chain for this batch is done.
       // Clear the timeout ref so a new message can start a new chain.
@@ -67,14 +86,22 @@ const Interview = ({ selectedPatient, selectedCondition, onBack }) => {
 
     const nextMessage = messageQueue.current.shift();
 
-    setMessages((prev) => [...prev, nextMessage]);
+    // Sentence audio of the previous message: play it, but don't show it in the chat
+    const isAudioChunk = nextMessage.speaker === "audio chunk";
+    if (!isAudioChunk) {
+      if (nextMessage.speaker === "interviewer") {
+        // The complete question replaces its draft
+        setDraftText("");
+      }
+      setMessages((prev) => [...prev, nextMessage]);
+    }
 
     if (nextMessage.audio && isAudioEnabledRef.current) {
       if (currentPlayingAudio.current) {
         currentPlayingAudio.current.pause();
         currentPlayingAudio.current.src = '';
       }
-      const audio = new Audio(nextMessage.audio);
+      const audio = new Audio(resolveAudioUrl(nextMessage.audio));
       currentPlayingAudio.current = audio;
 
       audio.onended = () => {
@@ -91,18 +118,22 @@ const Interview = ({ selectedPatient, selectedCondition, onBack }) => {
         currentPlayingAudio.current = null;
         processQueue();
       });
+    } else if (isAudioChunk || (nextMessage.audio_chunks && isAudioEnabledRef.current)) {
+      // The message's audio follows as separate chunks, continue with them right away
+      processQueue();
     } else {
       // For non-audio, schedule the next processing call with a fixed delay
       // to simulate reading time. This will call processQueue again, which will
       // handle an empty queue and stop the chain if needed.
       timeoutIdRef.current = setTimeout(processQueue, waitTimeRef.current);
     }
-  }, [setMessages, setIsInterviewComplete]);
+  }, [setMessages, setIsInterviewComplete, setDraftText]);
 
   useEffect(() => {
     if (!selectedPatient || !selectedCondition) return;
 
     setMessages([]);
+    setDraftText("");
     setIsInterviewComplete(false);
     messageQueue.current = [];
     if (currentPlayingAudio.current) {
@@ -114,9 +145,14 @@ const Interview = ({ selectedPatient, selectedCondition, onBack }) => {
       window.location.origin === "http://localhost:3000"
         ? "http://localhost:7860"
         : "";
+    // A new id per interview; EventSource reconnects reuse the URL, so the server resumes
+    // this interview after the last received event instead of starting a new one.
+    const interviewId = window.crypto && window.crypto.randomUUID
+      ? window.crypto.randomUUID()
+      : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
     const url = `${baseURL}/api/stream_conversation?patient=${encodeURIComponent(
       selectedPatient.name
-    )}&condition=${encodeURIComponent(selectedCondition)}`;
+    )}&condition=${encodeURIComponent(selectedCondition)}&interview_id=${interviewId}`;
     const eventSource = new EventSource(url);
     eventSourceRef.current = eventSource;
 
@@ -124,6 +160,12 @@ const Interview = ({ selectedPatient, selectedCondition, onBack }) => {
       try {
         const data = JSON.parse(event.data);
 
+        // Per-stage timings of the interview, for debugging only
+        if (data && data.event === 'timings') {
+          console.debug("Interview timings:", data);
+          return;
+        }
+
         // Check if the parsed object is our special 'end' signal
         if (data && data.event === 'end') {
           console.log("Server signaled end of stream. Closing connection.");
@@ -142,8 +184,14 @@ const Interview = ({ selectedPatient, selectedCondition, onBack }) => {
     };
 
     eventSource.onerror = (err) => {
-      console.error("EventSource failed:", err);
-      eventSource.close();
+      // EventSource reconnects on its own and the server resumes the interview;
+      // it only gives up (readyState CLOSED) on HTTP errors or when the interview is over.
+      // The server answers 410 when it no longer has the interview; then it has to be restarted.
+      if (eventSource.readyState === EventSource.CLOSED) {
+        console.error("EventSource failed:", err);
+      } else {
+        console.warn("EventSource connection lost, reconnecting:", err);
+      }
     };
 
 
@@ -318,7 +366,7 @@ const Interview = ({ selectedPatient, selectedCondition, onBack }) => {
 
   const playAudio = (audioDataUrl) => {
     if (audioDataUrl) {
-      const audio = new Audio(audioDataUrl);
+      const audio = new Audio(resolveAudioUrl(audioDataUrl));
       audio.play().catch(e => {
         console.error("Error playing audio:", e);
       });
@@ -377,7 +425,7 @@ const Interview = ({ selectedPatient, selectedCondition, onBack }) => {
                 
               </div>
               <div className="chat-container" ref={chatContainerRef}>
-                {messages.length === 0 ? (
+                {messages.length === 0 && !draftText ? (
                   <div className="chat-waiting-indicator">
                     Waiting for the interview to start...
                   </div>
@@ -413,6 +461,16 @@ const Interview = ({ selectedPatient, selectedCondition, onBack }) => {
                     </div>
                   ))
                 )}
+                {draftText && (
+                  <div className="chat-message-wrapper interviewer draft">
+                    <img
+                      className="chat-avatar"
+                      src="assets/ai_headshot.svg"
+                      alt="Interviewer"
+                    />
+                    <div className="chat-bubble">{draftText}</div>
+                  </div>
+                )}
               </div>
             </div>
           </div>
@@ -13,13 +13,15 @@
 # limitations under the License.
 
 import os
-import requests
-from cache import cache  # new import replacing duplicate cache initialization
+from cache import memoize
+from llm_client import get_endpoint_client
+from telemetry import add_counts
 
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
 
-# Decorate the function to cache its results indefinitely.
-@cache.memoize()
+# Cache the results in the "gemini" namespace, see cache.NAMESPACE_DEFAULTS.
+@memoize("gemini")
 def gemini_get_text_response(prompt: str,
                                     stop_sequences: list = None,
                                     temperature: float = 0.1,
@@ -30,9 +32,10 @@ def gemini_get_text_response(prompt: str,
     Makes a text generation request to the Gemini API.
     """
 
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={GEMINI_API_KEY}"
+    # The key goes in a header rather than the URL so it never ends up in logs
     headers = {
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        'x-goog-api-key': GEMINI_API_KEY or ""
     }
 
     data = {
@@ -54,6 +57,7 @@ def gemini_get_text_response(prompt: str,
         }
     }
 
-    response = requests.post(api_url, headers=headers, json=data)
-    response.raise_for_status()  # Raise an exception for bad status codes
-    return response.json()["candidates"][0]["content"]["parts"][0]["text"]
\ No newline at end of file
+    response_data = get_endpoint_client("gemini").post_json(GEMINI_API_URL, data, headers=headers)
+    usage = response_data.get("usageMetadata", {})
+    add_counts(input_tokens=usage.get("promptTokenCount"), output_tokens=usage.get("candidatesTokenCount"))
+    return response_data["candidates"][0]["content"]["parts"][0]["text"]
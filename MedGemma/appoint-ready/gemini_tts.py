@@ -17,17 +17,18 @@ import os
 import struct
 import re
 import logging
-from cache import cache
-
-# Add these imports for MP3 conversion
-from pydub import AudioSegment
 import io
+from audio_encoder import AudioEncodingError, encode_speech
+from cache import ENOVAL, memoize
+from telemetry import stage_span
 
 # --- Constants ---
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 GENERATE_SPEECH = os.environ.get("GENERATE_SPEECH", "false").lower() == "true"
 TTS_MODEL = "gemini-2.5-flash-preview-tts"
 DEFAULT_RAW_AUDIO_MIME = "audio/L16;rate=24000"
+# Chunked TTS merges sentences until a chunk has at least this many characters.
+TTS_CHUNK_MIN_CHARS = int(os.environ.get("TTS_CHUNK_MIN_CHARS", "24"))
 
 # --- Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -87,6 +88,32 @@ def convert_to_wav(audio_data: bytes, mime_type: str) -> bytes:
         bits_per_sample, b"data", data_size
     )
     return header + audio_data
+
+# Sentence ends: Japanese/full-width and "!?" punctuation, a period followed by whitespace, or line breaks.
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[。！？!?])|(?<=\.)(?=\s)|\n+')
+
+def split_tts_chunks(text: str, min_chars: int = TTS_CHUNK_MIN_CHARS) -> list[str]:
+    """
+    Splits text at sentence boundaries into chunks that can be synthesized independently.
+    Short sentences are merged with the following ones so each chunk has at least `min_chars`.
+    """
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_BOUNDARY.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        current = f"{current} {sentence}" if current and not current.endswith(("。", "！", "？")) else current + sentence
+        if len(current) >= min_chars:
+            chunks.append(current)
+            current = ""
+    if current:
+        if chunks and len(current) < min_chars // 2:
+            # Avoid a tiny trailing chunk
+            chunks[-1] = f"{chunks[-1]} {current}" if not chunks[-1].endswith(("。", "！", "？")) else chunks[-1] + current
+        else:
+            chunks.append(current)
+    return chunks
 # --- End of helper functions ---
 
 def _synthesize_gemini_tts_impl(text: str, gemini_voice_name: str) -> tuple[bytes, str]:
@@ -135,42 +162,41 @@ def _synthesize_gemini_tts_impl(text: str, gemini_voice_name: str) -> tuple[byte
         raise TTSGenerationError(error_message)
 
     # --- Audio processing ---
-    if final_mime_type:
-        final_mime_type_lower = final_mime_type.lower()
-        needs_wav_conversion = any(p in final_mime_type_lower for p in ("audio/l16", "audio/l24", "audio/l8")) or \
-                               not final_mime_type_lower.startswith(("audio/wav", "audio/mpeg", "audio/ogg", "audio/opus"))
-
-        if needs_wav_conversion:
-            processed_audio_data = convert_to_wav(audio_data_bytes, final_mime_type)
-            processed_audio_mime = "audio/wav"
-        else:
-            processed_audio_data = audio_data_bytes
-            processed_audio_mime = final_mime_type
-    else:
-        logging.warning("MIME type not determined. Assuming raw audio and attempting WAV conversion (defaulting to %s).", DEFAULT_RAW_AUDIO_MIME)
-        processed_audio_data = convert_to_wav(audio_data_bytes, DEFAULT_RAW_AUDIO_MIME)
-        processed_audio_mime = "audio/wav"
-
-    # --- MP3 compression ---
-    if processed_audio_data:
+    if not final_mime_type:
+        logging.warning("MIME type not determined. Assuming raw audio (defaulting to %s).", DEFAULT_RAW_AUDIO_MIME)
+        final_mime_type = DEFAULT_RAW_AUDIO_MIME
+    final_mime_type_lower = final_mime_type.lower()
+    is_raw_audio = any(p in final_mime_type_lower for p in ("audio/l16", "audio/l24", "audio/l8")) or \
+                   not final_mime_type_lower.startswith(("audio/wav", "audio/mpeg", "audio/ogg", "audio/opus"))
+    if not is_raw_audio:
+        return audio_data_bytes, final_mime_type
+
+    parameters = parse_audio_mime_type(final_mime_type)
+    if parameters["bits_per_sample"] == 16:
+        # --- Compression, in process ---
         try:
-            # Load audio into AudioSegment
-            audio_segment = AudioSegment.from_file(io.BytesIO(processed_audio_data), format="wav")
+            return encode_speech(audio_data_bytes, parameters["rate"])
+        except AudioEncodingError as e:
+            logging.warning("In-process audio encoding failed: %s. Falling back to ffmpeg.", e)
+    return _compress_with_ffmpeg(convert_to_wav(audio_data_bytes, final_mime_type))
+
+def _compress_with_ffmpeg(wav_data: bytes) -> tuple[bytes, str]:
+    """MP3 compression through pydub/ffmpeg, for audio the in-process encoder cannot handle."""
+    try:
+        with stage_span("audio_encode", codec="mp3-ffmpeg", pcm_bytes=len(wav_data)) as span:
+            from pydub import AudioSegment
+            audio_segment = AudioSegment.from_file(io.BytesIO(wav_data), format="wav")
             mp3_buffer = io.BytesIO()
             audio_segment.export(mp3_buffer, format="mp3")
-            mp3_bytes = mp3_buffer.getvalue()
-            return mp3_bytes, "audio/mpeg"
-        except Exception as e:
-            logging.warning("MP3 compression failed: %s. Falling back to WAV.", e)
-            # Fallback to WAV if MP3 conversion fails
-            return processed_audio_data, processed_audio_mime
-    else:
-        error_message = "Audio processing failed."
-        logging.error(error_message)
-        raise TTSGenerationError(error_message)
+            span.attributes["bytes"] = mp3_buffer.tell()
+            return mp3_buffer.getvalue(), "audio/mpeg"
+    except Exception as e:
+        logging.warning("MP3 compression failed: %s. Falling back to WAV.", e)
+        # Fallback to WAV if MP3 conversion fails
+        return wav_data, "audio/wav"
 
 # Always create the memoized function first, so we can access its .key() method
-_memoized_tts_func = cache.memoize()(_synthesize_gemini_tts_impl)
+_memoized_tts_func = memoize("tts")(_synthesize_gemini_tts_impl)
 
 if GENERATE_SPEECH:
     def synthesize_gemini_tts_with_error_handling(*args, **kwargs) -> tuple[bytes | None, str | None]:
@@ -195,18 +221,19 @@ else:
         Checks cache for a result, but never calls the underlying TTS function.
         This is a 'read-only' memoization check.
         """
-        # Generate the cache key using the memoized function's key method.
-        key = _memoized_tts_func.__cache_key__(*args, **kwargs)
-
-        # Check the cache directly using the generated key.
-        _sentinel = object()
-        result = cache.get(key, default=_sentinel)
+        # Check the cache using the memoized function's lookup method.
+        result = _memoized_tts_func.__cache_lookup__(*args, **kwargs)
 
-        if result is not _sentinel:
+        if result is not ENOVAL:
             return result  # Cache hit
 
         # Cache miss
-        logging.info("GENERATE_SPEECH is false and no cached result found for key: %s", key)
+        logging.info("GENERATE_SPEECH is false and no cached result found for key: %s",
+                     _memoized_tts_func.__cache_key__(*args, **kwargs))
         return None, None
 
-    synthesize_gemini_tts = read_only_synthesize_gemini_tts
\ No newline at end of file
+    synthesize_gemini_tts = read_only_synthesize_gemini_tts
+
+def tts_cache_key(*args, **kwargs):
+    """The memo cache key under which synthesize_gemini_tts(*args, **kwargs) stores its result."""
+    return _memoized_tts_func.__cache_key__(*args, **kwargs)
@@ -0,0 +1,285 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Interviews run in a background thread per session, keyed by an interview id chosen by the
+# client, and every message they produce is kept. An SSE connection only replays the kept
+# messages, so when EventSource reconnects (e.g. after a proxy or Cloud Run request timeout)
+# with Last-Event-ID, the interview continues where the client left off instead of restarting.
+# At most INTERVIEW_MAX_CONCURRENCY interviews run at once per process; further interviews wait
+# in a bounded queue (their clients get keepalives meanwhile) and are refused once it is full.
+# Sessions live in the memory of one process, so resuming needs the reconnect to reach the same
+# process: run a single instance, or route clients with session affinity. A reconnect for a
+# session this process does not have (pruned, restarted, other instance) gets a 410 and never
+# starts a new interview, whose events would not continue the client's transcript.
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+from interview_simulator import stream_interview
+
+# Finished sessions are dropped this long after their last client read.
+SESSION_TTL_SECONDS = int(os.environ.get("INTERVIEW_SESSION_TTL", "1800"))
+# A running interview without a connected client for this long is stopped.
+SESSION_ABANDON_SECONDS = int(os.environ.get("INTERVIEW_SESSION_ABANDON", "120"))
+# Comment lines keep idle connections alive while a turn is generated.
+KEEPALIVE_SECONDS = 15
+# Interviews generating at the same time, and interviews allowed to wait for a free slot.
+MAX_CONCURRENT_INTERVIEWS = int(os.environ.get("INTERVIEW_MAX_CONCURRENCY", "16"))
+MAX_QUEUED_INTERVIEWS = int(os.environ.get("INTERVIEW_MAX_QUEUED", "32"))
+INTERVIEW_ID_PATTERN = re.compile(r"[A-Za-z0-9-]{8,64}")
+
+_interview_slots = threading.BoundedSemaphore(MAX_CONCURRENT_INTERVIEWS)
+
+
+class SessionRequestError(Exception):
+    """A stream request that cannot be served; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class InterviewSession:
+    """One interview: the events emitted so far, the latest report and the Q&A transcript."""
+
+    def __init__(self, interview_id, patient_name, condition_name):
+        self.interview_id = interview_id
+        self.patient_name = patient_name
+        self.condition_name = condition_name
+        # JSON messages in emission order; the SSE event id of events[i] is i + 1
+        self.events = []
+        self.report = ""
+        self.transcript = []
+        self.done = False
+        self.state = "queued"
+        self.last_access = time.monotonic()
+        self._listeners = 0
+        self._detached_at = time.monotonic()
+        self._condition = threading.Condition()
+        # (event loop, asyncio.Event) of every async reader waiting for new events
+        self._async_waiters = set()
+        self._thread = threading.Thread(target=self._run, name=f"interview-{interview_id[:8]}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _abandoned(self):
+        with self._condition:
+            return self._listeners == 0 and time.monotonic() - self._detached_at > SESSION_ABANDON_SECONDS
+
+    def _notify(self):
+        # Called with self._condition held
+        self._condition.notify_all()
+        for loop, wakeup in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass  # the loop is closed; its reader is gone
+
+    def _attach(self):
+        with self._condition:
+            self._listeners += 1
+
+    def _detach(self):
+        with self._condition:
+            self._listeners -= 1
+            if self._listeners == 0:
+                self._detached_at = time.monotonic()
+
+    def _append(self, message):
+        data = json.loads(message) if message.startswith("{") else {}
+        with self._condition:
+            if data.get("speaker") == "report":
+                self.report = data["text"]
+            elif data.get("speaker") in ("interviewer", "patient"):
+                self.transcript.append((data["speaker"], data["text"]))
+            self.events.append(message)
+            self._notify()
+
+    def _wait_for_slot(self):
+        """Waits for one of the MAX_CONCURRENT_INTERVIEWS slots. False if the client left meanwhile."""
+        while not _interview_slots.acquire(timeout=1):
+            if self._abandoned():
+                return False
+        return True
+
+    def _run(self):
+        if not self._wait_for_slot():
+            logging.info("Dropping queued interview %s: no client for %ds.", self.interview_id, SESSION_ABANDON_SECONDS)
+            with self._condition:
+                self.done = True
+                self.state = "abandoned"
+                self._notify()
+            return
+        with self._condition:
+            self.state = "running"
+        try:
+            self._interview()
+        finally:
+            _interview_slots.release()
+
+    def _interview(self):
+        interview = stream_interview(self.patient_name, self.condition_name)
+        try:
+            for message in interview:
+                self._append(message)
+                if self._abandoned():
+                    logging.info("Stopping interview %s: no client for %ds.", self.interview_id, SESSION_ABANDON_SECONDS)
+                    break
+        except Exception as e:
+            logging.error("Interview %s failed: %s", self.interview_id, e, exc_info=True)
+            self._append(f"Error: {str(e)}")
+        finally:
+            interview.close()
+            with self._condition:
+                self.done = True
+                self.state = "done"
+                self._notify()
+
+    def events_after(self, last_event_id):
+        """
+        Yields (event_id, message) for every event after `last_event_id`, waiting for new ones
+        until the interview is done. Yields None when nothing happened for KEEPALIVE_SECONDS.
+        """
+        self._attach()
+        try:
+            position = last_event_id
+            while True:
+                with self._condition:
+                    if position >= len(self.events) and not self.done:
+                        self._condition.wait(KEEPALIVE_SECONDS)
+                    new_events = self.events[position:]
+                    finished = self.done
+                    self.last_access = time.monotonic()
+                for message in new_events:
+                    position += 1
+                    yield position, message
+                if finished:
+                    return
+                if not new_events:
+                    yield None
+        finally:
+            self._detach()
+
+    async def aevents_after(self, last_event_id):
+        """
+        Async version of events_after for the ASGI server: waiting for the interview thread
+        does not hold a server thread. The caller pulls one event at a time, so a slow client
+        only falls behind in `events`; nothing is buffered per client.
+        """
+        wakeup = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), wakeup)
+        self._attach()
+        with self._condition:
+            self._async_waiters.add(waiter)
+        try:
+            position = last_event_id
+            while True:
+                with self._condition:
+                    wakeup.clear()
+                    new_events = self.events[position:]
+                    finished = self.done
+                    self.last_access = time.monotonic()
+                for message in new_events:
+                    position += 1
+                    yield position, message
+                if finished:
+                    return
+                if not new_events:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield None
+        finally:
+            with self._condition:
+                self._async_waiters.discard(waiter)
+            self._detach()
+
+    def is_complete_for(self, last_event_id):
+        """Whether a client that received `last_event_id` has everything there will ever be."""
+        with self._condition:
+            return self.done and last_event_id >= len(self.events)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def _prune_sessions():
+    now = time.monotonic()
+    for interview_id, session in list(_sessions.items()):
+        if session.done and now - session.last_access > SESSION_TTL_SECONDS:
+            del _sessions[interview_id]
+
+def get_or_start_session(interview_id, patient_name, condition_name, last_event_id=0):
+    """
+    Returns the session for `interview_id`, starting its interview if it does not exist yet.
+    Raises ValueError if the id belongs to an interview with another patient or condition,
+    SessionRequestError (410) if the client resumes after `last_event_id` an interview that
+    does not exist here, and SessionRequestError (503) if MAX_QUEUED_INTERVIEWS interviews
+    already wait for a slot.
+    """
+    with _sessions_lock:
+        _prune_sessions()
+        session = _sessions.get(interview_id)
+        if session is None and last_event_id > 0:
+            raise SessionRequestError(f"Interview {interview_id} is no longer available, start a new interview", 410)
+        if session is None:
+            queued = sum(1 for s in _sessions.values() if s.state == "queued")
+            if queued >= MAX_QUEUED_INTERVIEWS:
+                raise SessionRequestError("Too many interviews in progress, try again later", 503)
+            session = _sessions[interview_id] = InterviewSession(interview_id, patient_name, condition_name).start()
+        elif (session.patient_name, session.condition_name) != (patient_name, condition_name):
+            raise ValueError(f"Interview {interview_id} is for another patient or condition")
+        return session
+
+def session_for_request(params, headers):
+    """
+    Resolves a /api/stream_conversation request, given its query parameters and headers as
+    mappings, to (session, last_event_id). Raises SessionRequestError for invalid requests.
+    """
+    patient = params.get("patient", "Patient")
+    condition = params.get("condition", "unknown condition")
+    interview_id = params.get("interview_id") or uuid.uuid4().hex
+    if not INTERVIEW_ID_PATTERN.fullmatch(interview_id):
+        raise SessionRequestError("Invalid interview_id", 400)
+    last_event_id = headers.get("Last-Event-ID") or params.get("last_event_id") or "0"
+    last_event_id = int(last_event_id) if last_event_id.isdigit() else 0
+    try:
+        return get_or_start_session(interview_id, patient, condition, last_event_id), last_event_id
+    except ValueError as e:
+        raise SessionRequestError(str(e), 409) from e
+
+def sse_event(event):
+    """Formats an item of events_after/aevents_after as SSE: a message with its id, or a keepalive comment."""
+    if event is None:
+        return ": keepalive\n\n"
+    event_id, message = event
+    return f"id: {event_id}\ndata: {message}\n\n"
+
+def session_stats():
+    """Numbers of interview sessions per state, and the configured limits."""
+    with _sessions_lock:
+        states = [session.state for session in _sessions.values()]
+    return {
+        "max_concurrent": MAX_CONCURRENT_INTERVIEWS,
+        "max_queued": MAX_QUEUED_INTERVIEWS,
+        **{state: states.count(state) for state in ("queued", "running", "done", "abandoned")},
+    }
@@ -16,12 +16,50 @@ import json
 import re
 import os
 import base64
-
+import contextvars
+import hashlib
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cache import cache
 from gemini import gemini_get_text_response
-from medgemma import medgemma_get_text_response
-from gemini_tts import synthesize_gemini_tts
+from medgemma import ThinkingStreamFilter, medgemma_get_text_response, medgemma_stream_text_response
+from gemini_tts import split_tts_chunks, synthesize_gemini_tts, tts_cache_key
+from audio_store import register_audio
+from fhir_compact import compact_fhir_text
+from report_builder import clean_report_text, is_full_rewrite_turn, read_report_template, write_report_delta
+from telemetry import stage_span, start_interview_timings
 
 INTERVIEWER_VOICE = "Aoede"
+INTERVIEWER_TTS_INSTRUCTION = "Speak in a slightly upbeat and brisk manner, as a friendly clinician: "
+PATIENT_TTS_INSTRUCTION = "Say this in faster speed, using a sick tone: "
+NUMBER_OF_QUESTIONS_LIMIT = 30
+
+# Pipelined mode overlaps TTS, patient replies and report rewrites within each turn.
+PIPELINE_INTERVIEW = os.environ.get("PIPELINE_INTERVIEW", "true").lower() == "true"
+# Shared by all interviews in this process, so it bounds the outbound LLM/TTS calls.
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", "16"))
+_pipeline_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="interview-pipeline")
+
+def _submit(fn, *args):
+    # Runs fn on the pipeline executor in a copy of the caller's context, so its telemetry
+    # spans count towards the interview that submitted it
+    return _pipeline_executor.submit(contextvars.copy_context().run, fn, *args)
+# Stream interviewer questions token by token as "interviewer partial" messages.
+STREAM_INTERVIEWER = os.environ.get("STREAM_INTERVIEWER", "true").lower() == "true"
+# Synthesize speech sentence by sentence and send the audio as ordered "audio chunk" messages.
+TTS_CHUNKED = os.environ.get("TTS_CHUNKED", "false").lower() == "true"
+# Send audio as /api/audio/<id> URLs instead of inlining it as base64 data URIs.
+AUDIO_URLS = os.environ.get("AUDIO_URLS", "true").lower() == "true"
+# Start the next interviewer question as soon as the patient's answer is known, while the
+# answer is still being spoken and the report is updated.
+SPECULATIVE_PREFETCH = os.environ.get("SPECULATIVE_PREFETCH", "true").lower() == "true"
+# Summarize every patient's EHR in the background at startup, see start_ehr_warmup.
+EHR_WARMUP = os.environ.get("EHR_WARMUP", "true").lower() == "true"
+# Send MedGemma a compact digest of the clinical facts instead of the raw FHIR JSON.
+FHIR_COMPACT = os.environ.get("FHIR_COMPACT", "true").lower() == "true"
 
 def read_symptoms_json():
     # Load the list of symptoms for each condition from a JSON file
@@ -42,19 +80,31 @@ def read_fhir_json(patient):
     with open(os.path.join(os.environ.get("FRONTEND_BUILD", "frontend/build"), patient["fhirFile"].lstrip("/")), 'r') as f:
         return json.load(f)
 
-def get_ehr_summary_per_patient(patient_name):
-    # Returns a concise EHR summary for the patient, using LLM if not already cached
-    patient = get_patient(patient_name)
-    if patient.get("ehr_summary"):
-        return patient["ehr_summary"]
+def fhir_file_hash(patient):
+    # Identifies the content of a patient's FHIR file, so summaries are recomputed when it changes
+    with open(os.path.join(os.environ.get("FRONTEND_BUILD", "frontend/build"), patient["fhirFile"].lstrip("/")), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def ehr_prompt_text(patient):
+    # The EHR as sent to MedGemma: the compacted digest, or the raw FHIR JSON with FHIR_COMPACT off
+    fhir = read_fhir_json(patient)
+    if FHIR_COMPACT:
+        return compact_fhir_text(fhir, label=patient["name"])
+    return json.dumps(fhir)
+
+def summarize_ehr(patient):
     # Use MedGemma to summarize the EHR for the patient
-    ehr_summary = medgemma_get_text_response([
+    with stage_span("ehr_summary", patient=patient["name"]):
+        return _summarize_ehr(patient)
+
+def _summarize_ehr(patient):
+    return medgemma_get_text_response([
         {
             "role": "system",
             "content": [
                 {
                     "type": "text",
-                    "text": f"""You are a medical assistant summarizing the EHR (FHIR) records for the patient {patient_name}.
+                    "text": f"""You are a medical assistant summarizing the EHR (FHIR) records for the patient {patient["name"]}.
                     Provide a concise summary of the patient's medical history, including any existing conditions, medications, and relevant past treatments.
                     Do not include personal opinions or assumptions, only factual information."""
                 }
@@ -65,16 +115,58 @@ def get_ehr_summary_per_patient(patient_name):
             "content": [
                 {
                     "type": "text",
-                    "text": json.dumps(read_fhir_json(patient))
+                    "text": ehr_prompt_text(patient)
                 }
             ]
         }
     ])
-    patient["ehr_summary"] = ehr_summary
-    return ehr_summary
+
+def get_ehr_summary_per_patient(patient_name):
+    """
+    Returns a concise EHR summary for the patient. Summaries are kept in memory and persisted in
+    the cache keyed by the FHIR file hash, so MedGemma is only asked once per FHIR file version.
+    Concurrent callers for the same patient wait for a single summarization.
+    """
+    ehr_summary = _ehr_summaries.get(patient_name)
+    if ehr_summary:
+        return ehr_summary
+    patient = get_patient(patient_name)
+    with _ehr_summary_locks[patient_name]:
+        ehr_summary = _ehr_summaries.get(patient_name)
+        if ehr_summary:
+            return ehr_summary
+        key = ("ehr-summary", patient_name, fhir_file_hash(patient)) + (("compact",) if FHIR_COMPACT else ())
+        ehr_summary = cache.get(key)
+        if not ehr_summary:
+            ehr_summary = summarize_ehr(patient)
+            cache.set(key, ehr_summary)
+        _ehr_summaries[patient_name] = ehr_summary
+        return ehr_summary
+
+def warm_up_ehr_summaries(max_workers=None):
+    """Summarizes the EHR of all patients concurrently. Failures are logged and retried lazily on first use."""
+    with ThreadPoolExecutor(max_workers=max_workers or len(PATIENTS), thread_name_prefix="ehr-warmup") as executor:
+        futures = {executor.submit(get_ehr_summary_per_patient, p["name"]): p["name"] for p in PATIENTS}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logging.error("EHR summary warm-up failed for %s: %s", futures[future], e)
+    logging.info("EHR summary warm-up done: %d of %d patients ready.", len(_ehr_summaries), len(PATIENTS))
+
+def start_ehr_warmup():
+    """Starts warm_up_ehr_summaries on a background thread, unless EHR_WARMUP is disabled."""
+    if EHR_WARMUP:
+        threading.Thread(target=warm_up_ehr_summaries, name="ehr-warmup", daemon=True).start()
+
+def pending_ehr_summaries():
+    """Names of the patients whose EHR summary is not ready yet; empty once the app is warm."""
+    return [p["name"] for p in PATIENTS if p["name"] not in _ehr_summaries]
 
 PATIENTS = read_patient_and_conditions_json()["patients"]
 SYMPTOMS = read_symptoms_json()
+_ehr_summaries = {}
+_ehr_summary_locks = {p["name"]: threading.Lock() for p in PATIENTS}
    
 def patient_roleplay_instructions(patient_name, condition_name, previous_answers):
     """
@@ -112,7 +204,7 @@ def patient_roleplay_instructions(patient_name, condition_name, previous_answers
         - **Answer Only What Is Asked:** Do not volunteer your entire list of symptoms at once. Respond naturally to the specific question asked by the interviewer.
 
         ### Your previous health history ###
-        {patient["ehr_summary"]}
+        {get_ehr_summary_per_patient(patient_name)}
 
         ### Your previous answers ###
         ---
@@ -213,8 +305,7 @@ def write_report(patient_name: str, interview_text: str, existing_report: str =
 
     # If no existing report is provided, load a default template from a string.
     if not existing_report:
-        with open("report_template.txt", 'r') as f:
-            existing_report = f.read()
+        existing_report = read_report_template()
 
     # Construct the user prompt with the specific task and data
     user_prompt = f"""<interview_start>
@@ -254,22 +345,224 @@ Now, generate the complete and updated medical report based on all system and us
         }
     ]
 
-    report = medgemma_get_text_response(messages)
-    cleaned_report = re.sub(r'<unused94>.*?</unused95>', '', report, flags=re.DOTALL)
-    cleaned_report = cleaned_report.strip()
+    return clean_report_text(medgemma_get_text_response(messages))
 
-    # The LLM sometimes wraps the markdown report in a markdown code block.
-    # This regex checks if the entire string is a code block and extracts the content.
-    match = re.match(r'^\s*```(?:markdown)?\s*(.*?)\s*```\s*$', cleaned_report, re.DOTALL | re.IGNORECASE)
-    if match:
-        cleaned_report = match.group(1)
+def update_report(patient_name: str, turn_number: int, most_recent_q_a: str,
+                  full_interview_q_a_with_new_q_a: str, existing_report: str) -> str:
+    """
+    Updates the report after Q&A number `turn_number` (1-based). Depending on REPORT_MODE this is
+    either a full rewrite or a section-level delta that only carries the newest Q&A. A delta that
+    cannot be merged into the report falls back to a full rewrite.
+    """
+    full_rewrite = is_full_rewrite_turn(turn_number)
+    with stage_span("report_update", mode="full" if full_rewrite else "delta", turn=turn_number) as span:
+        if not full_rewrite:
+            report = write_report_delta(most_recent_q_a, existing_report)
+            if report is not None:
+                return report
+            span.attributes["mode"] = "delta+full"
+        return write_report(patient_name, full_interview_q_a_with_new_q_a, existing_report)
+
+def finalize_report(patient_name: str, turn_count: int, full_interview_q_a: str, existing_report: str):
+    """
+    Returns a final full rewrite of an incrementally built report, or None when the last
+    update was already a full rewrite.
+    """
+    if turn_count == 0 or is_full_rewrite_turn(turn_count):
+        return None
+    with stage_span("report_update", mode="final", turn=turn_count):
+        return write_report(patient_name, full_interview_q_a, existing_report)
+
+
+def get_interviewer_question(dialog):
+    """Asks MedGemma for the next interviewer turn given the dialog so far."""
+    return medgemma_get_text_response(
+        messages=dialog,
+        temperature=0.1,
+        max_tokens=2048,
+        stream=False
+    )
+
+def stream_interviewer_question(dialog):
+    """
+    Streaming variant of get_interviewer_question. Yields the visible (non-thinking) text as it
+    arrives and returns the full raw question text, thinking included.
+    """
+    thinking_filter = ThinkingStreamFilter()
+    raw_chunks = []
+    for chunk in medgemma_stream_text_response(dialog, temperature=0.1, max_tokens=2048):
+        raw_chunks.append(chunk)
+        visible = thinking_filter.feed(chunk)
+        if visible:
+            yield visible
+    visible = thinking_filter.flush()
+    if visible:
+        yield visible
+    return "".join(raw_chunks)
+
+def partial_interviewer_message(text):
+    return json.dumps({
+        "speaker": "interviewer partial",
+        "text": text
+    })
+
+def interviewer_question_messages(dialog):
+    """Yields "interviewer partial" messages while the next question streams in. Returns the full question text."""
+    with stage_span("question", streamed=STREAM_INTERVIEWER, turn=(len(dialog) - 1) // 2 + 1):
+        if not STREAM_INTERVIEWER:
+            return get_interviewer_question(dialog)
+        stream = stream_interviewer_question(dialog)
+        while True:
+            try:
+                yield partial_interviewer_message(next(stream))
+            except StopIteration as stop:
+                return stop.value
+
+def _produce_question_messages(dialog, messages: queue.Queue):
+    # Runs on the pipeline executor and hands the streamed question over to the SSE generator
+    try:
+        stream = interviewer_question_messages(dialog)
+        while True:
+            try:
+                messages.put(("partial", next(stream)))
+            except StopIteration as stop:
+                messages.put(("done", stop.value))
+                return
+    except Exception as e:
+        messages.put(("error", e))
+        raise
+
+def _consume_question_messages(messages: queue.Queue):
+    """Re-yields the messages queued by _produce_question_messages. Returns the full question text."""
+    while True:
+        kind, value = messages.get()
+        if kind == "partial":
+            yield value
+        elif kind == "done":
+            return value
+        else:
+            raise value
+
+def prefetch_interviewer_question(dialog, submit=_submit):
+    """
+    Starts generating the next question for a snapshot of `dialog` in the background.
+    Returns a tuple: (future, message_queue); pass the queue to _consume_question_messages.
+    """
+    messages = queue.Queue()
+    return submit(_produce_question_messages, list(dialog), messages), messages
 
-    return cleaned_report.strip()
+def split_thinking(text):
+    """Splits an optional "<unused94>...<unused95>" thinking block from the LLM output.
+    Returns a tuple: (thinking_text or None, text_without_thinking).
+    """
+    thinking_search = re.search('<unused94>(.+?)<unused95>', text, re.DOTALL)
+    if not thinking_search:
+        return None, text
+    thinking_text = thinking_search.group(1)
+    return thinking_text, text.replace(f'<unused94>{thinking_text}<unused95>', "")
+
+def summarize_thinking(thinking_text):
+    # Condense the interviewer's reasoning into a short first-person summary for display
+    with stage_span("thinking_summary"):
+        return gemini_get_text_response(
+            f"""Provide a summary of up to 100 words containing only the reasoning and planning from this text,
+                    do not include instructions, use first person: {thinking_text}""")
 
+def get_patient_response(patient_name, condition_name, full_interview_q_a, interviewer_question_text):
+    # Get the patient's response from Gemini (roleplay LLM)
+    with stage_span("patient_reply"):
+        return gemini_get_text_response(f"""
+        {patient_roleplay_instructions(patient_name, condition_name, full_interview_q_a)}\n\n
+        Question: {interviewer_question_text}""")
 
+def audio_data_uri(audio_data, mime_type):
+    """Encodes synthesized audio as a data URI, or returns None if no audio is available."""
+    if audio_data and mime_type:
+        return f"data:{mime_type};base64,{base64.b64encode(audio_data).decode('utf-8')}"
+    return None
+
+def synthesize_speech(tts_text, voice):
+    """Synthesizes speech and returns its audio URL (or data URI without AUDIO_URLS), or None."""
+    with stage_span("tts", voice=voice, chars=len(tts_text)) as span:
+        audio_data, mime_type = synthesize_gemini_tts(tts_text, voice)
+        span.attributes["bytes"] = len(audio_data or b"")
+    if not AUDIO_URLS:
+        return audio_data_uri(audio_data, mime_type)
+    if not audio_data:
+        return None
+    return register_audio(tts_cache_key(tts_text, voice))
+
+def start_speech(instruction, text, voice, submit=_submit):
+    """
+    Starts Gemini TTS for `text` in the background. Returns a future for the whole utterance or,
+    with TTS_CHUNKED, a list of futures with one per sentence chunk, synthesized concurrently.
+    Every chunk is synthesized (and cached) like a standalone utterance.
+    """
+    if TTS_CHUNKED:
+        return [submit(synthesize_speech, f"{instruction}{chunk}", voice) for chunk in split_tts_chunks(text)]
+    return submit(synthesize_speech, f"{instruction}{text}", voice)
 
-def stream_interview(patient_name, condition_name):
-    print(f"Starting interview simulation for patient: {patient_name}, condition: {condition_name}")
+def speech_messages(speaker, text, speech):
+    """
+    Yields the message for `speaker` once its audio from start_speech is ready. Chunked speech
+    yields the text right away, followed by one "audio chunk" message per chunk, in order.
+    """
+    if isinstance(speech, list):
+        yield json.dumps({
+            "speaker": speaker,
+            "text": text,
+            "audio": None,
+            "audio_chunks": len(speech)
+        })
+        for index, future in enumerate(speech):
+            yield json.dumps({
+                "speaker": "audio chunk",
+                "for": speaker,
+                "index": index,
+                "count": len(speech),
+                "audio": future.result()
+            })
+    else:
+        yield json.dumps({
+            "speaker": speaker,
+            "text": text,
+            "audio": speech.result()
+        })
+
+
+def stream_interview(patient_name, condition_name, pipelined=None):
+    """
+    Simulates the interview and yields JSON messages (thinking, interviewer, patient, report,
+    timings, end).
+    With STREAM_INTERVIEWER, each question is preceded by "interviewer partial" messages carrying
+    the text as it streams in from MedGemma.
+    When pipelined (the default, see PIPELINE_INTERVIEW), independent steps of each turn run
+    concurrently while the messages are still yielded in the same order as the sequential loop.
+    The "timings" event before "end" holds the time spent per stage, see telemetry.
+    """
+    # The interview runs in its own context, which carries its timings to every stage span
+    context = contextvars.copy_context()
+    timings = context.run(start_interview_timings, patient_name, condition_name)
+    interview = _interview_messages(patient_name, condition_name, pipelined)
+    try:
+        while True:
+            try:
+                message = context.run(next, interview)
+            except StopIteration:
+                break
+            yield message
+    finally:
+        context.run(interview.close)
+        summary = timings.summary()
+    yield json.dumps({"event": "timings", **summary})
+    # Add this at the end to signal end of stream
+    yield json.dumps({"event": "end"})
+
+def _interview_messages(patient_name, condition_name, pipelined):
+    # The messages of stream_interview up to the last report
+    if pipelined is None:
+        pipelined = PIPELINE_INTERVIEW
+    print(f"Starting interview simulation for patient: {patient_name}, condition: {condition_name} (pipelined={pipelined})")
     # Prepare roleplay instructions and initial dialog (using existing helper functions)
     interviewer_instructions = interviewer_roleplay_instructions(patient_name)
     
@@ -297,96 +590,190 @@ def stream_interview(patient_name, condition_name):
             ]
         }
     ]
-    
+
+    turns = _pipelined_turns if pipelined else _sequential_turns
+    full_interview_q_a = yield from turns(patient_name, condition_name, patient_voice, dialog)
+
+    print(f"""Interview simulation completed for patient: {patient_name}, condition: {condition_name}.
+          Patient profile used:
+          {patient_roleplay_instructions(patient_name, condition_name, full_interview_q_a)}""")
+
+def _sequential_turns(patient_name, condition_name, patient_voice, dialog):
+    """
+    Runs every step of every turn one after another, except that with SPECULATIVE_PREFETCH the
+    next question is generated while the patient's answer is spoken and the report is updated.
+    Returns the full Q&A transcript.
+    """
     write_report_text = ""
     full_interview_q_a = ""
-    number_of_questions_limit = 30
-    for i in range(number_of_questions_limit):
-        # Get the next interviewer question from MedGemma
-        interviewer_question_text = medgemma_get_text_response(
-            messages=dialog,
-            temperature=0.1,
-            max_tokens=2048,
-            stream=False
-        )
-        # Process optional "thinking" text (if present in the LLM output)
-        thinking_search = re.search('<unused94>(.+?)<unused95>', interviewer_question_text, re.DOTALL)
-        if thinking_search:
-            thinking_text = thinking_search.group(1)
-            interviewer_question_text = interviewer_question_text.replace(f'<unused94>{thinking_text}<unused95>', "")
-            if i == 0:
+    turn_count = 0
+    # The next question, prefetched for this session: (future, message_queue) or None
+    next_question = None
+    try:
+        for i in range(NUMBER_OF_QUESTIONS_LIMIT):
+            if next_question is not None:
+                interviewer_question_text = yield from _consume_question_messages(next_question[1])
+                next_question = None
+            else:
+                # Get the next interviewer question from MedGemma
+                interviewer_question_text = yield from interviewer_question_messages(dialog)
+            # Process optional "thinking" text (if present in the LLM output)
+            thinking_text, interviewer_question_text = split_thinking(interviewer_question_text)
+            if thinking_text and i == 0:
                 # Only yield the "thinking" summary for the first question
-                thinking_text = gemini_get_text_response(
-                    f"""Provide a summary of up to 100 words containing only the reasoning and planning from this text,
-                    do not include instructions, use first person: {thinking_text}""")
                 yield json.dumps({
-                        "speaker": "interviewer thinking",
-                    "text": thinking_text
+                    "speaker": "interviewer thinking",
+                    "text": summarize_thinking(thinking_text)
                 })
 
-        # Clean up the text for TTS and display
-        clean_interviewer_text = interviewer_question_text.replace("End interview.", "").strip()
-
-        # Generate audio for the interviewer's question using Gemini TTS
-        audio_data, mime_type = synthesize_gemini_tts(f"Speak in a slightly upbeat and brisk manner, as a friendly clinician: {clean_interviewer_text}", INTERVIEWER_VOICE)
-        audio_b64 = None
-        if audio_data and mime_type:
-            audio_b64 = f"data:{mime_type};base64,{base64.b64encode(audio_data).decode('utf-8')}"
+            # Clean up the text for TTS and display
+            clean_interviewer_text = interviewer_question_text.replace("End interview.", "").strip()
 
-        # Yield interviewer message (text and audio)
-        yield json.dumps({
-            "speaker": "interviewer",
-            "text": clean_interviewer_text,
-            "audio": audio_b64
-        })
-        dialog.append({
-            "role": "assistant",
-            "content": [{
-                "type": "text",
-                "text": interviewer_question_text
-            }]
-        })
-        if "End interview" in interviewer_question_text:
-            # End the interview loop if the LLM signals completion
-            break
-
-        # Get the patient's response from Gemini (roleplay LLM)
-        patient_response_text = gemini_get_text_response(f"""
-        {patient_roleplay_instructions(patient_name, condition_name, full_interview_q_a)}\n\n
-        Question: {interviewer_question_text}""")
-
-        # Generate audio for the patient's response
-        audio_data, mime_type = synthesize_gemini_tts(f"Say this in faster speed, using a sick tone: {patient_response_text}", patient_voice)
-        audio_b64 = None
-        if audio_data and mime_type:
-            audio_b64 = f"data:{mime_type};base64,{base64.b64encode(audio_data).decode('utf-8')}"
-
-        # Yield patient message (text and audio)
-        yield json.dumps({
-            "speaker": "patient",
-            "text": patient_response_text,
-            "audio": audio_b64
-        })
-        dialog.append({
-            "role": "user",
-            "content": [{
-                "type": "text",
-                "text": patient_response_text
-            }]
-        })
-        # Track the full Q&A for context in future LLM calls
-        most_recent_q_a = f"Q: {interviewer_question_text}\nA: {patient_response_text}\n"
-        full_interview_q_a_with_new_q_a = "PREVIOUS Q&A:\n" + full_interview_q_a + "\nNEW Q&A:\n" + most_recent_q_a
-        # Update the report after each Q&A
-        write_report_text = write_report(patient_name, full_interview_q_a_with_new_q_a, write_report_text)
-        full_interview_q_a += most_recent_q_a
-        yield json.dumps({
-            "speaker": "report",
-            "text": write_report_text
-        })
+            # Yield interviewer message (text and audio)
+            yield from speech_messages("interviewer", clean_interviewer_text,
+                                       start_speech(INTERVIEWER_TTS_INSTRUCTION, clean_interviewer_text, INTERVIEWER_VOICE))
+            dialog.append({
+                "role": "assistant",
+                "content": [{
+                    "type": "text",
+                    "text": interviewer_question_text
+                }]
+            })
+            if "End interview" in interviewer_question_text:
+                # End the interview loop if the LLM signals completion
+                break
+
+            patient_response_text = get_patient_response(patient_name, condition_name, full_interview_q_a, interviewer_question_text)
+            dialog.append({
+                "role": "user",
+                "content": [{
+                    "type": "text",
+                    "text": patient_response_text
+                }]
+            })
+            if SPECULATIVE_PREFETCH and i + 1 < NUMBER_OF_QUESTIONS_LIMIT:
+                # The next question only depends on the dialog, which is complete now
+                next_question = prefetch_interviewer_question(dialog)
+
+            # Yield patient message (text and audio)
+            yield from speech_messages("patient", patient_response_text,
+                                       start_speech(PATIENT_TTS_INSTRUCTION, patient_response_text, patient_voice))
+            # Track the full Q&A for context in future LLM calls
+            most_recent_q_a = f"Q: {interviewer_question_text}\nA: {patient_response_text}\n"
+            full_interview_q_a_with_new_q_a = "PREVIOUS Q&A:\n" + full_interview_q_a + "\nNEW Q&A:\n" + most_recent_q_a
+            # Update the report after each Q&A
+            write_report_text = update_report(patient_name, i + 1, most_recent_q_a,
+                                              full_interview_q_a_with_new_q_a, write_report_text)
+            full_interview_q_a += most_recent_q_a
+            turn_count = i + 1
+            yield json.dumps({
+                "speaker": "report",
+                "text": write_report_text
+            })
+
+        final_report = finalize_report(patient_name, turn_count, full_interview_q_a, write_report_text)
+        if final_report:
+            yield json.dumps({
+                "speaker": "report",
+                "text": final_report
+            })
+    finally:
+        # The client may disconnect mid-interview; drop a prefetch that has not started yet
+        if next_question is not None:
+            next_question[0].cancel()
+    return full_interview_q_a
+
+def _pipelined_turns(patient_name, condition_name, patient_voice, dialog):
+    """
+    Same turns and message order as _sequential_turns, but overlaps independent work:
+    the interviewer TTS runs alongside the patient reply, and the patient TTS and the
+    report rewrite run alongside the next interviewer question (with SPECULATIVE_PREFETCH).
+    Returns the full Q&A transcript.
+    """
+    write_report_text = ""
+    full_interview_q_a = ""
+    turn_count = 0
+    pending = []
+
+    def submit(fn, *args):
+        future = _submit(fn, *args)
+        pending.append(future)
+        return future
+
+    try:
+        # The question is generated from a snapshot of the dialog, which keeps growing meanwhile.
+        # Partial question messages are queued and only yielded once it is the question's turn.
+        question_messages = None
+        for i in range(NUMBER_OF_QUESTIONS_LIMIT):
+            if question_messages is None:
+                _, question_messages = prefetch_interviewer_question(dialog, submit)
+            interviewer_question_text = yield from _consume_question_messages(question_messages)
+            question_messages = None
+            thinking_text, interviewer_question_text = split_thinking(interviewer_question_text)
+            thinking_future = None
+            if thinking_text and i == 0:
+                # Only yield the "thinking" summary for the first question
+                thinking_future = submit(summarize_thinking, thinking_text)
 
-    print(f"""Interview simulation completed for patient: {patient_name}, condition: {condition_name}.
-          Patient profile used:
-          {patient_roleplay_instructions(patient_name, condition_name, full_interview_q_a)}""")
-    # Add this at the end to signal end of stream
-    yield json.dumps({"event": "end"})
\ No newline at end of file
+            clean_interviewer_text = interviewer_question_text.replace("End interview.", "").strip()
+            interviewer_speech = start_speech(INTERVIEWER_TTS_INSTRUCTION, clean_interviewer_text, INTERVIEWER_VOICE, submit)
+            dialog.append({
+                "role": "assistant",
+                "content": [{
+                    "type": "text",
+                    "text": interviewer_question_text
+                }]
+            })
+            interview_ended = "End interview" in interviewer_question_text
+            if not interview_ended:
+                # The patient answers while the question is still being spoken
+                patient_future = submit(get_patient_response, patient_name, condition_name,
+                                        full_interview_q_a, interviewer_question_text)
+
+            if thinking_future:
+                yield json.dumps({
+                    "speaker": "interviewer thinking",
+                    "text": thinking_future.result()
+                })
+            yield from speech_messages("interviewer", clean_interviewer_text, interviewer_speech)
+            if interview_ended:
+                break
+
+            patient_response_text = patient_future.result()
+            patient_speech = start_speech(PATIENT_TTS_INSTRUCTION, patient_response_text, patient_voice, submit)
+            dialog.append({
+                "role": "user",
+                "content": [{
+                    "type": "text",
+                    "text": patient_response_text
+                }]
+            })
+            most_recent_q_a = f"Q: {interviewer_question_text}\nA: {patient_response_text}\n"
+            full_interview_q_a_with_new_q_a = "PREVIOUS Q&A:\n" + full_interview_q_a + "\nNEW Q&A:\n" + most_recent_q_a
+            report_future = submit(update_report, patient_name, i + 1, most_recent_q_a,
+                                   full_interview_q_a_with_new_q_a, write_report_text)
+            full_interview_q_a += most_recent_q_a
+            turn_count = i + 1
+            if SPECULATIVE_PREFETCH and i + 1 < NUMBER_OF_QUESTIONS_LIMIT:
+                # Everything the next question needs is known now, so start it right away
+                _, question_messages = prefetch_interviewer_question(dialog, submit)
+
+            yield from speech_messages("patient", patient_response_text, patient_speech)
+            write_report_text = report_future.result()
+            yield json.dumps({
+                "speaker": "report",
+                "text": write_report_text
+            })
+            pending = [f for f in pending if not f.done()]
+
+        final_report = finalize_report(patient_name, turn_count, full_interview_q_a, write_report_text)
+        if final_report:
+            yield json.dumps({
+                "speaker": "report",
+                "text": final_report
+            })
+    finally:
+        # The client may disconnect mid-interview; drop work that has not started yet
+        for future in pending:
+            future.cancel()
+    return full_interview_q_a
@@ -0,0 +1,172 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Shared HTTP layer for the LLM endpoints (Gemini, MedGemma).
+# One pooled requests.Session per endpoint keeps TLS connections alive across calls and
+# threads, a semaphore caps the number of in-flight calls per endpoint, and 429/5xx
+# responses are retried with jittered exponential backoff.
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("llm_client")
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+MAX_BACKOFF_SECONDS = 30.0
+
+
+class LLMRequestError(Exception):
+    """Raised when an LLM endpoint call fails after all retries."""
+    pass
+
+
+class EndpointClient:
+    """A pooled, rate-limited HTTP client for a single LLM endpoint. Safe to share across threads."""
+
+    def __init__(self, name: str, max_concurrency: int = 8, timeout: float = 60,
+                 max_retries: int = 3, backoff_base: float = 0.5):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def _backoff(self, attempt: int, response: requests.Response | None) -> float:
+        # Honor Retry-After when the server sends seconds, otherwise full-jitter exponential backoff
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), MAX_BACKOFF_SECONDS)
+        return random.uniform(0, min(MAX_BACKOFF_SECONDS, self.backoff_base * (2 ** attempt)))
+
+    def post_json(self, url: str, payload: dict, headers: dict | None = None) -> dict:
+        """
+        POSTs `payload` as JSON and returns the decoded JSON response.
+        Retries on connection errors, timeouts and 429/5xx responses. Raises LLMRequestError
+        once retries are exhausted, or requests.HTTPError for other non-2xx responses.
+        """
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            response = None
+            error = None
+            with self._semaphore:
+                try:
+                    response = self._session.post(url, headers=headers, json=payload, timeout=self.timeout)
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        response.raise_for_status()
+                        try:
+                            data = response.json()
+                        except requests.exceptions.JSONDecodeError:
+                            # Log the problematic response for easier debugging, then let the caller see the error
+                            logger.error("llm_call endpoint=%s status=%s invalid JSON response: %.500s",
+                                         self.name, response.status_code, response.text)
+                            raise
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+            latency_ms = (time.monotonic() - start) * 1000
+            status = response.status_code if response is not None else type(error).__name__
+
+            if error is None and response.status_code not in RETRY_STATUS_CODES:
+                logger.debug("llm_call endpoint=%s status=%s latency_ms=%.0f attempt=%d",
+                             self.name, status, latency_ms, attempt + 1)
+                return data
+
+            if attempt >= self.max_retries:
+                logger.error("llm_call endpoint=%s status=%s latency_ms=%.0f attempt=%d giving up",
+                             self.name, status, latency_ms, attempt + 1)
+                raise LLMRequestError(f"{self.name} request failed after {attempt + 1} attempts: {status}") from error
+
+            delay = self._backoff(attempt, response)
+            logger.warning("llm_call endpoint=%s status=%s latency_ms=%.0f attempt=%d retry_in_s=%.2f",
+                           self.name, status, latency_ms, attempt + 1, delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def stream_sse(self, url: str, payload: dict, headers: dict | None = None):
+        """
+        POSTs `payload` and yields the decoded JSON of every server-sent `data:` event until `[DONE]`.
+        Retries apply only until the response headers arrive; the concurrency slot is held
+        until the stream is exhausted or the generator is closed.
+        """
+        attempt = 0
+        with self._semaphore:
+            while True:
+                start = time.monotonic()
+                response = None
+                error = None
+                try:
+                    response = self._session.post(url, headers=headers, json=payload,
+                                                  timeout=self.timeout, stream=True)
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        response.raise_for_status()
+                        break
+                    response.close()
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+                status = response.status_code if response is not None else type(error).__name__
+                latency_ms = (time.monotonic() - start) * 1000
+                if attempt >= self.max_retries:
+                    logger.error("llm_stream endpoint=%s status=%s latency_ms=%.0f attempt=%d giving up",
+                                 self.name, status, latency_ms, attempt + 1)
+                    raise LLMRequestError(f"{self.name} stream failed after {attempt + 1} attempts: {status}") from error
+                delay = self._backoff(attempt, response)
+                logger.warning("llm_stream endpoint=%s status=%s latency_ms=%.0f attempt=%d retry_in_s=%.2f",
+                               self.name, status, latency_ms, attempt + 1, delay)
+                time.sleep(delay)
+                attempt += 1
+
+            logger.debug("llm_stream endpoint=%s status=%s first_byte_ms=%.0f attempt=%d",
+                         self.name, response.status_code, (time.monotonic() - start) * 1000, attempt + 1)
+            response.encoding = response.encoding or "utf-8"
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    yield json.loads(data)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_endpoint_client(name: str) -> EndpointClient:
+    """
+    Returns the shared client for an endpoint, creating it on first use. Limits are read from
+    <NAME>_MAX_CONCURRENCY, <NAME>_TIMEOUT and <NAME>_MAX_RETRIES (e.g. MEDGEMMA_MAX_CONCURRENCY).
+    """
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            prefix = name.upper()
+            client = EndpointClient(
+                name,
+                max_concurrency=int(os.environ.get(f"{prefix}_MAX_CONCURRENCY", "8")),
+                timeout=float(os.environ.get(f"{prefix}_TIMEOUT", "60")),
+                max_retries=int(os.environ.get(f"{prefix}_MAX_RETRIES", "3")),
+            )
+            _clients[name] = client
+        return client
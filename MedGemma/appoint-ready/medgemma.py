@@ -13,19 +13,34 @@
 # limitations under the License.
 
 # MedGemma endpoint
-import requests
-from auth import create_credentials, get_access_token_refresh_if_needed
+from auth import CredentialManager, create_credentials
+import logging
 import os
-from cache import cache
+import requests
+from cache import ENOVAL, memo_store, memoize
+from fhir_compact import estimate_tokens
+from llm_client import get_endpoint_client
+from telemetry import add_counts
 
 _endpoint_url = os.environ.get('GCP_MEDGEMMA_ENDPOINT')
 
 # Create credentials
 secret_key_json = os.environ.get('GCP_MEDGEMMA_SERVICE_ACCOUNT_KEY')
 medgemma_credentials = create_credentials(secret_key_json)
-print("CREDENTIALS:"+str(medgemma_credentials))
+# Refreshes the access token in the background, ahead of its expiry
+medgemma_credential_manager = CredentialManager(medgemma_credentials, name="medgemma").start()
+
+def _record_usage(usage: dict | None, messages: list, text: str):
+    # Token counts of a call for the current telemetry span, estimated if the endpoint reports none
+    usage = usage or {}
+    prompt_text = "".join(part.get("text", "") if isinstance(part, dict) else str(part)
+                          for message in messages
+                          for part in (message["content"] if isinstance(message["content"], list) else [message["content"]]))
+    add_counts(input_tokens=usage.get("prompt_tokens") or estimate_tokens(prompt_text),
+               output_tokens=usage.get("completion_tokens") or estimate_tokens(text))
+
 # https://cloud.google.com/vertex-ai/docs/reference/rest/v1beta1/projects.locations.endpoints.chat/completions
-@cache.memoize()
+@memoize("medgemma")
 def medgemma_get_text_response(
     messages: list,
     temperature: float = 0.1,
@@ -42,7 +57,7 @@ def medgemma_get_text_response(
     Makes a chat completion request to the configured LLM API (OpenAI-compatible).
     """
     headers = {
-        "Authorization": f"Bearer {get_access_token_refresh_if_needed(medgemma_credentials)}",
+        "Authorization": f"Bearer {medgemma_credential_manager.get_token()}",
         "Content-Type": "application/json",
     }
 
@@ -72,19 +87,117 @@ def medgemma_get_text_response(
     if frequency_penalty is not None: payload["frequency_penalty"] = frequency_penalty
     if presence_penalty is not None: payload["presence_penalty"] = presence_penalty
 
-    print("endpointurl:"+_endpoint_url)
-    print("payload:"+str(payload))
-    print("headers:"+str(headers))
-    
-    response = requests.post(_endpoint_url, headers=headers, json=payload, stream=stream, timeout=60)
+    response_data = get_endpoint_client("medgemma").post_json(_endpoint_url, payload, headers=headers)
+    text = response_data['predictions']["choices"][0]["message"]["content"]
+    _record_usage(response_data['predictions'].get("usage"), messages, text)
+    return text
+
+
+THINKING_START = "<unused94>"
+THINKING_END = "<unused95>"
+
+class ThinkingStreamFilter:
+    """
+    Separates "<unused94>...<unused95>" thinking blocks from streamed text as it arrives.
+    Tags split across chunks are held back until they can be recognized.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._in_thinking = False
+        self.thinking = ""
+
+    def feed(self, chunk: str) -> str:
+        """Consumes a chunk of raw model output and returns the newly visible (non-thinking) text."""
+        self._buffer += chunk
+        visible = []
+        while self._buffer:
+            tag = THINKING_END if self._in_thinking else THINKING_START
+            index = self._buffer.find(tag)
+            if index == -1:
+                # Keep a possible partial tag at the end of the buffer for the next chunk
+                keep = next((n for n in range(len(tag) - 1, 0, -1) if self._buffer.endswith(tag[:n])), 0)
+                text, self._buffer = self._buffer[:len(self._buffer) - keep], self._buffer[len(self._buffer) - keep:]
+                if self._in_thinking:
+                    self.thinking += text
+                else:
+                    visible.append(text)
+                break
+            text, self._buffer = self._buffer[:index], self._buffer[index + len(tag):]
+            if self._in_thinking:
+                self.thinking += text
+            else:
+                visible.append(text)
+            self._in_thinking = not self._in_thinking
+        return "".join(visible)
+
+    def flush(self) -> str:
+        """Returns any held-back text once the stream has ended."""
+        text, self._buffer = self._buffer, ""
+        if self._in_thinking:
+            self.thinking += text
+            return ""
+        return text
+
+def _stream_endpoint_url() -> str:
+    # Streaming uses the streamRawPredict method of the same Vertex AI endpoint unless configured
+    stream_url = os.environ.get('GCP_MEDGEMMA_STREAM_ENDPOINT')
+    if stream_url:
+        return stream_url
+    for method in (":rawPredict", ":predict"):
+        if _endpoint_url.endswith(method):
+            return _endpoint_url[:-len(method)] + ":streamRawPredict"
+    return _endpoint_url
+
+def medgemma_stream_text_response(messages: list, temperature: float = 0.1, max_tokens: int = 4096):
+    """
+    Streaming variant of medgemma_get_text_response. Yields raw text deltas (thinking blocks
+    included, see ThinkingStreamFilter) and returns the full text.
+    The result is stored under the same cache key as the equivalent non-streaming call, and a
+    cache hit is yielded as a single chunk.
+    """
+    cached = medgemma_get_text_response.__cache_lookup__(
+        messages=messages, temperature=temperature, max_tokens=max_tokens, stream=False)
+    if cached is not ENOVAL:
+        yield cached
+        return cached
+
+    headers = {
+        "Authorization": f"Bearer {medgemma_credential_manager.get_token()}",
+        "Content-Type": "application/json",
+    }
+    payload = {
+        "@requestFormat": "chatCompletions",
+        "model": "tgi",
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": True
+    }
+    chunks = []
+    usage = None
     try:
-        response.raise_for_status()
-        response_data = response.json() 
-        print("response_data:" + str(response_data))
-        #return response.json()["choices"][0]["message"]["content"]
-        return response_data['predictions']["choices"][0]["message"]["content"]
-    except requests.exceptions.JSONDecodeError:
-        # Log the problematic response for easier debugging in the future.
-        print(f"Error: Failed to decode JSON from MedGemma. Status: {response.status_code}, Response: {response.text}")
-        # Re-raise the exception so the caller knows something went wrong.
-        raise
+        for event in get_endpoint_client("medgemma").stream_sse(_stream_endpoint_url(), payload, headers=headers):
+            # Vertex AI may wrap the OpenAI-style chunk in "predictions"
+            event = event.get("predictions", event)
+            usage = event.get("usage") or usage
+            for choice in event.get("choices", []):
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    chunks.append(delta)
+                    yield delta
+    except requests.HTTPError as e:
+        if chunks:
+            raise
+        # The endpoint does not support streaming; fall back to a single non-streamed response
+        logging.warning("MedGemma streaming unavailable (%s), falling back to a non-streaming call.", e)
+        text = medgemma_get_text_response(messages=messages, temperature=temperature,
+                                          max_tokens=max_tokens, stream=False)
+        yield text
+        return text
+
+    text = "".join(chunks)
+    _record_usage(usage, messages, text)
+    memo_store(medgemma_get_text_response.__cache_key__(
+        messages=messages, temperature=temperature, max_tokens=max_tokens, stream=False), text)
+    return text
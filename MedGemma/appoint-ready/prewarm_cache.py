@@ -0,0 +1,139 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Headless cache pre-warming: runs the full interview for every patient x condition pair,
+# so every LLM answer, report and speech clip of the demo is in the cache, then writes
+# cache_archive.zip for the Dockerfile to bake into the image.
+#
+#     python prewarm_cache.py --workers 4 --archive cache_archive.zip
+#
+# Run it with the same environment as the deployment (env.list): the cache keys depend on
+# settings such as TTS_CHUNKED and REPORT_MODE. Completed pairs are recorded in a state file,
+# so an interrupted run picks up where it stopped.
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Pre-warming is pointless without generating the speech that is not cached yet
+os.environ.setdefault("GENERATE_SPEECH", "true")
+# The interviews summarize the EHRs they need; no background warm-up in this process
+os.environ.setdefault("EHR_WARMUP", "false")
+
+import cache
+import cache_backends
+import interview_simulator
+from gemini_tts import GENERATE_SPEECH
+
+_print_lock = threading.Lock()
+
+def log(message):
+    with _print_lock:
+        print(message, file=sys.stderr, flush=True)
+
+def load_state(path):
+    """Names of the (patient, condition) pairs completed by earlier runs."""
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {tuple(pair) for pair in json.load(f).get("completed", [])}
+
+def save_state(path, completed):
+    # Written to a temp file and renamed, so an interruption never leaves a truncated state file
+    with open(path + ".tmp", "w") as f:
+        json.dump({"completed": sorted(completed)}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def lacks_audio(message):
+    """Whether a spoken message came without its audio (chunked speech carries it in later messages)."""
+    return "audio" in message and not message["audio"] and "audio_chunks" not in message
+
+def run_interview(patient_name, condition_name):
+    """
+    Consumes a whole interview, which fills the cache. Returns (message_count, seconds).
+    Raises if speech was to be generated but some messages have no audio: failed TTS calls
+    only log and are not cached, so the pair has to run again.
+    """
+    start = time.monotonic()
+    message_count = missing_audio = 0
+    for message in interview_simulator.stream_interview(patient_name, condition_name):
+        message_count += 1
+        missing_audio += lacks_audio(json.loads(message))
+    if GENERATE_SPEECH and missing_audio:
+        raise RuntimeError(f"{missing_audio} of {message_count} messages have no audio")
+    return message_count, time.monotonic() - start
+
+def write_archive(path):
+    """Writes a full cache archive to `path` (via a temp file, so a partial archive is never left behind)."""
+    with open(path + ".tmp", "wb") as f:
+        for chunk in cache.stream_cache_archive():
+            f.write(chunk)
+    os.replace(path + ".tmp", path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-warm the cache with every patient x condition interview.")
+    parser.add_argument("--workers", type=int, default=2, help="Interviews run in parallel (default 2).")
+    parser.add_argument("--patients", nargs="*", help="Only these patients (default: all).")
+    parser.add_argument("--conditions", nargs="*", help="Only these conditions (default: all in symptoms.json).")
+    parser.add_argument("--state", default=os.path.join(cache.CACHE_DIR, "prewarm_state.json"),
+                        help="Progress file used to resume (default: CACHE_DIR/prewarm_state.json).")
+    parser.add_argument("--restart", action="store_true", help="Ignore the progress of earlier runs.")
+    parser.add_argument("--archive", default="cache_archive.zip",
+                        help="Where to write the cache archive (default: cache_archive.zip, empty to skip).")
+    args = parser.parse_args()
+
+    patients = args.patients or [p["name"] for p in interview_simulator.PATIENTS]
+    conditions = args.conditions or list(interview_simulator.SYMPTOMS)
+    pairs = [(patient, condition) for patient in patients for condition in conditions]
+    completed = set() if args.restart else load_state(args.state)
+    todo = [pair for pair in pairs if pair not in completed]
+    log(f"{len(pairs)} interviews, {len(pairs) - len(todo)} already done, {len(todo)} to run with {args.workers} workers.")
+
+    failures = 0
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix="prewarm") as executor:
+        futures = {executor.submit(run_interview, *pair): pair for pair in todo}
+        for done, future in enumerate(as_completed(futures), start=1):
+            patient_name, condition_name = futures[future]
+            try:
+                message_count, seconds = future.result()
+            except Exception as e:
+                failures += 1
+                log(f"[{done}/{len(todo)}] {patient_name} x {condition_name} FAILED: {e}")
+                continue
+            completed.add((patient_name, condition_name))
+            save_state(args.state, completed)
+            elapsed = time.monotonic() - start
+            eta = elapsed / done * (len(todo) - done)
+            log(f"[{done}/{len(todo)}] {patient_name} x {condition_name}: {message_count} messages in {seconds:.1f}s"
+                f" (elapsed {elapsed:.0f}s, eta {eta:.0f}s)")
+
+    # Make sure results queued for the shared cache tier are written before exiting
+    cache_backends.flush_write_behind()
+    log(json.dumps(cache.cache_stats(), indent=2))
+    if failures:
+        log(f"{failures} interviews failed; run again to retry them. Not writing an archive.")
+        return 1
+    if args.archive:
+        archive_start = time.monotonic()
+        write_archive(args.archive)
+        log(f"Wrote {args.archive} ({os.path.getsize(args.archive) / 1e6:.1f} MB) in {time.monotonic() - archive_start:.1f}s.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
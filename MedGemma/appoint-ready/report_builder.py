@@ -0,0 +1,163 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Incremental report updates: instead of rewriting the whole report after every Q&A,
+# MedGemma returns only the report sections that change and they are merged locally.
+
+import logging
+import os
+import re
+
+from medgemma import medgemma_get_text_response
+
+# "incremental" sends only the newest Q&A and merges section deltas; "full" rewrites every turn.
+REPORT_MODE = os.environ.get("REPORT_MODE", "incremental").lower()
+# In incremental mode, a full rewrite still runs on the first Q&A and on every Nth one.
+REPORT_FULL_REWRITE_EVERY = int(os.environ.get("REPORT_FULL_REWRITE_EVERY", "5"))
+
+NO_CHANGES = "NO_CHANGES"
+SECTION_TITLE_PREFIX = "### "
+
+def read_report_template():
+    # Load the Markdown report skeleton the report sections are based on
+    with open("report_template.txt", 'r') as f:
+        return f.read()
+
+def is_full_rewrite_turn(turn_number: int) -> bool:
+    """Whether the report update after Q&A number `turn_number` (1-based) should be a full rewrite."""
+    if REPORT_MODE != "incremental" or turn_number <= 1:
+        return True
+    return REPORT_FULL_REWRITE_EVERY > 0 and turn_number % REPORT_FULL_REWRITE_EVERY == 0
+
+def clean_report_text(report: str) -> str:
+    """Removes thinking blocks and a wrapping Markdown code block from the LLM output."""
+    cleaned_report = re.sub(r'<unused94>.*?<unused95>', '', report, flags=re.DOTALL)
+    cleaned_report = cleaned_report.strip()
+
+    # The LLM sometimes wraps the markdown report in a markdown code block.
+    # This regex checks if the entire string is a code block and extracts the content.
+    match = re.match(r'^\s*```(?:markdown)?\s*(.*?)\s*```\s*$', cleaned_report, re.DOTALL | re.IGNORECASE)
+    if match:
+        cleaned_report = match.group(1)
+
+    return cleaned_report.strip()
+
+def _normalize_title(title: str) -> str:
+    return title.strip().rstrip(":：").strip().casefold()
+
+def parse_sections(report: str) -> tuple[str, list[tuple[str, str]]]:
+    """
+    Splits a Markdown report into its "### " sections.
+    Returns a tuple: (text_before_first_section, [(title_line, body), ...]).
+    """
+    preamble = []
+    sections = []
+    for line in report.splitlines():
+        if line.startswith(SECTION_TITLE_PREFIX):
+            sections.append((line.rstrip(), []))
+        elif sections:
+            sections[-1][1].append(line)
+        else:
+            preamble.append(line)
+    return "\n".join(preamble).strip(), [(title, "\n".join(body).strip()) for title, body in sections]
+
+def merge_report_delta(report: str, delta: str) -> str | None:
+    """
+    Applies section-level changes to a report. Every section in `delta` replaces the body of the
+    section with the same title in `report`; sections not mentioned in `delta` are kept as they are.
+    Returns None when the delta cannot be applied: the report has no sections, or no section of
+    the delta matches one of the report. The caller then rewrites the whole report instead.
+    """
+    preamble, sections = parse_sections(report)
+    if not sections:
+        logging.warning("The report has no sections to merge a delta into.")
+        return None
+    delta = clean_report_text(delta)
+    if not delta or delta.strip() == NO_CHANGES:
+        return report
+
+    _, changed_sections = parse_sections(delta)
+    positions = {_normalize_title(title[len(SECTION_TITLE_PREFIX):]): i for i, (title, _) in enumerate(sections)}
+    matched = 0
+    for title, body in changed_sections:
+        position = positions.get(_normalize_title(title[len(SECTION_TITLE_PREFIX):]))
+        if position is None:
+            # The model must not invent sections; keep the report aligned with the template.
+            logging.warning("Ignoring report delta for unknown section: %s", title)
+            continue
+        sections[position] = (sections[position][0], body)
+        matched += 1
+    if not matched:
+        logging.warning("No section of the report delta matches the report.")
+        return None
+
+    parts = [preamble] if preamble else []
+    for title, body in sections:
+        parts.append(f"{title}\n{body}" if body else title)
+    return "\n\n".join(parts)
+
+def report_delta_instructions() -> str:
+    """System prompt for section-level report updates. The EHR is left out, it is covered by full rewrites."""
+    return f"""<role>
+You are a highly skilled medical assistant with expertise in clinical documentation.
+</role>
+
+<task>
+You maintain a concise yet clinically comprehensive medical intake report for a Primary Care Physician (PCP).
+You receive the current report and the newest question and answer of the patient interview, and you return only the report sections that must change.
+</task>
+
+<guiding_principles>
+* **Use Professional Language**: Rephrase conversational patient language into standard medical terminology.
+* **Omit Filler**: Do not include conversational filler, pleasantries, or repeated phrases from the interview.
+* **Prioritize the HPI**: Include key details like onset, duration, quality of symptoms, severity, timing, and modifying factors.
+* **Include "Pertinent Negatives"**: You MUST include symptoms the patient **denies** if they are relevant to the chief complaint.
+* **Factual Information Only**: Report only the facts. No assumptions. Do not provide a diagnosis.
+</guiding_principles>
+
+<output_format>
+For every section that changes, output its exact Markdown title line from the current report followed by the COMPLETE new content of that section.
+Do not output sections that do not change. Do not add new sections or change section titles.
+If no section changes, output exactly {NO_CHANGES}.
+DO NOT include any introductory phrases, explanations, or any other text.
+The section content must be written in Japanese.
+</output_format>"""
+
+def write_report_delta(new_q_a: str, existing_report: str) -> str | None:
+    """
+    Updates the report with a single new Q&A by asking MedGemma for the changed sections only,
+    then merging them into the existing report locally. Returns None if they cannot be merged.
+    """
+    user_prompt = f"""<current_report>
+{existing_report}
+</current_report>
+
+<new_q_a>
+{new_q_a}
+</new_q_a>
+
+Return only the sections of the `<current_report>` that must change to integrate the `<new_q_a>`."""
+
+    messages = [
+        {
+            "role": "system",
+            "content": [{"type": "text", "text": report_delta_instructions()}]
+        },
+        {
+            "role": "user",
+            "content": [{"type": "text", "text": user_prompt}]
+        }
+    ]
+    delta = medgemma_get_text_response(messages)
+    return merge_report_delta(existing_report, delta)
@@ -0,0 +1,273 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Timing spans for the stages of an interview turn (question, thinking summary, TTS, audio
+# encoding, patient reply, report update). Every span is
+#   - added to Prometheus-style histograms and counters, served as text by /metrics,
+#   - exported as an OpenTelemetry span when the opentelemetry package is installed (without a
+#     configured SDK the OpenTelemetry API makes this a no-op),
+#   - added to the timings of the current interview, which stream_interview sends at the end.
+#
+# The current span and interview live in context variables. Work handed to other threads must
+# run in a copy of the context (contextvars.copy_context().run) to be attributed to them.
+#
+# Keep this module free of heavy imports: audio_encoder imports it, and that is preloaded into
+# the encoder pool's forkserver.
+
+import bisect
+import contextlib
+import contextvars
+import logging
+import os
+import threading
+import time
+
+# Set to false to skip the OpenTelemetry export even if the package is installed.
+OTEL_SPANS = os.environ.get("OTEL_SPANS", "true").lower() == "true"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+BYTES_BUCKETS = (1e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7)
+
+# Span attributes summed over all calls inside a span and reported per stage
+COUNT_ATTRIBUTES = ("input_tokens", "output_tokens", "bytes")
+
+_current_span = contextvars.ContextVar("telemetry_span", default=None)
+_current_interview = contextvars.ContextVar("telemetry_interview", default=None)
+
+
+def _series(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{label}="{value}"' for label, value in labels.items()) + "}"
+
+
+class Histogram:
+    """A Prometheus histogram with labels. Thread safe."""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.setdefault(label_values, [0] * len(self.buckets) + [0.0, 0])
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def exposition(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in sorted(self._series.items())}
+        for label_values, values in series.items():
+            labels = dict(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{_series(self.name + "_bucket", {**labels, "le": f"{bound:g}"})} {cumulative}')
+            lines.append(f'{_series(self.name + "_bucket", {**labels, "le": "+Inf"})} {values[-1]}')
+            lines.append(f"{_series(self.name + '_sum', labels)} {values[-2]:.6f}")
+            lines.append(f"{_series(self.name + '_count', labels)} {values[-1]}")
+        return lines
+
+
+class Counter:
+    """A Prometheus counter with labels. Thread safe."""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def exposition(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f"{_series(self.name, dict(zip(self.label_names, label_values)))} {value:g}")
+        return lines
+
+
+STAGE_DURATION = Histogram("appoint_ready_stage_duration_seconds", "Duration of interview stages.",
+                           ("stage", "cache"), DURATION_BUCKETS)
+STAGE_BYTES = Histogram("appoint_ready_stage_bytes", "Bytes produced by interview stages (audio).",
+                        ("stage",), BYTES_BUCKETS)
+STAGE_TOKENS = Counter("appoint_ready_stage_tokens_total", "LLM tokens used by interview stages; cache hits use none.",
+                       ("stage", "direction"))
+STAGE_ERRORS = Counter("appoint_ready_stage_errors_total", "Interview stages that raised an exception.", ("stage",))
+INTERVIEW_DURATION = Histogram("appoint_ready_interview_duration_seconds", "Wall time of whole interviews.",
+                               (), tuple(b * 10 for b in DURATION_BUCKETS))
+_METRICS = (STAGE_DURATION, STAGE_BYTES, STAGE_TOKENS, STAGE_ERRORS, INTERVIEW_DURATION)
+
+def metrics_text() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(line for metric in _METRICS for line in metric.exposition()) + "\n"
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+def _otel_tracer():
+    # Imported on first use, so the package stays optional and pool workers never load it
+    global _tracer
+    if not OTEL_SPANS:
+        return None
+    with _tracer_lock:
+        if _tracer is None:
+            try:
+                from opentelemetry import trace
+                _tracer = trace.get_tracer("appoint-ready")
+            except ImportError:
+                _tracer = False
+        return _tracer or None
+
+def _start_otel_span(name: str, parent, attributes: dict):
+    tracer = _otel_tracer()
+    if tracer is None:
+        return None
+    from opentelemetry import trace
+    context = trace.set_span_in_context(parent) if parent is not None else None
+    return tracer.start_span(name, context=context, attributes=attributes)
+
+
+class Span:
+    """A running stage span. Attributes can be set until it ends, see annotate and add_counts."""
+
+    def __init__(self, stage: str, attributes: dict, parent_otel):
+        self.stage = stage
+        self.attributes = dict(attributes)
+        self.otel = _start_otel_span(f"interview.{stage}", parent_otel, attributes)
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def end(self, error: BaseException | None = None):
+        self.duration = time.perf_counter() - self.start
+        if error is not None:
+            self.attributes["error"] = type(error).__name__
+        if self.otel is not None:
+            self.otel.set_attributes({k: v for k, v in self.attributes.items() if v is not None})
+            self.otel.end()
+
+
+class InterviewTimings:
+    """Per-stage totals of one interview, sent to the client as its "timings" event."""
+
+    def __init__(self, patient_name: str, condition_name: str):
+        self.start = time.perf_counter()
+        self.otel = _start_otel_span("interview", None, {"patient": patient_name, "condition": condition_name})
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            stage = self._stages.setdefault(span.stage, {
+                "count": 0, "seconds": 0.0, "max_seconds": 0.0, "cache_hits": 0, "cache_misses": 0, "errors": 0,
+                **{name: 0 for name in COUNT_ATTRIBUTES}})
+            stage["count"] += 1
+            stage["seconds"] += span.duration
+            stage["max_seconds"] = max(stage["max_seconds"], span.duration)
+            cache = span.attributes.get("cache")
+            stage["cache_hits"] += cache == "hit"
+            stage["cache_misses"] += cache == "miss"
+            stage["errors"] += "error" in span.attributes
+            for name in COUNT_ATTRIBUTES:
+                stage[name] += span.attributes.get(name) or 0
+
+    def summary(self) -> dict:
+        """Ends the interview span and returns the wall time and per-stage totals (stages may overlap)."""
+        wall_seconds = time.perf_counter() - self.start
+        INTERVIEW_DURATION.observe(wall_seconds)
+        if self.otel is not None:
+            self.otel.end()
+        with self._lock:
+            stages = {name: {**totals, "seconds": round(totals["seconds"], 3),
+                             "max_seconds": round(totals["max_seconds"], 3)}
+                      for name, totals in self._stages.items()}
+        return {"wall_seconds": round(wall_seconds, 3), "stages": stages}
+
+
+def start_interview_timings(patient_name: str, condition_name: str) -> InterviewTimings:
+    """Makes a new InterviewTimings current in this context and returns it."""
+    timings = InterviewTimings(patient_name, condition_name)
+    _current_interview.set(timings)
+    return timings
+
+def _record(span: Span):
+    cache = span.attributes.get("cache") or "none"
+    STAGE_DURATION.observe(span.duration, span.stage, cache)
+    if span.attributes.get("bytes"):
+        STAGE_BYTES.observe(span.attributes["bytes"], span.stage)
+    for direction in ("input", "output"):
+        tokens = span.attributes.get(f"{direction}_tokens")
+        if tokens:
+            STAGE_TOKENS.inc(tokens, span.stage, direction)
+    if "error" in span.attributes:
+        STAGE_ERRORS.inc(1, span.stage)
+    timings = _current_interview.get()
+    if timings is not None:
+        timings.add(span)
+
+@contextlib.contextmanager
+def stage_span(stage: str, **attributes):
+    """Times the enclosed block as a span of `stage`. Yields the Span."""
+    parent = _current_span.get()
+    interview = _current_interview.get()
+    parent_otel = parent.otel if parent is not None else interview.otel if interview is not None else None
+    span = Span(stage, attributes, parent_otel)
+    # set() rather than a reset token: generators holding a span may be resumed from another context
+    _current_span.set(span)
+    error = None
+    try:
+        yield span
+    except BaseException as e:
+        error = e if isinstance(e, Exception) else None
+        raise
+    finally:
+        _current_span.set(parent)
+        span.end(error)
+        try:
+            _record(span)
+        except Exception as e:
+            logging.warning("Could not record %s span: %s", stage, e)
+
+def annotate(**attributes):
+    """Sets attributes on the current span, if any."""
+    span = _current_span.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+def add_counts(**amounts):
+    """Adds to the token/byte counts of the current span, if any (a span may cover several calls)."""
+    span = _current_span.get()
+    if span is not None:
+        for name, amount in amounts.items():
+            span.attributes[name] = (span.attributes.get(name) or 0) + (amount or 0)
+
+def record_cache_result(hit: bool):
+    """Tags the current span as a cache hit or miss. A miss wins: the span waited for a call."""
+    span = _current_span.get()
+    if span is not None and span.attributes.get("cache") != "miss":
+        span.attributes["cache"] = "hit" if hit else "miss"
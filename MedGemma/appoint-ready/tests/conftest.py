@@ -0,0 +1,9 @@
+import os
+import sys
+import types
+
+# The modules live flat in the app directory, as in the container
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# medgemma loads service account credentials on import; the code under test never calls it
+sys.modules.setdefault("medgemma", types.SimpleNamespace(medgemma_get_text_response=None))
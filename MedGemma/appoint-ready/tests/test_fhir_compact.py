@@ -0,0 +1,30 @@
+from fhir_compact import compact_fhir
+
+
+def encounter(**fields):
+    return {"resourceType": "Encounter", "period": {"start": "2024-03-01T09:30:00Z"}, **fields}
+
+
+def encounter_types(*resources):
+    bundle = {"resourceType": "Bundle", "entry": [{"resource": resource} for resource in resources]}
+    return [e["type"] for e in compact_fhir(bundle)["encounters"]]
+
+
+def test_r4_class_is_a_coding():
+    assert encounter_types(encounter(**{"class": {"system": "http://terminology.hl7.org/CodeSystem/v3-ActCode",
+                                                  "code": "AMB", "display": "ambulatory"}})) == ["ambulatory"]
+    assert encounter_types(encounter(**{"class": {"code": "IMP"}})) == ["IMP"]
+
+
+def test_r5_class_is_a_list_of_codeable_concepts():
+    r5_class = [{"coding": [{"code": "EMER", "display": "emergency"}]}, {"text": "Walk-in"}]
+    assert encounter_types(encounter(**{"class": r5_class})) == ["emergency, Walk-in"]
+
+
+def test_missing_class():
+    assert encounter_types(encounter()) == [""]
+
+
+def test_type_takes_precedence_over_class():
+    resource = encounter(type=[{"text": "Follow-up visit"}], **{"class": {"display": "ambulatory"}})
+    assert encounter_types(resource) == ["Follow-up visit"]
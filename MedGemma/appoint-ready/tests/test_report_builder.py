@@ -0,0 +1,40 @@
+from report_builder import NO_CHANGES, clean_report_text, merge_report_delta
+
+REPORT = """# Intake report
+
+### Chief Complaint
+Headache
+
+### History of Present Illness
+Started two days ago."""
+
+
+def test_clean_report_text_removes_thinking_and_code_block():
+    text = "<unused94>thinking\n### Chief Complaint\nnot this<unused95>```markdown\n### Chief Complaint\nFever\n```"
+    assert clean_report_text(text) == "### Chief Complaint\nFever"
+
+
+def test_merge_replaces_only_changed_sections():
+    merged = merge_report_delta(REPORT, "### History of Present Illness\nStarted two days ago, worse at night.")
+    assert "### Chief Complaint\nHeadache" in merged
+    assert "### History of Present Illness\nStarted two days ago, worse at night." in merged
+    assert merged.startswith("# Intake report")
+
+
+def test_merge_ignores_sections_inside_thinking_block():
+    delta = ("<unused94>The new answer affects the HPI.\n### Chief Complaint\nI should keep this as it is."
+             "<unused95>### History of Present Illness\nStarted two days ago, with nausea.")
+    merged = merge_report_delta(REPORT, delta)
+    assert "### Chief Complaint\nHeadache" in merged
+    assert "with nausea" in merged
+    assert "I should keep" not in merged
+
+
+def test_merge_without_changes_keeps_report():
+    assert merge_report_delta(REPORT, NO_CHANGES) == REPORT
+    assert merge_report_delta(REPORT, f"<unused94>nothing new<unused95>{NO_CHANGES}") == REPORT
+
+
+def test_merge_that_cannot_be_applied_returns_none():
+    assert merge_report_delta(REPORT, "### Unknown Section\nText") is None
+    assert merge_report_delta("A report without sections", "### Chief Complaint\nFever") is None
@@ -1,7 +1,8 @@
 import os
+import base64
 import requests
 import json # Added import for json
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import logging
@@ -16,115 +17,153 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True) # Initialize CORS to allow all origins for API routes
 
-from google import genai
+import generation
+from generation import DEFAULT_MODEL, SLIDES_MODEL, TTS_MODEL, GenerationError
+from json_stream import JsonObjectStreamParser
+from document_patch import PatchError, apply_edits, headings, numbered_document
+from document_store import DocumentNotFound, VersionConflict, store
+from artifact_cache import artifact_key, artifacts
 from google.genai import types
 
-# Initialize genai client for Vertex AI with global location
-_client = genai.Client(
-    vertexai=True,
-    project=os.getenv("GCP_PROJECT_ID"),
-    location='global'
-)
-
+def _error_status(e):
+    # 503 when the model is saturated, so clients can retry; 422 for model edits that do not apply; 500 for everything else
+    if isinstance(e, PatchError):
+        return 422
+    return e.status if isinstance(e, GenerationError) else 500
 
+def request_document(data):
+    # The content of the stored document given by documentId (and optionally documentVersion) with its
+    # (id, version) for tagging cached artifacts; else the posted documentContent and None
+    if data.get('documentId') is not None:
+        document = store.get_document(data['documentId'], data.get('documentVersion'))
+        return document['content'], (document['id'], document['version'])
+    return data.get('documentContent'), None
 
 # --- Vertex AI Gemini Text Generation ---
 def gemini_get_text_response(
     prompt_text: str,
-            model_name: str = "gemini-3-flash-preview",    temperature: float = 0.4,
+    model_name: str = DEFAULT_MODEL,
+    temperature: float = 0.4,
     max_output_tokens: int = 8192,
     top_p: float = 1.0,
     top_k: int = 32
 ):
     try:
-        response = _client.models.generate_content(
-            model=model_name,
-            contents=types.Part.from_text(text=prompt_text),
-            config=types.GenerateContentConfig(
-                temperature=temperature,
-                max_output_tokens=max_output_tokens,
-                top_p=top_p,
-                top_k=top_k,
-                safety_settings=[
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_HATE_SPEECH",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_HARASSMENT",
-                        threshold="OFF"
-                    )
-                ],
-            ),
+        return generation.generate_text(
+            prompt_text,
+            model_name=model_name,
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+            top_p=top_p,
+            top_k=top_k,
         )
-        # Assuming the response object has a 'text' attribute for the generated content
-        return response.candidates[0].content.parts[0].text
+    except GenerationError:
+        # Carries its HTTP status (503 when the model is saturated) for the route to answer with
+        raise
     except Exception as e:
         logger.error(f"Error in gemini_get_text_response: {e}")
         return None
 
-@app.route('/api/generate_text', methods=['POST'])
-def generate_text():
-    data = request.json
+# --- Streaming ---
+# The /stream variants answer with NDJSON: {"type": "delta", ...} lines as the text arrives, then
+# one {"type": "done", ...} line with the same fields as the non-streaming route, or
+# {"type": "error", "error": ...} if generation fails after the stream has started.
+def ndjson_response(events, route_name):
+    def generate():
+        try:
+            for event in events:
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"Error in {route_name} stream: {e}")
+            yield json.dumps({"type": "error", "error": f"Failed to {route_name.replace('_', ' ')}: {e}"}, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Generation parameters a generate_text request may set: (type, default, minimum, maximum)
+TEXT_GENERATION_PARAMS = {
+    'temperature': (float, 0.4, 0.0, 2.0),
+    'max_output_tokens': (int, 8192, 1, 65536),
+    'top_p': (float, 1.0, 0.0, 1.0),
+    'top_k': (int, 32, 1, 1000),
+}
+
+def _generation_param(data, name):
+    kind, default, minimum, maximum = TEXT_GENERATION_PARAMS[name]
+    value = data.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or (kind is int and value != int(value)):
+        raise ValueError(f"{name} must be {'an integer' if kind is int else 'a number'}")
+    if not minimum <= value <= maximum:
+        raise ValueError(f"{name} must be between {minimum} and {maximum}")
+    return kind(value)
+
+def text_request_params(data):
+    # The prompt (with the Japanese instruction) and generation parameters of a generate_text request.
+    # Raises ValueError for a missing prompt or an invalid parameter.
     prompt = data.get('prompt')
-    model_name = data.get('model_name', "gemini-3-flash-preview")
-    temperature = data.get('temperature', 0.4)
-    max_output_tokens = data.get('max_output_tokens', 8192)
-    top_p = data.get('top_p', 1.0)
-    top_k = data.get('top_k', 32)
-
-    if not prompt:
-        return jsonify({"error": "Prompt is required"}), 400
-    
+    if not prompt or not isinstance(prompt, str):
+        raise ValueError("Prompt is required")
+    model_name = data.get('model_name', DEFAULT_MODEL)
+    if not model_name or not isinstance(model_name, str):
+        raise ValueError("model_name must be a model name")
     # 日本語での応答を促す指示を追加
     prompt_with_lang_instruction = prompt + "\n\nすべての応答は日本語で行ってください。"
-
-    response_text = gemini_get_text_response(
+    return dict(
         prompt_text=prompt_with_lang_instruction,
         model_name=model_name,
-        temperature=temperature,
-        max_output_tokens=max_output_tokens,
-        top_p=top_p,
-        top_k=top_k
+        **{name: _generation_param(data, name) for name in TEXT_GENERATION_PARAMS},
     )
 
+@app.route('/api/generate_text', methods=['POST'])
+def generate_text():
+    data = request.json or {}
+    try:
+        params = text_request_params(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # The same prompt and parameters return the cached text; "refresh": true generates it anew
+    try:
+        response_text = artifacts.get_or_compute(artifact_key("text", params), lambda: gemini_get_text_response(**params),
+                                                 refresh=bool(data.get('refresh')))
+    except GenerationError as e:
+        logger.error(f"Error in generate_text: {e}")
+        return jsonify({"error": f"Failed to generate text: {e}"}), e.status
+
     if response_text:
         return jsonify({"generated_text": response_text})
     else:
         return jsonify({"error": "Failed to generate text"}), 500
 
-@app.route('/api/chat_with_document', methods=['POST'])
-def chat_with_document():
-    data = request.json
-    document_content = data.get('documentContent')
-    user_prompt = data.get('userPrompt')
-    records = data.get('records', [])
-
-    if not document_content or not user_prompt:
-        return jsonify({"error": "documentContent and userPrompt are required"}), 400
-
-    # The schema for the model's response
-    response_schema = {
-        "type": "object",
-        "properties": {
-            "chatResponse": {
-                "type": "string",
-                "description": "The conversational response to the user's prompt."
-            },
-            "updatedDocument": {
-                "type": "string",
-                "description": "If the user requested a change, this field contains the FULL, updated document text. If the user is only asking a question, this field should not be present in the response.",
-            }
-        },
-        "required": ['chatResponse']
-    }
-
-    full_prompt = f"""
+@app.route('/api/generate_text/stream', methods=['POST'])
+def generate_text_stream():
+    data = request.json or {}
+    try:
+        params = text_request_params(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    key = artifact_key("text", params)
+
+    def events():
+        # Shares the cache of /api/generate_text; a cached text is sent as a single delta
+        cached = None if data.get('refresh') else artifacts.get(key)
+        if cached is not None:
+            yield {"type": "delta", "text": cached}
+            yield {"type": "done", "generated_text": cached}
+            return
+        chunks = []
+        for text in generation.generate_text_stream(**params):
+            chunks.append(text)
+            yield {"type": "delta", "text": text}
+        generated_text = "".join(chunks)
+        if generated_text:
+            artifacts.put(key, generated_text)
+        yield {"type": "done", "generated_text": generated_text}
+
+    return ndjson_response(events(), "generate_text")
+
+def chat_prompt(document_content, user_prompt):
+    return f"""
         CONTEXT:
         Here is the current medical handoff document:
         ---
@@ -141,52 +180,113 @@ def chat_with_document():
         4. YOU MUST RESPOND IN THE PROVIDED JSON FORMAT.
         5. 全ての応答は日本語で行ってください。
     """
+
+def chat_patch_prompt(document_content, user_prompt):
+    # Patch mode: the model answers with edit operations, so the output scales with the change, not the document
+    section_list = "\n".join(f"- {title}" for _, _, title in headings(document_content.split("\n"))) or "(none)"
+    return f"""
+        CONTEXT:
+        Here is the current medical handoff document. Every line starts with its line number and "| ", which are not part of the text:
+        ---
+        {numbered_document(document_content)}
+        ---
+
+        Section headings of the document:
+        {section_list}
+
+        USER'S REQUEST:
+        "{user_prompt}"
+
+        INSTRUCTIONS:
+        1. Analyze the user's request.
+        2. If the user is asking a question, answer it based *only* on the document context provided. Your answer should be in the 'chatResponse' field and 'edits' should be empty.
+        3. If the user is asking to modify, edit, change, or rewrite the document, return the SMALLEST set of edits in 'edits'. Do NOT return the whole document. Your 'chatResponse' should be a brief confirmation, like "Done, I've updated the document."
+        4. Each edit has an 'operation' and targets either a 'section' (exact heading text from the list above) or line numbers:
+           - replace: 'startLine'..'endLine' (inclusive) are replaced by 'text'. With 'section', the content under the heading is replaced and the heading is kept.
+           - insert: 'text' is inserted after 'afterLine' (0 for the top). With 'section', it is added at the end of the section.
+           - delete: 'startLine'..'endLine' are removed. With 'section', the whole section including its heading is removed.
+        5. Line numbers refer to the document as shown above, before any edit. Edits must not overlap. 'text' must not contain line numbers.
+        6. YOU MUST RESPOND IN THE PROVIDED JSON FORMAT.
+        7. 全ての応答は日本語で行ってください。
+    """
+
+def chat_request(data, document_content):
+    # Prompt and response schema of a chat_with_document request; mode "patch" asks for edits instead of the full document
+    mode = data.get('mode', 'full')
+    if mode not in ('full', 'patch'):
+        return None
+    if mode == 'patch':
+        return chat_patch_prompt(document_content, data['userPrompt']), "chat_with_document_patch"
+    return chat_prompt(document_content, data['userPrompt']), "chat_with_document"
+
+def merge_chat_patch(document_content, response):
+    # Applies the edits of a patch mode response; the client gets both the patch and the merged document
+    edits = response.get("edits") or []
+    result = {"chatResponse": response.get("chatResponse"), "patch": edits}
+    if edits:
+        result["updatedDocument"] = apply_edits(document_content, edits)
+    return result
+
+@app.route('/api/chat_with_document', methods=['POST'])
+def chat_with_document():
+    data = request.json
     try:
-        response = _client.models.generate_content(
-            model="gemini-3-flash-preview",
-            contents=types.Part.from_text(text=full_prompt),
-            config=types.GenerateContentConfig(
-                temperature=0.4,
-                max_output_tokens=8192,
-                top_p=1.0,
-                top_k=32,
-                response_mime_type="application/json", # Specify JSON response
-                response_schema=response_schema,
-                safety_settings=[
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_HATE_SPEECH",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_HARASSMENT",
-                        threshold="OFF"
-                    )
-                ],                
-            ),
-        )
-        # The response.text will contain the JSON string
-        parsed_response = json.loads(response.candidates[0].content.parts[0].text)
+        document_content, _ = request_document(data)
+    except DocumentNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    user_prompt = data.get('userPrompt')
+    records = data.get('records', [])
+
+    if not document_content or not user_prompt:
+        return jsonify({"error": "documentId or documentContent, and userPrompt are required"}), 400
+    chat = chat_request(data, document_content)
+    if not chat:
+        return jsonify({"error": "mode must be 'full' or 'patch'"}), 400
+
+    full_prompt, response_schema = chat
+    try:
+        # The response follows RESPONSE_SCHEMAS[response_schema]
+        parsed_response = generation.generate_json(full_prompt, response_schema)
+        if response_schema == "chat_with_document_patch":
+            parsed_response = merge_chat_patch(document_content, parsed_response)
         return jsonify(parsed_response)
 
     except Exception as e:
         logger.error(f"Error in chat_with_document: {e}")
-        return jsonify({"error": f"Failed to chat with document: {e}"}), 500
+        return jsonify({"error": f"Failed to chat with document: {e}"}), _error_status(e)
 
-@app.route('/api/modify_text', methods=['POST'])
-def modify_text():
+@app.route('/api/chat_with_document/stream', methods=['POST'])
+def chat_with_document_stream():
     data = request.json
-    selected_markdown = data.get('selectedMarkdown')
-    instruction = data.get('instruction')
-
-    if not selected_markdown or not instruction:
-        return jsonify({"error": "selectedMarkdown and instruction are required"}), 400
+    try:
+        document_content, _ = request_document(data)
+    except DocumentNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    user_prompt = data.get('userPrompt')
 
-    prompt = f"""
+    if not document_content or not user_prompt:
+        return jsonify({"error": "documentId or documentContent, and userPrompt are required"}), 400
+    chat = chat_request(data, document_content)
+    if not chat:
+        return jsonify({"error": "mode must be 'full' or 'patch'"}), 400
+
+    def events():
+        # chatResponse comes first in the schema, so it is shown before the document is rewritten
+        full_prompt, response_schema = chat
+        parser = JsonObjectStreamParser()
+        for chunk in generation.generate_json_stream(full_prompt, response_schema):
+            for field, text in parser.feed(chunk):
+                if field in ("chatResponse", "updatedDocument"):
+                    yield {"type": "delta", "field": field, "text": text}
+        result = parser.result()
+        if response_schema == "chat_with_document_patch":
+            result = merge_chat_patch(document_content, result)
+        yield {"type": "done", **result}
+
+    return ndjson_response(events(), "chat_with_document")
+
+def modify_prompt(selected_markdown, instruction):
+    return f"""
         You are an AI text editor. A user has selected a piece of text from a medical document and provided an instruction. The text is in Markdown format.
         
         Selected Markdown Text:
@@ -200,37 +300,39 @@ def modify_text():
         IMPORTANT: 全ての応答は日本語で行ってください。Return ONLY the rewritten Markdown text, with no additional commentary or explanations.
     """
 
+@app.route('/api/modify_text', methods=['POST'])
+def modify_text():
+    data = request.json
+    selected_markdown = data.get('selectedMarkdown')
+    instruction = data.get('instruction')
+
+    if not selected_markdown or not instruction:
+        return jsonify({"error": "selectedMarkdown and instruction are required"}), 400
+
     try:
-        response = _client.models.generate_content(
-            model="gemini-3-flash-preview",
-            contents=types.Part.from_text(text=prompt),
-            config=types.GenerateContentConfig(
-                temperature=0.4,
-                max_output_tokens=8192,
-                top_p=1.0,
-                top_k=32,
-                safety_settings=[
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_HATE_SPEECH",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_HARASSMENT",
-                        threshold="OFF"
-                    )
-                ],
-            ),
-        )
-        return jsonify({"modified_text": response.candidates[0].content.parts[0].text})
+        return jsonify({"modified_text": generation.generate_text(modify_prompt(selected_markdown, instruction))})
 
     except Exception as e:
         logger.error(f"Error in modify_text: {e}")
-        return jsonify({"error": f"Failed to modify text: {e}"}), 500
+        return jsonify({"error": f"Failed to modify text: {e}"}), _error_status(e)
+
+@app.route('/api/modify_text/stream', methods=['POST'])
+def modify_text_stream():
+    data = request.json
+    selected_markdown = data.get('selectedMarkdown')
+    instruction = data.get('instruction')
+
+    if not selected_markdown or not instruction:
+        return jsonify({"error": "selectedMarkdown and instruction are required"}), 400
+
+    def events():
+        chunks = []
+        for text in generation.generate_text_stream(modify_prompt(selected_markdown, instruction)):
+            chunks.append(text)
+            yield {"type": "delta", "text": text}
+        yield {"type": "done", "modified_text": "".join(chunks)}
+
+    return ndjson_response(events(), "modify_text")
 
 @app.route('/api/generate_audio', methods=['POST'])
 def generate_audio():
@@ -239,64 +341,44 @@ def generate_audio():
 
     if not text_content:
         return jsonify({"error": "Text content is required"}), 400
-
-    try:
-        response = _client.models.generate_content(
-            model="gemini-1.5-flash-preview-0514-tts", # Using a TTS-specific model
-            contents=[types.Part.from_text(text=text_content)],
-            config=types.GenerateContentConfig(
-                response_mime_type="audio/mpeg", # Requesting audio directly
-                safety_settings=[
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_HATE_SPEECH",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_HARASSMENT",
-                        threshold="OFF"
-                    )
-                ],
-            ),
+    # The speech is made from the posted text; documentId and documentVersion only tag the cached
+    # audio, so that saving a new version of the document drops it
+    document_ref = None
+    if data.get('documentId') is not None and data.get('documentVersion') is not None:
+        document_ref = (data['documentId'], data['documentVersion'])
+
+    def synthesize():
+        response = generation.generate(
+            [types.Part.from_text(text=text_content)],
+            model_name=TTS_MODEL, # Using a TTS-specific model
+            # Requesting audio directly
+            config=generation.generation_config(temperature=None, max_output_tokens=None, top_p=None, top_k=None,
+                                                response_mime_type="audio/mpeg"),
         )
+        # The audio comes back as inline data of the first part
+        audio_bytes = response.candidates[0].content.parts[0].inline_data.data
+        return base64.b64encode(audio_bytes).decode('utf-8')
 
-        # The response.content will be bytes of the audio
-        audio_bytes = response.content
-        import base64
-        base64_audio = base64.b64encode(audio_bytes).decode('utf-8')
+    try:
+        base64_audio = artifacts.get_or_compute(artifact_key("audio", TTS_MODEL, text_content), synthesize,
+                                                document=document_ref, refresh=bool(data.get('refresh')))
         return jsonify({"audio_content": base64_audio})
 
     except Exception as e:
         logger.error(f"Error in generate_audio: {e}")
-        return jsonify({"error": f"Failed to generate audio: {e}"}), 500
+        return jsonify({"error": f"Failed to generate audio: {e}"}), _error_status(e)
 
 @app.route('/api/generate_slides', methods=['POST'])
 def generate_slides():
     data = request.json
-    document_content = data.get('documentContent')
+    try:
+        document_content, document_ref = request_document(data)
+    except DocumentNotFound as e:
+        return jsonify({"error": str(e)}), 404
 
     if not document_content:
         return jsonify({"error": "Document content is required"}), 400
 
-    response_schema = {
-        "type": "array",
-        "items": {
-            "type": "object",
-            "properties": {
-                "title": {"type": "string"},
-                "points": {
-                    "type": "array",
-                    "items": {"type": "string"},
-                },
-            },
-            "required": ["title", "points"],
-        },
-    }
-
     prompt = f"""
         You are a helpful AI assistant for medical professionals.
         Your task is to analyze the provided medical handoff document and structure its key information into a presentation slide deck format.
@@ -316,39 +398,93 @@ def generate_slides():
     """
 
     try:
-        response = _client.models.generate_content(
-            model='gemini-3-pro-preview', # Using a more powerful model for better structuring
-            contents=types.Part.from_text(text=prompt),
-            config=types.GenerateContentConfig(
-                temperature=0.4,
-                max_output_tokens=8192,
-                top_p=1.0,
-                top_k=32,
-                response_mime_type="application/json",
-                response_schema=response_schema,
-                safety_settings=[
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_HATE_SPEECH",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        threshold="OFF"
-                    ),types.SafetySetting(
-                        category="HARM_CATEGORY_HARASSMENT",
-                        threshold="OFF"
-                    )
-                ],
-            ),
+        # Using a more powerful model for better structuring; the response follows RESPONSE_SCHEMAS["slides"].
+        # Cached by content, so re-opening the presentation of an unchanged document costs no call
+        parsed_response = artifacts.get_or_compute(
+            artifact_key("slides", SLIDES_MODEL, prompt),
+            lambda: generation.generate_json(prompt, "slides", model_name=SLIDES_MODEL),
+            document=document_ref, refresh=bool(data.get('refresh')),
         )
-        parsed_response = json.loads(response.candidates[0].content.parts[0].text)
         return jsonify(parsed_response)
 
     except Exception as e:
         logger.error(f"Error in generate_slides: {e}")
-        return jsonify({"error": f"Failed to generate slides: {e}"}), 500
+        return jsonify({"error": f"Failed to generate slides: {e}"}), _error_status(e)
+
+# --- Document Store ---
+# Documents and records by ID; every save of a document creates a new version (see document_store)
+@app.route('/api/patients/<int:patient_id>/documents', methods=['GET'])
+def list_patient_documents(patient_id):
+    return jsonify(store.list_documents(patient_id))
+
+@app.route('/api/patients/<int:patient_id>/documents', methods=['POST'])
+def create_patient_document(patient_id):
+    data = request.json or {}
+    if not data.get('documentType'):
+        return jsonify({"error": "documentType is required"}), 400
+    return jsonify(store.create_document(patient_id, data)), 201
+
+@app.route('/api/patients/<int:patient_id>/records', methods=['GET'])
+def list_patient_records(patient_id):
+    return jsonify(store.list_records(patient_id))
+
+@app.route('/api/patients/<int:patient_id>/records', methods=['PUT'])
+def put_patient_records(patient_id):
+    records = request.json
+    if not isinstance(records, list) or not all(isinstance(r, dict) and r.get('content') and r.get('type') and r.get('citationId') is not None for r in records):
+        return jsonify({"error": "A list of records with citationId, type and content is required"}), 400
+    try:
+        return jsonify(store.put_records(patient_id, records))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+
+@app.route('/api/patients/<int:patient_id>/seed', methods=['POST'])
+def seed_patient(patient_id):
+    # Loads the initial documents and records of a patient once; later calls change nothing
+    data = request.json or {}
+    documents = data.get('documents', [])
+    records = data.get('records', [])
+    if not isinstance(documents, list) or not isinstance(records, list):
+        return jsonify({"error": "documents and records must be lists"}), 400
+    try:
+        seeded = store.seed_patient(patient_id, documents, records)
+    except ValueError as e:
+        # An ID of the seed data is taken by another patient
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"seeded": seeded})
+
+@app.route('/api/documents/<int:document_id>', methods=['GET'])
+def get_stored_document(document_id):
+    try:
+        return jsonify(store.get_document(document_id, request.args.get('version', type=int)))
+    except DocumentNotFound as e:
+        return jsonify({"error": str(e)}), 404
+
+@app.route('/api/documents/<int:document_id>', methods=['PUT'])
+def save_stored_document(document_id):
+    # Saves a new version; with baseVersion, fails with 409 if someone saved in between
+    data = request.json or {}
+    try:
+        document = store.save_document(document_id, data, data.get('baseVersion'))
+        # Artifacts of older versions are not needed anymore
+        artifacts.invalidate_document(document_id, document['version'])
+        return jsonify(document)
+    except DocumentNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except VersionConflict as e:
+        return jsonify({"error": str(e), "currentVersion": e.current_version}), 409
+
+@app.route('/api/documents/<int:document_id>/versions', methods=['GET'])
+def list_document_versions(document_id):
+    try:
+        return jsonify(store.document_versions(document_id))
+    except DocumentNotFound as e:
+        return jsonify({"error": str(e)}), 404
+
+@app.route('/api/artifact_cache_stats', methods=['GET'])
+def artifact_cache_stats():
+    # Size, hit/miss counters and entries per kind of the generated artifact cache
+    return jsonify(artifacts.stats())
 
 # --- Health Check Endpoint ---
 @app.route('/health', methods=['GET'])
@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# --- Generated artifact cache ---
+# Slides, audio and generated text are keyed by a hash of everything that determines them (kind,
+# model, input text, parameters), so the same document content never pays for a second model call.
+# Entries are evicted least recently used once their total size exceeds ARTIFACT_CACHE_MAX_BYTES.
+# Entries made from a stored document are tagged with its ID and version; saving a new version
+# drops those of older versions (see invalidate_document).
+
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def artifact_key(kind, *inputs):
+    """Content hash of an artifact's kind and inputs (strings or JSON-serializable values)."""
+    payload = json.dumps([kind, *inputs], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return f"{kind}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+def _size(value):
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+class ArtifactCache:
+    """In-memory LRU cache bounded by bytes. Concurrent requests for a missing key wait for one computation."""
+
+    def __init__(self, max_bytes=ARTIFACT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size, (document_id, version) or None)
+        self._bytes = 0
+        self._inflight = {}            # key -> Event set when its computation ends
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, key):
+        """The cached value, or None. Counts as a use for LRU order."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key, value, document=None):
+        """Stores value; document is the (id, version) it was made from, if any."""
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, size, tuple(document) if document else None)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def get_or_compute(self, key, compute, document=None, refresh=False):
+        """
+        The cached value of key, or compute() stored under it. With refresh, the value is computed
+        again and replaces the cached one. Failed computations and empty results (None, "", []) are not cached.
+        """
+        while True:
+            with self._lock:
+                entry = None if refresh else self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry[0]
+                event = self._inflight.get(key)
+                if event is None:
+                    self._inflight[key] = event = threading.Event()
+                    self._misses += 1
+                    break
+            # Someone else is computing it; use their result, or compute if they failed
+            event.wait()
+            refresh = False
+        try:
+            value = compute()
+            if value:
+                self.put(key, value, document)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def invalidate_document(self, document_id, current_version=None):
+        """Drops the entries of a document, except those of current_version. Returns how many were dropped."""
+        with self._lock:
+            stale = [key for key, (_, _, document) in self._entries.items()
+                     if document is not None and document[0] == document_id and document[1] != current_version]
+            for key in stale:
+                self._remove(key)
+            self._invalidations += len(stale)
+        if stale:
+            logger.info(f"Dropped {len(stale)} cached artifacts of document {document_id}")
+        return len(stale)
+
+    def stats(self):
+        with self._lock:
+            kinds = {}
+            for key, (_, size, _) in self._entries.items():
+                kind = kinds.setdefault(key.split(":", 1)[0], {"entries": 0, "bytes": 0})
+                kind["entries"] += 1
+                kind["bytes"] += size
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "kinds": kinds,
+            }
+
+
+artifacts = ArtifactCache()
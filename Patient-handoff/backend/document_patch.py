@@ -0,0 +1,120 @@
+import re
+
+# --- Structured edits of handoff documents ---
+# In patch mode chat_with_document asks the model for a list of edit operations instead of the
+# whole rewritten document. An edit targets either a section, by its heading text, or a range of
+# 1-based line numbers of the document as it was sent. apply_edits validates every edit against the
+# original document and applies them all at once, so line numbers never shift between edits.
+
+OPERATIONS = ("replace", "insert", "delete")
+
+_MARKDOWN_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+# Discharge summaries use bold lines such as "**HOSPITAL COURSE:**" as headings
+_BOLD_HEADING = re.compile(r"^\*\*([^*]+?)\*\*\s*$")
+_BOLD_HEADING_LEVEL = 7
+
+
+class PatchError(ValueError):
+    """An edit that does not fit the document: unknown section, line out of range, overlapping edits."""
+
+
+def _normalize(title):
+    return re.sub(r"\s+", " ", title.strip().strip("#*").strip().rstrip(":").strip()).casefold()
+
+def headings(lines):
+    """(line index, level, title) of every heading; bold-only lines count as the lowest level."""
+    found = []
+    for index, line in enumerate(lines):
+        match = _MARKDOWN_HEADING.match(line)
+        if match:
+            found.append((index, len(match.group(1)), match.group(2)))
+            continue
+        match = _BOLD_HEADING.match(line)
+        if match:
+            found.append((index, _BOLD_HEADING_LEVEL, match.group(1)))
+    return found
+
+def _section_span(lines, title):
+    # Half-open line span of the section: its heading up to the next heading of the same or a higher level
+    all_headings = headings(lines)
+    matches = [i for i, (_, _, heading) in enumerate(all_headings) if _normalize(heading) == _normalize(title)]
+    if not matches:
+        raise PatchError(f"Section not found: {title!r}")
+    if len(matches) > 1:
+        raise PatchError(f"Section heading is not unique: {title!r}")
+    start, level, _ = all_headings[matches[0]]
+    end = next((index for index, other_level, _ in all_headings[matches[0] + 1:] if other_level <= level), len(lines))
+    return start, end
+
+def _line_number(edit, name, lines, lowest=1):
+    value = edit.get(name)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise PatchError(f"{name} must be a line number")
+    if not lowest <= value <= len(lines):
+        raise PatchError(f"{name} {value} is outside the document (lines 1-{len(lines)})")
+    return value
+
+def _edit_span(edit, lines):
+    # The half-open span of original lines an edit replaces; inserts have an empty span
+    operation = edit.get("operation")
+    if operation not in OPERATIONS:
+        raise PatchError(f"Unknown operation: {operation!r}")
+    if edit.get("section"):
+        start, end = _section_span(lines, edit["section"])
+        if operation == "replace":
+            # The heading stays, its content is replaced
+            return start + 1, end
+        if operation == "insert":
+            return end, end
+        return start, end
+    if operation == "insert":
+        after = _line_number(edit, "afterLine", lines, lowest=0)
+        return after, after
+    start = _line_number(edit, "startLine", lines)
+    end = _line_number(edit, "endLine", lines) if edit.get("endLine") is not None else start
+    if end < start:
+        raise PatchError(f"endLine {end} is before startLine {start}")
+    return start - 1, end
+
+def apply_edits(document, edits):
+    """
+    Validates edits against document and returns the merged document. Each edit is a dict with an
+    operation (replace, insert, delete), either a section heading or line numbers (startLine/endLine,
+    afterLine for inserts) and the new text. Raises PatchError if any edit is invalid.
+    """
+    if not isinstance(edits, list):
+        raise PatchError("edits must be a list")
+    lines = document.split("\n")
+    spans = []
+    for position, edit in enumerate(edits):
+        if not isinstance(edit, dict):
+            raise PatchError(f"Edit {position + 1} is not an object")
+        try:
+            start, end = _edit_span(edit, lines)
+        except PatchError as e:
+            raise PatchError(f"Edit {position + 1}: {e}") from None
+        if edit["operation"] != "delete" and not isinstance(edit.get("text"), str):
+            raise PatchError(f"Edit {position + 1}: text is required for {edit['operation']}")
+        spans.append((start, end, position))
+
+    spans.sort()
+    covered_end, covering = 0, None
+    for start, end, position in spans:
+        # Inserts at the boundary of another edit are fine, anything inside it is ambiguous
+        if start < covered_end:
+            raise PatchError(f"Edits {covering + 1} and {position + 1} overlap")
+        if end > covered_end:
+            covered_end, covering = end, position
+
+    # From the bottom up, so the line numbers of the remaining edits stay valid
+    for start, end, position in reversed(spans):
+        edit = edits[position]
+        new_lines = [] if edit["operation"] == "delete" else edit["text"].split("\n")
+        lines[start:end] = new_lines
+    return "\n".join(lines)
+
+def numbered_document(document):
+    """The document with a line number in front of every line, as shown to the model in patch mode."""
+    lines = document.split("\n")
+    width = len(str(len(lines)))
+    return "\n".join(f"{number:>{width}}| {line}" for number, line in enumerate(lines, start=1))
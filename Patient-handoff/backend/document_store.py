@@ -0,0 +1,282 @@
+import os
+import json
+import sqlite3
+import threading
+import contextlib
+from datetime import date
+
+# --- Document and record store ---
+# Handoff documents and patient records live on the server, so requests can refer to them by ID
+# instead of posting their content. Every save creates a new version; earlier versions stay
+# readable, and a version number identifies one exact content (e.g. for caching derived artifacts).
+# Fields use the names of the frontend types (HandoffDocument, PatientRecord) plus patientId and version.
+
+HANDOFF_DB_PATH = os.getenv("HANDOFF_DB_PATH", "handoff.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    patient_id INTEGER NOT NULL,
+    visit_id TEXT,
+    created_at TEXT NOT NULL,
+    created_by TEXT,
+    current_version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_patient ON documents (patient_id);
+CREATE TABLE IF NOT EXISTS document_versions (
+    document_id INTEGER NOT NULL REFERENCES documents (id),
+    version INTEGER NOT NULL,
+    document_type TEXT NOT NULL,
+    format TEXT,
+    content TEXT NOT NULL,
+    slides TEXT,
+    audio_summary_base64 TEXT,
+    modified_at TEXT NOT NULL,
+    PRIMARY KEY (document_id, version)
+);
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    patient_id INTEGER NOT NULL,
+    current_version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_patient ON records (patient_id);
+CREATE TABLE IF NOT EXISTS record_versions (
+    record_id INTEGER NOT NULL REFERENCES records (id),
+    version INTEGER NOT NULL,
+    citation_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    timestamp TEXT,
+    content TEXT NOT NULL,
+    PRIMARY KEY (record_id, version)
+);
+"""
+
+# Document fields that are versioned, and the columns holding them
+_VERSION_FIELDS = {
+    "documentType": "document_type",
+    "format": "format",
+    "content": "content",
+    "slides": "slides",
+    "audioSummaryBase64": "audio_summary_base64",
+}
+_RECORD_FIELDS = {"citationId": "citation_id", "type": "type", "timestamp": "timestamp", "content": "content"}
+
+
+class DocumentNotFound(LookupError):
+    """No document (or no such version of it) with the requested ID."""
+
+
+class VersionConflict(Exception):
+    """A save based on a version that is no longer the current one."""
+    def __init__(self, document_id, current_version):
+        super().__init__(f"Document {document_id} is at version {current_version}")
+        self.current_version = current_version
+
+
+class DocumentStore:
+    """SQLite-backed store of versioned handoff documents and patient records. Thread safe."""
+
+    def __init__(self, path=HANDOFF_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        # One connection per thread; autocommit, transactions are explicit in _write
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self._local.connection = connection
+        return connection
+
+    @contextlib.contextmanager
+    def _write(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so read-then-write sequences cannot interleave
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    # --- Documents ---
+
+    @staticmethod
+    def _document(row, include_audio=True):
+        document = {
+            "id": row["id"],
+            "patientId": row["patient_id"],
+            "version": row["version"],
+            "documentType": row["document_type"],
+            "visitId": row["visit_id"],
+            "createdAt": row["created_at"],
+            "modifiedAt": row["modified_at"],
+            "createdBy": row["created_by"],
+            "content": row["content"],
+        }
+        if row["format"]:
+            document["format"] = row["format"]
+        if row["slides"]:
+            document["slides"] = json.loads(row["slides"])
+        if include_audio and row["audio_summary_base64"]:
+            document["audioSummaryBase64"] = row["audio_summary_base64"]
+        return document
+
+    def get_document(self, document_id, version=None):
+        """The current (or the given) version of a document. Raises DocumentNotFound."""
+        row = self._connection().execute(
+            "SELECT * FROM documents d JOIN document_versions v ON v.document_id = d.id "
+            "WHERE d.id = ? AND v.version = COALESCE(?, d.current_version)",
+            (document_id, version),
+        ).fetchone()
+        if row is None:
+            raise DocumentNotFound(f"Document {document_id}" + (f" version {version}" if version else "") + " not found")
+        return self._document(row)
+
+    def list_documents(self, patient_id):
+        """Current versions of a patient's documents, without their audio."""
+        rows = self._connection().execute(
+            "SELECT * FROM documents d JOIN document_versions v ON v.document_id = d.id AND v.version = d.current_version "
+            "WHERE d.patient_id = ? ORDER BY d.id",
+            (patient_id,),
+        ).fetchall()
+        return [self._document(row, include_audio=False) for row in rows]
+
+    def document_versions(self, document_id):
+        """Version numbers and modification dates of a document, oldest first."""
+        rows = self._connection().execute(
+            "SELECT version, modified_at FROM document_versions WHERE document_id = ? ORDER BY version",
+            (document_id,),
+        ).fetchall()
+        if not rows:
+            raise DocumentNotFound(f"Document {document_id} not found")
+        return [{"version": row["version"], "modifiedAt": row["modified_at"]} for row in rows]
+
+    @staticmethod
+    def _version_values(fields):
+        values = {column: fields.get(name) for name, column in _VERSION_FIELDS.items()}
+        values["content"] = values["content"] or ""
+        if values["slides"] is not None:
+            values["slides"] = json.dumps(values["slides"], ensure_ascii=False)
+        return values
+
+    def _insert_version(self, connection, document_id, version, fields):
+        values = self._version_values(fields)
+        connection.execute(
+            "INSERT INTO document_versions (document_id, version, document_type, format, content, slides, "
+            "audio_summary_base64, modified_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (document_id, version, values["document_type"], values["format"], values["content"], values["slides"],
+             values["audio_summary_base64"], fields.get("modifiedAt") or date.today().isoformat()),
+        )
+
+    def _insert_document(self, connection, patient_id, fields, document_id=None):
+        # Without document_id, SQLite assigns the next free one
+        cursor = connection.execute(
+            "INSERT INTO documents (id, patient_id, visit_id, created_at, created_by, current_version) "
+            "VALUES (?, ?, ?, ?, ?, 1)",
+            (document_id, patient_id, fields.get("visitId"), fields.get("createdAt") or date.today().isoformat(),
+             fields.get("createdBy")),
+        )
+        self._insert_version(connection, cursor.lastrowid, 1, fields)
+        return cursor.lastrowid
+
+    def create_document(self, patient_id, fields):
+        """Stores a new document as version 1 and returns it. The store assigns its ID; an id in fields is ignored."""
+        with self._write() as connection:
+            document_id = self._insert_document(connection, patient_id, fields)
+        return self.get_document(document_id)
+
+    def save_document(self, document_id, fields, base_version=None):
+        """
+        Stores fields as the next version of a document and returns it. Versioned fields missing
+        from fields keep their current value. With base_version, raises VersionConflict unless that
+        is still the current version.
+        """
+        with self._write() as connection:
+            row = connection.execute("SELECT current_version FROM documents WHERE id = ?", (document_id,)).fetchone()
+            if row is None:
+                raise DocumentNotFound(f"Document {document_id} not found")
+            current_version = row["current_version"]
+            if base_version is not None and base_version != current_version:
+                raise VersionConflict(document_id, current_version)
+            current = self._document(connection.execute(
+                "SELECT * FROM documents d JOIN document_versions v ON v.document_id = d.id "
+                "WHERE d.id = ? AND v.version = d.current_version", (document_id,)).fetchone())
+            merged = {name: fields[name] if name in fields else current.get(name) for name in _VERSION_FIELDS}
+            self._insert_version(connection, document_id, current_version + 1, merged)
+            connection.execute("UPDATE documents SET current_version = ? WHERE id = ?", (current_version + 1, document_id))
+        return self.get_document(document_id)
+
+    # --- Records ---
+
+    def list_records(self, patient_id):
+        """Current versions of a patient's records, ordered by citation ID."""
+        rows = self._connection().execute(
+            "SELECT * FROM records r JOIN record_versions v ON v.record_id = r.id AND v.version = r.current_version "
+            "WHERE r.patient_id = ? ORDER BY v.citation_id, r.id",
+            (patient_id,),
+        ).fetchall()
+        return [{"id": row["id"], "patientId": row["patient_id"], "version": row["version"],
+                 "citationId": row["citation_id"], "type": row["type"], "timestamp": row["timestamp"],
+                 "content": row["content"]} for row in rows]
+
+    def _put_record(self, connection, patient_id, record):
+        values = tuple(record.get(name) for name in _RECORD_FIELDS)
+        row = connection.execute(
+            "SELECT r.patient_id, r.current_version, v.citation_id, v.type, v.timestamp, v.content FROM records r "
+            "JOIN record_versions v ON v.record_id = r.id AND v.version = r.current_version WHERE r.id = ?",
+            (record.get("id"),),
+        ).fetchone() if record.get("id") is not None else None
+        if row is None:
+            cursor = connection.execute("INSERT INTO records (id, patient_id, current_version) VALUES (?, ?, 1)",
+                                        (record.get("id"), patient_id))
+            record_id, version = cursor.lastrowid, 1
+        elif row["patient_id"] != patient_id:
+            raise ValueError(f"Record {record['id']} belongs to another patient")
+        elif tuple(row[column] for column in _RECORD_FIELDS.values()) == values:
+            return  # unchanged, no new version
+        else:
+            record_id, version = record["id"], row["current_version"] + 1
+            connection.execute("UPDATE records SET current_version = ? WHERE id = ?", (version, record_id))
+        connection.execute(
+            "INSERT INTO record_versions (record_id, version, citation_id, type, timestamp, content) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (record_id, version, *values),
+        )
+
+    def put_records(self, patient_id, records):
+        """Adds or updates records of a patient; changed records get a new version. Returns the current records."""
+        with self._write() as connection:
+            for record in records:
+                self._put_record(connection, patient_id, record)
+        return self.list_records(patient_id)
+
+    def seed_patient(self, patient_id, documents, records):
+        """
+        Loads initial documents and records of a patient, keeping their IDs, unless the patient
+        already has any. Returns whether anything was loaded; safe to call repeatedly.
+        Raises ValueError, loading nothing, if an ID is already used by another patient.
+        """
+        try:
+            with self._write() as connection:
+                exists = connection.execute(
+                    "SELECT 1 FROM documents WHERE patient_id = ? UNION ALL SELECT 1 FROM records WHERE patient_id = ? LIMIT 1",
+                    (patient_id, patient_id),
+                ).fetchone()
+                if exists:
+                    return False
+                for document in documents:
+                    self._insert_document(connection, patient_id, document, document.get("id"))
+                for record in records:
+                    self._put_record(connection, patient_id, record)
+        except sqlite3.IntegrityError as e:
+            raise ValueError(f"Cannot seed patient {patient_id}: {e}") from e
+        return True
+
+
+store = DocumentStore()
@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+import functools
+
+import httpx
+from google import genai
+from google.genai import types, errors
+
+logger = logging.getLogger(__name__)
+
+# --- Shared Gemini generation layer ---
+# Every route goes through generate(): one client, generation configs built once per parameter
+# set, a concurrency limit per model, a request timeout and retries of transient errors.
+
+DEFAULT_MODEL = "gemini-3-flash-preview"
+SLIDES_MODEL = "gemini-3-pro-preview"
+TTS_MODEL = "gemini-1.5-flash-preview-0514-tts"
+
+# Calls in flight per model; GEMINI_MAX_CONCURRENCY_<MODEL> (e.g. GEMINI_MAX_CONCURRENCY_GEMINI_3_PRO_PREVIEW) overrides it per model
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+# Seconds for one call, and the longest wait for a free slot of the model
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "120"))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "60"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+MAX_BACKOFF_SECONDS = 30.0
+
+SAFETY_SETTINGS = [
+    types.SafetySetting(category=category, threshold="OFF")
+    for category in (
+        "HARM_CATEGORY_HATE_SPEECH",
+        "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "HARM_CATEGORY_HARASSMENT",
+    )
+]
+
+# JSON response schemas, referenced by name so configs using them can be cached
+RESPONSE_SCHEMAS = {
+    "chat_with_document": {
+        "type": "object",
+        "properties": {
+            "chatResponse": {
+                "type": "string",
+                "description": "The conversational response to the user's prompt."
+            },
+            "updatedDocument": {
+                "type": "string",
+                "description": "If the user requested a change, this field contains the FULL, updated document text. If the user is only asking a question, this field should not be present in the response.",
+            }
+        },
+        "required": ['chatResponse']
+    },
+    "chat_with_document_patch": {
+        "type": "object",
+        "properties": {
+            "chatResponse": {
+                "type": "string",
+                "description": "The conversational response to the user's prompt."
+            },
+            "edits": {
+                "type": "array",
+                "description": "The smallest set of edits that makes the requested change. Empty if the user is only asking a question.",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "operation": {"type": "string", "enum": ["replace", "insert", "delete"]},
+                        "section": {
+                            "type": "string",
+                            "description": "Heading text of the section to edit. Omit when using line numbers.",
+                        },
+                        "startLine": {"type": "integer"},
+                        "endLine": {"type": "integer"},
+                        "afterLine": {
+                            "type": "integer",
+                            "description": "For insert by line number: the new text goes after this line (0 for the top).",
+                        },
+                        "text": {
+                            "type": "string",
+                            "description": "The new text for replace and insert.",
+                        },
+                    },
+                    "required": ["operation"],
+                },
+            },
+        },
+        "required": ["chatResponse", "edits"]
+    },
+    "slides": {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "title": {"type": "string"},
+                "points": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                },
+            },
+            "required": ["title", "points"],
+        },
+    },
+}
+
+
+class GenerationError(Exception):
+    """A Gemini call that failed after all retries, or found no free slot of its model in time."""
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+
+# Initialize genai client for Vertex AI with global location
+_client = genai.Client(
+    vertexai=True,
+    project=os.getenv("GCP_PROJECT_ID"),
+    location='global'
+)
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+def _model_semaphore(model_name):
+    with _semaphores_lock:
+        if model_name not in _semaphores:
+            env_name = "GEMINI_MAX_CONCURRENCY_" + model_name.upper().replace("-", "_").replace(".", "_")
+            _semaphores[model_name] = threading.BoundedSemaphore(int(os.getenv(env_name, GEMINI_MAX_CONCURRENCY)))
+        return _semaphores[model_name]
+
+def generation_config(
+    temperature: float | None = 0.4,
+    max_output_tokens: int | None = 8192,
+    top_p: float | None = 1.0,
+    top_k: int | None = 32,
+    response_mime_type: str | None = None,
+    response_schema: str | None = None,
+) -> types.GenerateContentConfig:
+    """
+    The GenerateContentConfig for a parameter set, built once and reused by every request.
+    response_schema is a key of RESPONSE_SCHEMAS. Parameters left as None are not sent.
+    """
+    # Positional, so the same parameters always hit the same cache entry
+    return _build_config(temperature, max_output_tokens, top_p, top_k, response_mime_type, response_schema)
+
+@functools.lru_cache(maxsize=128)
+def _build_config(temperature, max_output_tokens, top_p, top_k, response_mime_type, response_schema):
+    params = {
+        "temperature": temperature,
+        "max_output_tokens": max_output_tokens,
+        "top_p": top_p,
+        "top_k": top_k,
+        "response_mime_type": response_mime_type,
+        "response_schema": RESPONSE_SCHEMAS[response_schema] if response_schema else None,
+    }
+    return types.GenerateContentConfig(
+        **{name: value for name, value in params.items() if value is not None},
+        safety_settings=SAFETY_SETTINGS,
+        # milliseconds
+        http_options=types.HttpOptions(timeout=int(GEMINI_TIMEOUT * 1000)),
+    )
+
+def _is_retryable(error):
+    if isinstance(error, errors.APIError):
+        return error.code in RETRY_STATUS_CODES
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+def _backoff(attempt):
+    # Full-jitter exponential backoff
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, 0.5 * (2 ** attempt)))
+
+def generate(contents, model_name=DEFAULT_MODEL, config=None):
+    """
+    Calls generate_content within the model's concurrency limit, retrying 429/5xx responses,
+    timeouts and connection errors. Returns the response; raises GenerationError.
+    """
+    config = config or generation_config()
+    semaphore = _model_semaphore(model_name)
+    attempt = 0
+    while True:
+        # The slot is released while backing off, so retries do not block other requests
+        if not semaphore.acquire(timeout=GEMINI_QUEUE_TIMEOUT):
+            raise GenerationError(f"Too many concurrent requests for {model_name}, try again later", status=503)
+        start = time.monotonic()
+        try:
+            response = _client.models.generate_content(model=model_name, contents=contents, config=config)
+            logger.info(f"{model_name} call took {time.monotonic() - start:.2f}s (attempt {attempt + 1})")
+            return response
+        except Exception as e:
+            error = e
+        finally:
+            semaphore.release()
+        if not _is_retryable(error) or attempt >= GEMINI_MAX_RETRIES:
+            raise GenerationError(f"{model_name} call failed: {error}") from error
+        delay = _backoff(attempt)
+        logger.warning(f"{model_name} call failed ({error}), retrying in {delay:.1f}s")
+        time.sleep(delay)
+        attempt += 1
+
+def generate_stream(contents, model_name=DEFAULT_MODEL, config=None):
+    """
+    Streaming variant of generate: yields text fragments as they arrive. Failures are retried
+    like in generate as long as nothing was yielded yet. The model's slot is held until the
+    stream ends or the consumer closes it.
+    """
+    config = config or generation_config()
+    semaphore = _model_semaphore(model_name)
+    attempt = 0
+    while True:
+        if not semaphore.acquire(timeout=GEMINI_QUEUE_TIMEOUT):
+            raise GenerationError(f"Too many concurrent requests for {model_name}, try again later", status=503)
+        start = time.monotonic()
+        yielded = False
+        try:
+            for response in _client.models.generate_content_stream(model=model_name, contents=contents, config=config):
+                text = response.text
+                if text:
+                    if not yielded:
+                        logger.info(f"{model_name} stream started after {time.monotonic() - start:.2f}s")
+                    yielded = True
+                    yield text
+            logger.info(f"{model_name} stream took {time.monotonic() - start:.2f}s (attempt {attempt + 1})")
+            return
+        except Exception as e:
+            if yielded:
+                raise GenerationError(f"{model_name} stream failed: {e}") from e
+            error = e
+        finally:
+            semaphore.release()
+        if not _is_retryable(error) or attempt >= GEMINI_MAX_RETRIES:
+            raise GenerationError(f"{model_name} call failed: {error}") from error
+        delay = _backoff(attempt)
+        logger.warning(f"{model_name} call failed ({error}), retrying in {delay:.1f}s")
+        time.sleep(delay)
+        attempt += 1
+
+def response_text(response):
+    """The text of the first candidate."""
+    return response.candidates[0].content.parts[0].text
+
+def generate_text(prompt_text, model_name=DEFAULT_MODEL, **params):
+    """Generates text for a prompt; params are those of generation_config."""
+    return response_text(generate(types.Part.from_text(text=prompt_text), model_name, generation_config(**params)))
+
+def generate_json(prompt_text, response_schema, model_name=DEFAULT_MODEL, **params):
+    """Generates JSON matching RESPONSE_SCHEMAS[response_schema] and returns it parsed."""
+    config = generation_config(response_mime_type="application/json", response_schema=response_schema, **params)
+    return json.loads(response_text(generate(types.Part.from_text(text=prompt_text), model_name, config)))
+
+def generate_text_stream(prompt_text, model_name=DEFAULT_MODEL, **params):
+    """Streaming variant of generate_text: yields text fragments."""
+    return generate_stream(types.Part.from_text(text=prompt_text), model_name, generation_config(**params))
+
+def generate_json_stream(prompt_text, response_schema, model_name=DEFAULT_MODEL, **params):
+    """Streaming variant of generate_json: yields fragments of the JSON text, see json_stream."""
+    config = generation_config(response_mime_type="application/json", response_schema=response_schema, **params)
+    return generate_stream(types.Part.from_text(text=prompt_text), model_name, config)
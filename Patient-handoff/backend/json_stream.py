@@ -0,0 +1,146 @@
+import json
+
+# --- Incremental JSON parsing of streamed model output ---
+# A JSON-schema response streams in as arbitrary text fragments. JsonObjectStreamParser reads the
+# top-level object as it arrives and reports the string values of its keys piece by piece, so a
+# route can forward "chatResponse" before "updatedDocument" has even started.
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class JsonObjectStreamParser:
+    """
+    Feed it fragments of a JSON object; feed() returns (key, text) pieces of its top-level string
+    values in order. Values that are not strings are skipped here and only appear in result().
+    """
+
+    def __init__(self):
+        self._text = []
+        self._state = "start"  # start, key, key_string, colon, value, string, other, comma, end
+        self._key = None
+        self._buffer = ""      # current key, or undecoded tail of a string value (escapes)
+        self._depth = 0        # nesting inside a non-string value
+        self._in_nested_string = False
+        self._nested_escape = False
+        self._pending_surrogate = ""
+
+    def feed(self, chunk):
+        self._text.append(chunk)
+        pieces = []
+        i = 0
+        while i < len(chunk):
+            c = chunk[i]
+            state = self._state
+            if state == "start":
+                if c == "{":
+                    self._state = "key"
+            elif state == "key":
+                if c == '"':
+                    self._state = "key_string"
+                    self._buffer = ""
+                elif c == "}":
+                    self._state = "end"
+            elif state == "key_string":
+                # Keys of the schemas are plain ASCII, no escape handling needed
+                if c == '"':
+                    self._key = self._buffer
+                    self._state = "colon"
+                else:
+                    self._buffer += c
+            elif state == "colon":
+                if c == ":":
+                    self._state = "value"
+            elif state == "value":
+                if c == '"':
+                    self._state = "string"
+                    self._buffer = ""
+                elif not c.isspace():
+                    self._state = "other"
+                    self._depth = 0
+                    continue  # let "other" see this character
+            elif state == "string":
+                # Take the whole run up to the next quote or backslash at once
+                end = i
+                while end < len(chunk) and chunk[end] not in '"\\' and not self._buffer:
+                    end += 1
+                if end > i:
+                    pieces.append((self._key, chunk[i:end]))
+                    i = end
+                    continue
+                self._buffer += c
+                decoded, done = self._decode_buffer()
+                if decoded:
+                    pieces.append((self._key, decoded))
+                if done:
+                    self._state = "comma"
+            elif state == "other":
+                if self._in_nested_string:
+                    if self._nested_escape:
+                        self._nested_escape = False
+                    elif c == "\\":
+                        self._nested_escape = True
+                    elif c == '"':
+                        self._in_nested_string = False
+                elif c == '"':
+                    self._in_nested_string = True
+                elif c in "[{":
+                    self._depth += 1
+                elif c in "]}" and self._depth > 0:
+                    self._depth -= 1
+                elif self._depth == 0 and c in ",}":
+                    self._state = "key" if c == "," else "end"
+            elif state == "comma":
+                if c == ",":
+                    self._state = "key"
+                elif c == "}":
+                    self._state = "end"
+            i += 1
+        return self._merge(pieces)
+
+    def _decode_buffer(self):
+        # self._buffer starts with a quote or backslash; returns (decoded text, string ended)
+        buffer = self._buffer
+        if buffer == '"':
+            self._buffer = ""
+            return self._flush_surrogate(), True
+        if len(buffer) < 2:
+            return "", False
+        if buffer[1] != "u":
+            self._buffer = ""
+            return self._flush_surrogate() + _ESCAPES.get(buffer[1], buffer[1]), False
+        if len(buffer) < 6:
+            return "", False
+        self._buffer = ""
+        code = int(buffer[2:6], 16)
+        if 0xD800 <= code < 0xDC00:
+            # High surrogate: wait for its low half
+            self._pending_surrogate = chr(code)
+            return "", False
+        if 0xDC00 <= code < 0xE000 and self._pending_surrogate:
+            pair = (self._pending_surrogate + chr(code)).encode("utf-16", "surrogatepass").decode("utf-16")
+            self._pending_surrogate = ""
+            return pair, False
+        return self._flush_surrogate() + chr(code), False
+
+    def _flush_surrogate(self):
+        text, self._pending_surrogate = self._pending_surrogate, ""
+        return text
+
+    @staticmethod
+    def _merge(pieces):
+        # Adjacent pieces of the same key become one
+        merged = []
+        for key, text in pieces:
+            if merged and merged[-1][0] == key:
+                merged[-1] = (key, merged[-1][1] + text)
+            else:
+                merged.append((key, text))
+        return merged
+
+    @property
+    def complete(self):
+        return self._state == "end"
+
+    def result(self):
+        """The whole object, parsed from everything fed so far. Raises ValueError if it is not valid JSON."""
+        return json.loads("".join(self._text))
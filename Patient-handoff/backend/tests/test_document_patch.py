@@ -0,0 +1,99 @@
+import pytest
+
+from document_patch import PatchError, apply_edits, headings, numbered_document
+
+DOCUMENT = """# Handoff
+## Situation
+Fever since yesterday.
+## Background
+Hypertension.
+On amlodipine.
+**ASSESSMENT:**
+Stable."""
+
+
+def test_replace_section_keeps_heading():
+    result = apply_edits(DOCUMENT, [{"operation": "replace", "section": "situation", "text": "Afebrile."}])
+    assert result.split("\n")[1:4] == ["## Situation", "Afebrile.", "## Background"]
+
+
+def test_bold_headings_are_subsections():
+    # A section runs up to the next heading of the same or a higher level, bold lines included
+    result = apply_edits(DOCUMENT, [{"operation": "replace", "section": "Background", "text": "Diabetes."}])
+    assert result.split("\n")[3:] == ["## Background", "Diabetes."]
+    result = apply_edits(DOCUMENT, [{"operation": "replace", "section": "ASSESSMENT", "text": "Improving."}])
+    assert result.split("\n")[-2:] == ["**ASSESSMENT:**", "Improving."]
+
+
+def test_insert_and_delete_sections():
+    result = apply_edits(DOCUMENT, [
+        {"operation": "insert", "section": "Situation", "text": "SpO2 95%."},
+        {"operation": "delete", "section": "Assessment"},
+    ])
+    assert result == "# Handoff\n## Situation\nFever since yesterday.\nSpO2 95%.\n## Background\nHypertension.\nOn amlodipine."
+
+
+def test_line_edits_refer_to_the_original_numbering():
+    result = apply_edits(DOCUMENT, [
+        {"operation": "replace", "startLine": 3, "text": "Fever of 38.5 since yesterday."},
+        {"operation": "insert", "afterLine": 0, "text": "DRAFT"},
+        {"operation": "delete", "startLine": 5, "endLine": 6},
+    ])
+    assert result.split("\n") == ["DRAFT", "# Handoff", "## Situation", "Fever of 38.5 since yesterday.",
+                                  "## Background", "**ASSESSMENT:**", "Stable."]
+
+
+def test_inserts_at_the_boundary_of_a_replace_are_allowed():
+    result = apply_edits(DOCUMENT, [
+        {"operation": "replace", "startLine": 5, "endLine": 6, "text": "None."},
+        {"operation": "insert", "afterLine": 6, "text": "Allergies: none."},
+    ])
+    assert "None.\nAllergies: none.\n**ASSESSMENT:**" in result
+
+
+@pytest.mark.parametrize("edit, message", [
+    ({"operation": "replace", "startLine": 0, "text": "x"}, "outside the document"),
+    ({"operation": "replace", "startLine": 9, "text": "x"}, "outside the document"),
+    ({"operation": "delete", "startLine": 3, "endLine": 99}, "outside the document"),
+    ({"operation": "insert", "afterLine": 9, "text": "x"}, "outside the document"),
+    ({"operation": "delete", "startLine": 5, "endLine": 4}, "before startLine"),
+    ({"operation": "replace", "startLine": "3", "text": "x"}, "must be a line number"),
+    ({"operation": "replace", "section": "Recommendation", "text": "x"}, "Section not found"),
+    ({"operation": "rewrite", "startLine": 3, "text": "x"}, "Unknown operation"),
+    ({"operation": "replace", "startLine": 3}, "text is required"),
+])
+def test_invalid_edits(edit, message):
+    with pytest.raises(PatchError, match=message):
+        apply_edits(DOCUMENT, [edit])
+
+
+@pytest.mark.parametrize("edits", [
+    [{"operation": "replace", "startLine": 3, "endLine": 5, "text": "x"},
+     {"operation": "delete", "startLine": 5}],
+    [{"operation": "delete", "section": "Background"},
+     {"operation": "replace", "startLine": 6, "text": "x"}],
+    # A long edit covers both of the later ones, which do not overlap each other
+    [{"operation": "delete", "startLine": 2, "endLine": 8},
+     {"operation": "replace", "startLine": 3, "text": "x"},
+     {"operation": "replace", "startLine": 6, "text": "y"}],
+    [{"operation": "replace", "startLine": 2, "endLine": 6, "text": "x"},
+     {"operation": "insert", "afterLine": 4, "text": "y"}],
+])
+def test_overlapping_edits(edits):
+    with pytest.raises(PatchError, match="overlap"):
+        apply_edits(DOCUMENT, edits)
+
+
+def test_invalid_edit_leaves_nothing_applied():
+    with pytest.raises(PatchError, match="Edit 2"):
+        apply_edits(DOCUMENT, [{"operation": "delete", "startLine": 3}, {"operation": "delete", "startLine": 42}])
+
+
+def test_duplicate_section_heading():
+    with pytest.raises(PatchError, match="not unique"):
+        apply_edits(DOCUMENT + "\n## Background\nAgain.", [{"operation": "delete", "section": "Background"}])
+
+
+def test_headings_and_numbering():
+    assert [(index, level) for index, level, _ in headings(DOCUMENT.split("\n"))] == [(0, 1), (1, 2), (3, 2), (6, 7)]
+    assert numbered_document("a\nb").split("\n") == ["1| a", "2| b"]
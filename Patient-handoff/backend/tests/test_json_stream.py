@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from json_stream import JsonObjectStreamParser
+
+OBJECT = {
+    "chatResponse": "了解しました。\n\"SBAR\"形式に更新します \\ 😀 é",
+    "edits": [{"operation": "replace", "section": "Situation: {a}, [b]", "text": "x\"}"}],
+    "count": 2,
+    "updatedDocument": "**SITUATION:**\t発熱 😀",
+}
+ENCODED = json.dumps(OBJECT)  # ensure_ascii: non-ASCII text arrives as \uXXXX escapes
+
+
+def feed_all(chunks):
+    parser = JsonObjectStreamParser()
+    texts = {}
+    order = []
+    for chunk in chunks:
+        for key, text in parser.feed(chunk):
+            texts[key] = texts.get(key, "") + text
+            if not order or order[-1] != key:
+                order.append(key)
+    return parser, texts, order
+
+
+def assert_string_values(texts, order):
+    assert texts == {"chatResponse": OBJECT["chatResponse"], "updatedDocument": OBJECT["updatedDocument"]}
+    assert order == ["chatResponse", "updatedDocument"]
+
+
+def test_whole_object():
+    parser, texts, order = feed_all([ENCODED])
+    assert_string_values(texts, order)
+    assert parser.complete
+    assert parser.result() == OBJECT
+
+
+def test_one_character_at_a_time():
+    parser, texts, order = feed_all(list(ENCODED))
+    assert_string_values(texts, order)
+    assert parser.complete
+
+
+@pytest.mark.parametrize("escape", ["\\u00e9", "\\ud83d\\ude00", '\\"', "\\n"])
+def test_split_at_every_position_of_an_escape(escape):
+    start = ENCODED.index(escape)
+    for split in range(start, start + len(escape) + 1):
+        _, texts, order = feed_all([ENCODED[:split], ENCODED[split:]])
+        assert_string_values(texts, order)
+
+
+def test_unescaped_non_ascii():
+    encoded = json.dumps(OBJECT, ensure_ascii=False)
+    _, texts, order = feed_all([encoded[i:i + 3] for i in range(0, len(encoded), 3)])
+    assert_string_values(texts, order)
+
+
+def test_incomplete_object():
+    parser, texts, _ = feed_all([ENCODED[:40]])
+    assert not parser.complete
+    assert OBJECT["chatResponse"].startswith(texts["chatResponse"])
+    with pytest.raises(ValueError):
+        parser.result()
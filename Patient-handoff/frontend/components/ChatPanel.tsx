@@ -1,6 +1,6 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { PatientRecord, ChatMessage } from '../types';
-import { chatWithDocument } from '../services/geminiService';
+import { chatWithDocument, StoredDocumentRef } from '../services/geminiService';
 import { GeminiIcon, SendIcon, ChevronLeftIcon, ChevronRightIcon } from './icons';
 import { useToast } from '../context/AppContext';
 
@@ -8,11 +8,12 @@ interface ChatPanelProps {
     documentContent: string;
     setDocumentContent: (content: string) => void;
     patientRecords: PatientRecord[];
+    storedDocument: StoredDocumentRef | null;
     isCollapsed: boolean;
     onToggle: () => void;
 }
 
-const ChatPanel: React.FC<ChatPanelProps> = ({ documentContent, setDocumentContent, patientRecords, isCollapsed, onToggle }) => {
+const ChatPanel: React.FC<ChatPanelProps> = ({ documentContent, setDocumentContent, patientRecords, storedDocument, isCollapsed, onToggle }) => {
     const [messages, setMessages] = useState<ChatMessage[]>([
         { sender: 'ai', text: "私はあなたのGeminiアシスタントです。ドキュメントに関する質問や編集指示をお寄せください。" }
     ]);
@@ -35,10 +36,24 @@ const ChatPanel: React.FC<ChatPanelProps> = ({ documentContent, setDocumentConte
         setUserInput('');
         setIsLoading(true);
 
+        // The AI message is added with the first streamed text and grows as more arrives
+        let streamingIndex = -1;
+        const showResponse = (text: string) => {
+            const aiResponseMessage: ChatMessage = { sender: 'ai', text };
+            setMessages(prev => {
+                if (streamingIndex < 0) {
+                    streamingIndex = prev.length;
+                    return [...prev, aiResponseMessage];
+                }
+                const updated = [...prev];
+                updated[streamingIndex] = aiResponseMessage;
+                return updated;
+            });
+        };
+
         try {
-            const response = await chatWithDocument(documentContent, userInput, patientRecords);
-            const aiResponseMessage: ChatMessage = { sender: 'ai', text: response.chatResponse };
-            setMessages(prev => [...prev, aiResponseMessage]);
+            const response = await chatWithDocument(documentContent, userInput, patientRecords, showResponse, storedDocument);
+            showResponse(response.chatResponse);
 
             // Only update the document if a non-null value is explicitly returned.
             // This prevents the document from being cleared when just asking a question.
@@ -48,8 +63,7 @@ const ChatPanel: React.FC<ChatPanelProps> = ({ documentContent, setDocumentConte
         } catch (error: any) {
             console.error("Chat error:", error);
             addToast(error.message, 'error');
-            const errorMessage: ChatMessage = { sender: 'ai', text: "Sorry, I encountered an error. Please try again." };
-            setMessages(prev => [...prev, errorMessage]);
+            showResponse("Sorry, I encountered an error. Please try again.");
         } finally {
             setIsLoading(false);
         }
@@ -102,7 +116,7 @@ const ChatPanel: React.FC<ChatPanelProps> = ({ documentContent, setDocumentConte
                             </div>
                         </div>
                     ))}
-                    {isLoading && (
+                    {isLoading && messages[messages.length - 1].sender === 'user' && (
                         <div className="flex justify-start">
                             <div className="max-w-[80%] p-3 rounded-2xl bg-surface-container text-on-surface rounded-bl-none">
                                 <div className="flex items-center gap-2">
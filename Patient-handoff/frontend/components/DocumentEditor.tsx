@@ -1,7 +1,7 @@
 import React, { useState, useCallback, useMemo, useEffect, useRef } from 'react';
 import { Patient, PatientRecord, RecordType, DocumentType, HandoffDocument as HandoffDocumentType, HandoffFormat, Slide } from '../types';
 import { DOCUMENT_TYPE_TRANSLATIONS } from '../constants';
-import { generateDocument, saveDocument, generateAudioSummary, modifySelectedText, generateSlideDeck } from '../services/geminiService';
+import { generateDocument, saveDocument, generateAudioSummary, modifySelectedText, generateSlideDeck, StoredDocumentRef } from '../services/geminiService';
 import { BackIcon, GeminiIcon, BoldIcon, ItalicIcon, AudioIcon, TrashIcon, ChevronDownIcon, CheckIcon, PrintIcon, PresentationIcon, WarningIcon } from './icons';
 import ChatPanel from './ChatPanel';
 import PatientRecords from './PatientRecords';
@@ -297,11 +297,12 @@ const HandoffDocument: React.FC<{
     audioData: AudioData | null; setAudioData: (data: AudioData | null) => void;
     slideData: SlideData | null; setSlideData: (data: SlideData | null) => void;
     patientRecords: PatientRecord[];
+    storedDocument: StoredDocumentRef | null;
 }> = ({ 
     patient,
     content, setContent, isGenerating, isLoadingDoc, isNewDocument, 
     documentType, setDocumentType, onGenerate, onSave, saveState, canSave, onCitationClick,
-    audioData, setAudioData, slideData, setSlideData, patientRecords
+    audioData, setAudioData, slideData, setSlideData, patientRecords, storedDocument
 }) => {
     const editorRef = useRef<HTMLDivElement>(null);
     const audioUrlRef = useRef<string | null>(null);
@@ -371,7 +372,7 @@ const HandoffDocument: React.FC<{
         audioUrlRef.current = null;
         setAudioUrl(null);
         try {
-            const base64 = await generateAudioSummary(preprocessTextForSpeech(content));
+            const base64 = await generateAudioSummary(preprocessTextForSpeech(content), storedDocument);
             setAudioData({ base64, sourceContent: content });
         } catch (error: any) { 
             console.error("Failed to generate audio", error); 
@@ -384,7 +385,7 @@ const HandoffDocument: React.FC<{
         setIsGeneratingSlides(true);
         setSlideData(null);
         try {
-            const slides = await generateSlideDeck(content);
+            const slides = await generateSlideDeck(content, storedDocument);
             setSlideData({ slides, sourceContent: content, isNew: true });
         } catch (error: any) {
             console.error("Failed to generate slides", error);
@@ -720,6 +721,7 @@ const DocumentEditor: React.FC = () => {
     const [documentContent, setDocumentContent] = useState<string>('');
     const [originalContent, setOriginalContent] = useState<string>('');
     const [currentDocId, setCurrentDocId] = useState<number | null>(null);
+    const [currentVersion, setCurrentVersion] = useState<number | null>(null);
     const [isGenerating, setIsGenerating] = useState<boolean>(false);
     const [isRecordsCollapsed, setIsRecordsCollapsed] = useState<boolean>(false);
     const [isChatCollapsed, setIsChatCollapsed] = useState<boolean>(false);
@@ -747,12 +749,19 @@ const DocumentEditor: React.FC = () => {
         return contentChanged || audioChanged || slidesChanged;
     }, [originalContent, documentContent, originalAudioData, audioData, originalSlideData, slideData, isLoadingInitialDoc]);
 
+    // While the editor holds exactly the saved version, AI requests refer to it by ID instead of sending the text
+    const storedDocument = useMemo<StoredDocumentRef | null>(() => {
+        if (currentDocId === null || currentVersion === null || documentContent !== originalContent) return null;
+        return { id: currentDocId, version: currentVersion };
+    }, [currentDocId, currentVersion, documentContent, originalContent]);
+
     useEffect(() => {
         const doc = initialDocumentData;
         if (doc) {
             setDocumentContent(doc.content || '');
             setOriginalContent(doc.content || '');
             setCurrentDocId(doc.id);
+            setCurrentVersion(doc.version ?? null);
             setDocumentType(doc.documentType as DocumentType);
             
             const initialAudio = doc.audioSummaryBase64 ? { base64: doc.audioSummaryBase64, sourceContent: doc.content || '' } : null;
@@ -767,6 +776,7 @@ const DocumentEditor: React.FC = () => {
             setDocumentContent('');
             setOriginalContent('');
             setCurrentDocId(null);
+            setCurrentVersion(null);
             setDocumentType('');
             setAudioData(null);
             setOriginalAudioData(null);
@@ -813,6 +823,7 @@ const DocumentEditor: React.FC = () => {
             setDocumentContent(newDoc.content || '');
             // Do not set original content, so the new document starts in a "dirty" state
             setCurrentDocId(newDoc.id);
+            setCurrentVersion(newDoc.version ?? null);
         } catch (error: any) { 
             addToast(error.message || "Error: Could not generate summary.", 'error');
             setDocumentContent("Error: Could not generate summary.");
@@ -828,6 +839,7 @@ const DocumentEditor: React.FC = () => {
             const savedDoc = await saveDocument(currentDocId, documentContent, documentType as DocumentType, audioToSave, slidesToSave);
             
             setOriginalContent(savedDoc.content || '');
+            setCurrentVersion(savedDoc.version ?? null);
 
             const newOriginalAudio = savedDoc.audioSummaryBase64 ? { base64: savedDoc.audioSummaryBase64, sourceContent: savedDoc.content || '' } : null;
             setAudioData(newOriginalAudio);
@@ -900,10 +912,11 @@ const DocumentEditor: React.FC = () => {
                         audioData={audioData} setAudioData={setAudioData}
                         slideData={slideData} setSlideData={setSlideData}
                         patientRecords={patientRecords}
+                        storedDocument={storedDocument}
                     />
                 </div>
                 <div className="non-printable min-h-0">
-                    <ChatPanel documentContent={documentContent} setDocumentContent={setDocumentContent} patientRecords={patientRecords} isCollapsed={isChatCollapsed} onToggle={() => setIsChatCollapsed(!isChatCollapsed)}/>
+                    <ChatPanel documentContent={documentContent} setDocumentContent={setDocumentContent} patientRecords={patientRecords} storedDocument={storedDocument} isCollapsed={isChatCollapsed} onToggle={() => setIsChatCollapsed(!isChatCollapsed)}/>
                 </div>
             </div>
         </div>
@@ -3,13 +3,13 @@ import { MOCK_PATIENTS, MOCK_DOCUMENTS, MOCK_RECORDS } from '../constants';
 
 const BACKEND_URL = import.meta.env.VITE_BACKEND_URL || '/api';
 
-async function postApi(path: string, payload: any): Promise<any> {
+async function requestApi(method: string, path: string, payload?: any): Promise<any> {
     const response = await fetch(`${BACKEND_URL}${path}`, {
-        method: 'POST',
+        method,
         headers: {
             'Content-Type': 'application/json',
         },
-        body: JSON.stringify(payload),
+        body: payload === undefined ? undefined : JSON.stringify(payload),
     });
     if (!response.ok) {
         const errorData = await response.json();
@@ -18,9 +18,64 @@ async function postApi(path: string, payload: any): Promise<any> {
     return response.json();
 }
 
-// Make a mutable copy for in-session changes
-let documentsData: { [key: number]: HandoffDocument[] } = JSON.parse(JSON.stringify(MOCK_DOCUMENTS));
-let nextDocId = 100; // Start new doc IDs from 100 to avoid collision
+const postApi = (path: string, payload: any): Promise<any> => requestApi('POST', path, payload);
+const getApi = (path: string): Promise<any> => requestApi('GET', path);
+const putApi = (path: string, payload: any): Promise<any> => requestApi('PUT', path, payload);
+
+// Posts to a /stream endpoint and calls onEvent for each NDJSON line as it arrives.
+// Resolves with the final "done" event; an "error" event rejects.
+async function postApiStream(path: string, payload: any, onEvent: (event: any) => void): Promise<any> {
+    const response = await fetch(`${BACKEND_URL}${path}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(payload),
+    });
+    if (!response.ok || !response.body) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || `API request failed with status ${response.status}`);
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let done: any = null;
+    const handleLine = (line: string) => {
+        if (!line.trim()) return;
+        const event = JSON.parse(line);
+        if (event.type === 'error') throw new Error(event.error);
+        if (event.type === 'done') done = event;
+        onEvent(event);
+    };
+    while (true) {
+        const { value, done: finished } = await reader.read();
+        if (finished) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || '';
+        lines.forEach(handleLine);
+    }
+    handleLine(buffer + decoder.decode());
+    if (!done) throw new Error('The response stream ended unexpectedly');
+    return done;
+}
+
+// Documents and records live in the backend store. A patient's mock documents and records are
+// loaded into it on first access; the backend ignores this once the patient has data.
+const seededPatients: { [key: number]: Promise<any> } = {};
+
+const ensurePatientSeeded = (patientId: number): Promise<any> => {
+    if (!seededPatients[patientId]) {
+        seededPatients[patientId] = postApi(`/api/patients/${patientId}/seed`, {
+            documents: MOCK_DOCUMENTS[patientId] || [],
+            records: MOCK_RECORDS[patientId] || [],
+        }).catch(error => {
+            delete seededPatients[patientId];
+            throw error;
+        });
+    }
+    return seededPatients[patientId];
+};
 
 const simulateDelay = <T>(data: T, delay = 1500): Promise<T> => {
     return new Promise(resolve => {
@@ -35,68 +90,71 @@ export const getPatients = (): Promise<Patient[]> => {
     return simulateDelay(MOCK_PATIENTS, 0);
 };
 
-export const getPatientDocuments = (patientId: number): Promise<HandoffDocument[]> => {
-    const docs = documentsData[patientId] || [];
-    return simulateDelay(docs, 0);
+export const getPatientDocuments = async (patientId: number): Promise<HandoffDocument[]> => {
+    await ensurePatientSeeded(patientId);
+    return getApi(`/api/patients/${patientId}/documents`);
 };
 
-export const getPatientRecords = (patientId: number): Promise<PatientRecord[]> => {
-    const records = MOCK_RECORDS[patientId] || [];
-    return simulateDelay(records, 0);
+export const getPatientRecords = async (patientId: number): Promise<PatientRecord[]> => {
+    await ensurePatientSeeded(patientId);
+    return getApi(`/api/patients/${patientId}/records`);
 };
 
 export const getDocument = async (documentId: number): Promise<HandoffDocument> => {
-    for (const patientId in documentsData) {
-        const doc = documentsData[patientId].find(d => d.id === documentId);
-        if (doc) {
-            // If the document content is missing, generate it dynamically.
-            if (!doc.content) {
-                const patient = MOCK_PATIENTS.find(p => p.id === parseInt(patientId));
-                const records = MOCK_RECORDS[parseInt(patientId)];
-                if(patient && records) {
-                    // Defaulting to IPASS for loading existing docs, as format wasn't stored
-                    const handoffFormat = doc.format || 'ipass';
-                    if (!doc.format) {
-                        doc.format = 'ipass';
-                    }
-                    const recordsContext = records.map(r => `[${r.citationId}] ${r.type} (${r.timestamp}): ${r.content}`).join('\n');
-
-                    const prompt = `
-                        You are an AI assistant for healthcare professionals. Your task is to generate a patient handoff or discharge summary document.
-                        **Patient Information:**
-                        - Name: ${patient.name}, Age: ${patient.age}, Gender: ${patient.gender}, Status: ${patient.status}
-                        **Available Patient Records:**
-                        ---
-                        ${recordsContext}
-                        ---
-                        **Instructions:**
-                        1. Generate a "${doc.documentType}" document.
-                        2. The document format MUST be "${handoffFormat.toUpperCase()}".
-                        3. Use the provided patient records to create a concise and accurate summary.
-                        4. When you use information from a specific record, you MUST include its citation number in brackets, like [1], [5], etc.
-                        5. ONLY use citation numbers that are present in the "Available Patient Records" section. Do not invent citation numbers.
-                        6. Respond ONLY with the generated Markdown content for the document. Do not include any other text or explanations.
-                    `;
-                    try {
-                        const response = await postApi('/api/generate_text', { prompt: prompt });
-                        doc.content = response.generated_text.trim();
-                    } catch(e: any) {
-                        console.error("Error generating content for document:", e);
-                        doc.content = `Error: Could not generate summary for ${doc.documentType}. Details: ${e.message}`;
-                    }
-                } else {
-                    doc.content = `This is the full text for ${doc.documentType} for patient ID ${patientId}. It includes details about the patient's visit, treatment, and response. The document was originally created on ${doc.createdAt} by ${doc.createdBy}.`;
-                }
+    let doc: HandoffDocument;
+    try {
+        doc = await getApi(`/api/documents/${documentId}`);
+    } catch (e: any) {
+        throw new Error(`Document not found. Details: ${e.message}`);
+    }
+    const patientId = doc.patientId!;
+    // If the document content is missing, generate it dynamically.
+    if (!doc.content) {
+        const patient = MOCK_PATIENTS.find(p => p.id === patientId);
+        const records = await getPatientRecords(patientId);
+        if(patient && records.length) {
+            // Defaulting to IPASS for loading existing docs, as format wasn't stored
+            const handoffFormat = doc.format || 'ipass';
+            const recordsContext = records.map(r => `[${r.citationId}] ${r.type} (${r.timestamp}): ${r.content}`).join('\n');
+
+            const prompt = `
+                You are an AI assistant for healthcare professionals. Your task is to generate a patient handoff or discharge summary document.
+                **Patient Information:**
+                - Name: ${patient.name}, Age: ${patient.age}, Gender: ${patient.gender}, Status: ${patient.status}
+                **Available Patient Records:**
+                ---
+                ${recordsContext}
+                ---
+                **Instructions:**
+                1. Generate a "${doc.documentType}" document.
+                2. The document format MUST be "${handoffFormat.toUpperCase()}".
+                3. Use the provided patient records to create a concise and accurate summary.
+                4. When you use information from a specific record, you MUST include its citation number in brackets, like [1], [5], etc.
+                5. ONLY use citation numbers that are present in the "Available Patient Records" section. Do not invent citation numbers.
+                6. Respond ONLY with the generated Markdown content for the document. Do not include any other text or explanations.
+            `;
+            try {
+                const response = await postApi('/api/generate_text', { prompt: prompt });
+                // Stored as a new version, so the summary is generated only once
+                doc = await putApi(`/api/documents/${doc.id}`, {
+                    content: response.generated_text.trim(),
+                    format: handoffFormat,
+                    baseVersion: doc.version,
+                });
+            } catch(e: any) {
+                console.error("Error generating content for document:", e);
+                doc.content = `Error: Could not generate summary for ${doc.documentType}. Details: ${e.message}`;
             }
-            return doc;
+        } else {
+            doc.content = `This is the full text for ${doc.documentType} for patient ID ${patientId}. It includes details about the patient's visit, treatment, and response. The document was originally created on ${doc.createdAt} by ${doc.createdBy}.`;
         }
     }
-    throw new Error("Document not found");
+    return doc;
 };
 
 export const generateDocument = async (patientId: number, documentType: DocumentType, handoffFormat: HandoffFormat): Promise<HandoffDocument> => {
     const patient = MOCK_PATIENTS.find(p => p.id === patientId);
-    const records = MOCK_RECORDS[patientId] || [];
+    const records = await getPatientRecords(patientId);
 
     if (!patient) {
         throw new Error("Patient not found");
@@ -187,15 +245,16 @@ export const generateDocument = async (patientId: number, documentType: Document
     
     let summaryContent = '';
     try {
-        const response = await postApi('/api/generate_text', { prompt: prompt });
+        // Every new document gets a fresh draft, not the cached text of the last identical request
+        const response = await postApi('/api/generate_text', { prompt: prompt, refresh: true });
         summaryContent = response.generated_text.trim();
     } catch(e: any) {
         console.error("Error generating new document:", e);
         throw new Error(`Failed to generate the document content from the AI service. Details: ${e.message}`);
     }
 
-    const newDoc: HandoffDocument = {
-        id: nextDocId++,
+    // The backend assigns the ID and stores the document as version 1
+    return postApi(`/api/patients/${patientId}/documents`, {
         documentType: documentType,
         visitId: `V${Math.floor(10000 + Math.random() * 90000)}`,
         createdAt: new Date().toLocaleDateString(),
@@ -203,39 +262,25 @@ export const generateDocument = async (patientId: number, documentType: Document
         createdBy: '佐藤医師',
         content: summaryContent,
         format: documentType === DocumentType.DischargeSummaryDiagnosesPlan ? undefined : handoffFormat,
-    };
-
-    if (!documentsData[patientId]) {
-        documentsData[patientId] = [];
-    }
-    documentsData[patientId].push(newDoc);
-    return newDoc;
+    });
 };
 
 export const saveDocument = (documentId: number, updatedText: string, documentType: DocumentType, audioBase64: string | null, slides: Slide[] | null): Promise<HandoffDocument> => {
-    for (const patientId in documentsData) {
-        const docIndex = documentsData[patientId].findIndex(d => d.id === documentId);
-        if (docIndex > -1) {
-            // Create a new object to ensure immutability and prevent subtle bugs.
-            const updatedDoc: HandoffDocument = {
-                ...documentsData[patientId][docIndex],
-                content: updatedText,
-                documentType: documentType,
-                modifiedAt: new Date().toLocaleDateString(),
-                audioSummaryBase64: audioBase64 || undefined,
-                slides: slides || undefined,
-            };
-
-            // Replace the old document in the array with the updated one.
-            documentsData[patientId][docIndex] = updatedDoc;
-            
-            // No more artificial delay, but still simulate async operation and return a deep copy
-            return simulateDelay(updatedDoc, 0);
-        }
-    }
-    return Promise.reject(new Error("Document not found to save"));
+    // Every save is a new version of the document in the backend store
+    return putApi(`/api/documents/${documentId}`, {
+        content: updatedText,
+        documentType: documentType,
+        audioSummaryBase64: audioBase64,
+        slides: slides,
+    });
 };
 
+// A saved document version; requests about unchanged content send this instead of the content
+export interface StoredDocumentRef {
+    id: number;
+    version: number;
+}
+
 export interface ChatResponse {
     chatResponse: string;
     updatedDocument: string | null;
@@ -244,13 +289,26 @@ export interface ChatResponse {
 export const chatWithDocument = async (
     documentContent: string, 
     userPrompt: string, 
-    records: PatientRecord[]
+    records: PatientRecord[],
+    onChatResponse?: (partialResponse: string) => void,
+    storedDocument?: StoredDocumentRef | null
 ): Promise<ChatResponse> => {
     try {
-        const response = await postApi('/api/chat_with_document', {
-            documentContent,
+        // Streams the answer; onChatResponse receives the chat response text received so far.
+        // In patch mode the model only returns the edits, the server sends back the merged document.
+        let partialResponse = '';
+        const documentPayload = storedDocument
+            ? { documentId: storedDocument.id, documentVersion: storedDocument.version }
+            : { documentContent, records };
+        const response = await postApiStream('/api/chat_with_document/stream', {
+            ...documentPayload,
             userPrompt,
-            records,
+            mode: 'patch',
+        }, (event) => {
+            if (event.type === 'delta' && event.field === 'chatResponse' && onChatResponse) {
+                partialResponse += event.text;
+                onChatResponse(partialResponse);
+            }
         });
         return {
             chatResponse: response.chatResponse || "I'm sorry, I couldn't generate a valid response.",
@@ -282,9 +340,10 @@ export const modifySelectedText = async (
 /**
  * Generates audio from text content using the Gemini API.
  * @param documentContent The text to convert to speech.
+ * @param storedDocument The saved version the text was made from, if any; the backend drops its cached audio once a newer version is saved.
  * @returns A promise that resolves with a base64 encoded audio string.
  */
-export const generateAudioSummary = async (documentContent: string): Promise<string> => {
+export const generateAudioSummary = async (documentContent: string, storedDocument?: StoredDocumentRef | null): Promise<string> => {
     console.log("Generating audio for:", documentContent.substring(0, 100) + "...");
     
     if (!documentContent) {
@@ -292,7 +351,10 @@ export const generateAudioSummary = async (documentContent: string): Promise<str
     }
 
     try {
-        const response = await postApi('/api/generate_audio', { text: documentContent });
+        const response = await postApi('/api/generate_audio', {
+            text: documentContent,
+            ...(storedDocument ? { documentId: storedDocument.id, documentVersion: storedDocument.version } : {}),
+        });
         const base64Audio = response.audio_content;
         if (!base64Audio) {
             throw new Error("No audio data received from the API.");
@@ -307,15 +369,18 @@ export const generateAudioSummary = async (documentContent: string): Promise<str
 /**
  * Generates a slide deck from document content using the Gemini API.
  * @param documentContent The text to convert into slides.
+ * @param storedDocument The saved version holding exactly this content, if any; sent instead of the text.
  * @returns A promise that resolves with an array of Slide objects.
  */
-export const generateSlideDeck = async (documentContent: string): Promise<Slide[]> => {
+export const generateSlideDeck = async (documentContent: string, storedDocument?: StoredDocumentRef | null): Promise<Slide[]> => {
     if (!documentContent) {
         throw new Error("Cannot generate slides from empty content.");
     }
 
     try {
-        const slideData = await postApi('/api/generate_slides', { documentContent });
+        const slideData = await postApi('/api/generate_slides', storedDocument
+            ? { documentId: storedDocument.id, documentVersion: storedDocument.version }
+            : { documentContent });
         
         // Basic validation
         if (Array.isArray(slideData) && slideData.every(s => 'title' in s && Array.isArray(s.points))) {
@@ -16,6 +16,8 @@ export interface Patient {
 
 export interface HandoffDocument {
   id: number;
+  patientId?: number;
+  version?: number;
   documentType: string;
   visitId: string;
   createdAt: string;